@@ -0,0 +1,239 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Synthetic data of the Inthegra API, sized like the Teresina's
+network (see `TERESINA`) or scaled up.
+
+The stops are spread around the city center and each route
+runs along a corridor between two points, with the stops close
+to it, so routes share stops and the trips may need transfers.
+The data is generated from a seed, so every run has the same.
+
+>>> data = generate(scale=2)
+>>> len(data.routes), len(data.stops)
+(600, 4000)
+"""
+
+import math
+import random
+
+# About the size of the network of Teresina.
+TERESINA = {
+    'routes': 300,
+    'stops': 2000,
+    'buses': 450,
+}
+
+# The city center and the radius of the area of the stops, in degrees.
+CENTER = (-5.0892, -42.8019)
+RADIUS = 0.08
+
+# Width of the corridor of a route, in degrees.
+CORRIDOR = 0.002
+
+# Max step of a bus between two fleet requests, in degrees.
+STEP = 0.001
+
+NEIGHBORHOODS = (
+    'CENTRO', 'DIRCEU', 'ITARARE', 'MOCAMBINHO', 'ANGELIM', 'SACI',
+    'UNIVERSIDADE', 'PORTO ALEGRE', 'BELA VISTA', 'PICARRA', 'FATIMA',
+    'JOCKEY', 'BUENOS AIRES', 'PROMORAR', 'SANTA MARIA', 'PARQUE PIAUI',
+    'LOURIVAL PARENTE', 'AEROPORTO', 'SHOPPING', 'POTY VELHO',
+)
+
+
+def coordinate(value):
+    """
+    Formats a coordinate as the API (e.g.: '-5.04693500').
+    """
+
+    return '{0:.8f}'.format(value)
+
+
+class Fixtures(object):
+    """
+    The objects returned by the endpoints, as the API does.
+
+    @attribute routes: A list of the objects of `linhas`.
+    @attribute stops: A list of the objects of `paradas`.
+    @attribute route_stops: A `dict` of the stops of each route,
+        by route code.
+    @attribute buses: A `dict` of the buses of each route, by
+        route code.
+    """
+
+    def __init__(self, routes, stops, route_stops, buses, seed=0):
+        self.routes = routes
+        self.stops = stops
+        self.route_stops = route_stops
+        self.buses = buses
+        self.__random__ = random.Random(seed)
+        self.__routes__ = dict((r['CodigoLinha'], r) for r in routes)
+
+    def route(self, code):
+        """
+        Returns the route object of `code`, or `None`.
+        """
+
+        return self.__routes__.get(code)
+
+    def search(self, objs, pattern, fields):
+        """
+        Returns the objects of `objs` with `pattern` at any of
+        `fields`, as the `busca` param does.
+        """
+
+        pattern = pattern.upper()
+        return [
+            obj for obj in objs
+            if any(pattern in u'{0}'.format(obj[f]).upper() for f in fields)
+        ]
+
+    def move(self):
+        """
+        Moves every bus a small step, as between two requests.
+        """
+
+        step = self.__random__.uniform
+        for buses in self.buses.values():
+            for bus in buses:
+                bus['Lat'] = coordinate(float(bus['Lat']) + step(-STEP, STEP))
+                bus['Long'] = coordinate(
+                    float(bus['Long']) + step(-STEP, STEP))
+
+
+def generate(scale=1, seed=0, size=None):
+    """
+    Generates the data of a network `scale` times the `size`.
+
+    @param scale: The size multiplier, the area grows along.
+    @param seed: The random seed.
+    @param size: A `dict` with the number of `routes`, `stops`
+        and `buses`, default is `TERESINA`.
+
+    @return: A `Fixtures` instance.
+    """
+
+    rand = random.Random(seed)
+    size = size or TERESINA
+    radius = RADIUS * math.sqrt(scale)
+
+    def point():
+        # Uniform at the circle around the center.
+        r = radius * math.sqrt(rand.random())
+        a = rand.uniform(0, 2 * math.pi)
+        return CENTER[0] + r * math.sin(a), CENTER[1] + r * math.cos(a)
+
+    stops = []
+    for i in range(int(size['stops'] * scale)):
+        lat, long = point()
+        stops.append({
+            'CodigoParada': i + 1,
+            'Denomicao': u'PARADA {0} {1}'.format(
+                i + 1, rand.choice(NEIGHBORHOODS)),
+            'Endereco': u'RUA {0}, {1}'.format(
+                rand.randint(1, 999), rand.choice(NEIGHBORHOODS)),
+            'Lat': coordinate(lat),
+            'Long': coordinate(long),
+        })
+    points = [(float(s['Lat']), float(s['Long'])) for s in stops]
+
+    routes, route_stops = [], dict()
+    for i in range(int(size['routes'] * scale)):
+        code = '{0:04d}'.format(i + 1)
+        source, dest = rand.sample(NEIGHBORHOODS, 2)
+        circular = rand.random() < 0.1
+        routes.append({
+            'CodigoLinha': code,
+            'Denomicao': u'{0} - {1}'.format(source, dest),
+            'Origem': source,
+            'Retorno': dest,
+            'Circular': circular,
+        })
+        route_stops[code] = corridor(points, stops, point(), point())
+
+    attach(points, stops, route_stops)
+
+    buses = dict((r['CodigoLinha'], []) for r in routes)
+    for i in range(int(size['buses'] * scale)):
+        code = rand.choice(routes)['CodigoLinha']
+        stop = rand.choice(route_stops[code] or stops)
+        buses[code].append({
+            'CodigoVeiculo': '{0:05d}'.format(i + 1),
+            'Lat': stop['Lat'],
+            'Long': stop['Long'],
+            'Hora': '{0:02d}:{1:02d}'.format(
+                rand.randint(5, 23), rand.randint(0, 59)),
+        })
+
+    return Fixtures(routes, stops, route_stops, buses, seed)
+
+
+def attach(points, stops, route_stops):
+    """
+    Adds each stop out of all the routes to the route with the
+    nearest stop, next to it, so every stop has a route.
+    """
+
+    served = set()
+    for route in route_stops.values():
+        served.update(stop['CodigoParada'] for stop in route)
+
+    position = dict(
+        (stop['CodigoParada'], p) for p, stop in zip(points, stops))
+    for (lat, long), stop in zip(points, stops):
+        if stop['CodigoParada'] in served:
+            continue
+
+        best = None
+        for code, route in route_stops.items():
+            for i, other in enumerate(route):
+                olat, olong = position[other['CodigoParada']]
+                d = (lat - olat) ** 2 + (long - olong) ** 2
+                if best is None or d < best[0]:
+                    best = d, code, i
+
+        if best is not None:
+            _, code, i = best
+            route_stops[code].insert(i + 1, stop)
+
+
+def corridor(points, stops, a, b):
+    """
+    Returns the stops close to the segment from `a` to `b`,
+    in the order of the segment.
+    """
+
+    dlat, dlong = b[0] - a[0], b[1] - a[1]
+    length = dlat * dlat + dlong * dlong or 1e-12
+
+    found = []
+    for (lat, long), stop in zip(points, stops):
+        t = ((lat - a[0]) * dlat + (long - a[1]) * dlong) / length
+        if not 0 <= t <= 1:
+            continue
+        d = math.hypot(lat - a[0] - t * dlat, long - a[1] - t * dlong)
+        if d <= CORRIDOR:
+            found.append((t, stop))
+
+    found.sort(key=lambda x: x[0])
+    return [stop for _, stop in found]
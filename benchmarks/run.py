@@ -0,0 +1,368 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Benchmarks of the wrapper, against the local `MockServer`.
+
+Each operation (see `OPERATIONS`) is timed `repeat` times, at
+random points and objects of the network. The first call is
+reported apart (`cold`), as it usually fetches and indexes the
+data, and the others as percentiles. The requests made to the
+server and the memory used are reported along:
+
+    $ python -m benchmarks.run --scale 1 --latency 0.02
+    operation               calls   cold ms    p50 ms    p90 ms ...
+    Stop.nearest               50    612.10      0.31      0.45 ...
+
+With `--json`, the results are saved, to be compared later by
+`--baseline`, failing if any operation got slower than the
+`--threshold`:
+
+    $ python -m benchmarks.run --json before.json
+    $ python -m benchmarks.run --baseline before.json
+"""
+
+import argparse
+import gc
+import json
+import math
+import random
+import sys
+import time
+from collections import OrderedDict
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+import stranspyra
+from stranspyra import cache
+from stranspyra.compact import CompactRoute, CompactStop
+from stranspyra.models import Route, Stop, Bus
+
+from .fixtures import CENTER, NEIGHBORHOODS, RADIUS, generate
+from .server import MockServer
+
+
+class Context(object):
+    """
+    What the operations use: the data served and a random
+    generator.
+    """
+
+    def __init__(self, data, scale, seed=0):
+        self.data = data
+        self.radius = RADIUS * math.sqrt(scale)
+        self.random = random.Random(seed)
+
+    def point(self):
+        """
+        Returns a random point in the area of the network.
+        """
+
+        r = self.radius * math.sqrt(self.random.random())
+        a = self.random.uniform(0, 2 * math.pi)
+        return CENTER[0] + r * math.sin(a), CENTER[1] + r * math.cos(a)
+
+    def route(self):
+        """
+        Returns a random `Route`.
+        """
+
+        code = self.random.choice(self.data.routes)['CodigoLinha']
+        return Route.get_route(code)
+
+    def stop(self):
+        """
+        Returns a random `Stop`.
+        """
+
+        return Stop.get(self.random.choice(self.data.stops)['CodigoParada'])
+
+
+def route_all(ctx):
+    cache.invalidate(Route, 'all')
+    Route.all()
+
+
+def route_search(ctx):
+    Route.search(ctx.random.choice(NEIGHBORHOODS))
+
+
+def route_get_buses(ctx):
+    ctx.route().get_buses()
+
+
+def route_traceroute(ctx):
+    Route.traceroute(ctx.point(), ctx.point())
+
+
+def route_prefetch_stops(ctx):
+    Route.prefetch_stops(refresh=True)
+
+
+def stop_nearest(ctx):
+    Stop.nearest(*ctx.point())
+
+
+def stop_get_routes(ctx):
+    ctx.stop().get_routes()
+
+
+def bus_nearest(ctx):
+    Bus.nearest(*ctx.point())
+
+
+def loader(model, name):
+    """
+    Returns an operation creating the instances of `model` from
+    all the objects served of `name` (e.g.: `stops`), to compare
+    the models with the compact variants. The instances are kept,
+    as by `Model.all`, so that the first call creates them (`cold`)
+    and the others update them in place.
+    """
+
+    loaded = []
+
+    def load(ctx):
+        loaded[:] = model.load(getattr(ctx.data, name))
+
+    return load
+
+
+# The operations, by name, with the fraction of `repeat` calls.
+OPERATIONS = OrderedDict([
+    ('Route.all', (route_all, 0.2)),
+    ('Route.search', (route_search, 1)),
+    ('Route.get_buses', (route_get_buses, 1)),
+    ('Stop.nearest', (stop_nearest, 1)),
+    ('Stop.get_routes', (stop_get_routes, 1)),
+    ('Route.traceroute', (route_traceroute, 1)),
+    ('Bus.nearest', (bus_nearest, 1)),
+    ('Route.prefetch_stops', (route_prefetch_stops, 0.1)),
+    ('Route.load', (loader(Route, 'routes'), 0.2)),
+    ('CompactRoute.load', (loader(CompactRoute, 'routes'), 0.2)),
+    ('Stop.load', (loader(Stop, 'stops'), 0.2)),
+    ('CompactStop.load', (loader(CompactStop, 'stops'), 0.2)),
+])
+
+
+def percentile(values, p):
+    """
+    Returns the `p` percentile of the sorted `values`, by the
+    nearest rank.
+    """
+
+    if not values:
+        return 0.
+    return values[min(int(math.ceil(p / 100. * len(values))),
+                      len(values)) - 1]
+
+
+def rss():
+    """
+    Returns the max resident memory of the process, in MB, or
+    `None` if it's unknown.
+    """
+
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS.
+    return usage / (1024. * 1024 if sys.platform == 'darwin' else 1024.)
+
+
+def measure(name, func, ctx, calls, server, trace=False):
+    """
+    Times `calls` calls of `func`.
+
+    @return: A `dict` with the results of the operation.
+    """
+
+    gc.collect()
+    requests = server.requests()
+    if trace:
+        tracemalloc.start()
+
+    times = []
+    for _ in range(calls):
+        start = time.time()
+        func(ctx)
+        times.append((time.time() - start) * 1000)
+
+    peak = None
+    if trace:
+        peak = tracemalloc.get_traced_memory()[1] / (1024. * 1024)
+        tracemalloc.stop()
+
+    cold, warm = times[0], sorted(times[1:] or times)
+    return OrderedDict([
+        ('operation', name),
+        ('calls', calls),
+        ('cold', cold),
+        ('p50', percentile(warm, 50)),
+        ('p90', percentile(warm, 90)),
+        ('p99', percentile(warm, 99)),
+        ('max', warm[-1]),
+        ('requests', server.requests() - requests),
+        ('peak_mb', peak),
+        ('rss_mb', rss()),
+    ])
+
+
+def report(results, baseline=None, out=sys.stdout):
+    """
+    Prints the results as a table, with the change of the p50
+    from `baseline`, if given.
+    """
+
+    header = '{0:<22}{1:>6}{2:>10}{3:>10}{4:>10}{5:>10}{6:>10}{7:>6}{8:>9}'
+    row = ('{operation:<22}{calls:>6}{cold:>10.2f}{p50:>10.3f}'
+           '{p90:>10.3f}{p99:>10.3f}{max:>10.3f}{requests:>6}{memory:>9}')
+    out.write(header.format('operation', 'calls', 'cold ms', 'p50 ms',
+                            'p90 ms', 'p99 ms', 'max ms', 'reqs',
+                            'mem MB') + '\n')
+
+    for r in results:
+        memory = r['peak_mb'] if r['peak_mb'] is not None else r['rss_mb']
+        line = row.format(
+            memory='-' if memory is None else '{0:.1f}'.format(memory), **r)
+        if baseline and r['operation'] in baseline:
+            before = baseline[r['operation']]['p50']
+            if before:
+                line += '  {0:+.0%}'.format(r['p50'] / before - 1)
+        out.write(line + '\n')
+
+
+def regressions(results, baseline, threshold):
+    """
+    Returns the operations whose p50 is more than `threshold`
+    (a fraction) slower than at `baseline`.
+    """
+
+    slower = []
+    for r in results:
+        before = baseline.get(r['operation'], {}).get('p50')
+        if before and r['p50'] > before * (1 + threshold):
+            slower.append(r['operation'])
+    return slower
+
+
+def run(scale=1, latency=0, jitter=0, repeat=50, operations=None, seed=0,
+        trace=False):
+    """
+    Runs the benchmarks against a `MockServer` of a network
+    `scale` times the Teresina one.
+
+    @param scale: The network size multiplier.
+    @param latency: Seconds added to each response.
+    @param jitter: Max random seconds added to `latency`.
+    @param repeat: The number of calls of each operation.
+    @param operations: The names of the operations, default is
+        all of `OPERATIONS`.
+    @param seed: The random seed of the data and the calls.
+    @param trace: If the peak memory of each operation must be
+        traced (slower).
+
+    @return: A list of the results of each operation.
+    """
+
+    server = MockServer(generate(scale, seed), latency=latency,
+                        jitter=jitter).start()
+    stranspyra.configure(
+        URL=server.url, API_KEY='bench', EMAIL='bench', PASSWORD='bench',
+        USE_CACHE=True, CACHE_BACKEND='memory', TOKEN_FILE=None)
+    cache.clear()
+
+    ctx = Context(server.data, scale, seed)
+    try:
+        results = []
+        for name in operations or OPERATIONS:
+            func, fraction = OPERATIONS[name]
+            calls = max(int(repeat * fraction), 2)
+            results.append(measure(name, func, ctx, calls, server, trace))
+        return results
+    finally:
+        server.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description='Benchmarks against a local Inthegra API.')
+    parser.add_argument('--scale', type=float, default=1,
+                        help='network size, times the Teresina one')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to each response')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='max random seconds added to the latency')
+    parser.add_argument('--repeat', type=int, default=50,
+                        help='calls of each operation')
+    parser.add_argument('--ops', default=None,
+                        help='comma separated operations, default is all: '
+                        + ', '.join(OPERATIONS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='trace the peak memory of each operation')
+    parser.add_argument('--json', help='file to save the results')
+    parser.add_argument('--baseline', help='results to compare with')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='p50 slowdown failing the comparison')
+    args = parser.parse_args(argv)
+
+    operations = args.ops.split(',') if args.ops else None
+    for name in operations or ():
+        if name not in OPERATIONS:
+            parser.error('unknown operation: {0}'.format(name))
+    if args.trace_memory and tracemalloc is None:
+        parser.error('--trace-memory requires tracemalloc')
+
+    results = run(args.scale, args.latency, args.jitter, args.repeat,
+                  operations, args.seed, args.trace_memory)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = dict((r['operation'], r) for r in json.load(f))
+
+    report(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if baseline:
+        slower = regressions(results, baseline, args.threshold)
+        if slower:
+            sys.stderr.write('Slower than the baseline: {0}\n'.format(
+                ', '.join(slower)))
+            return 1
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
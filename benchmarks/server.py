@@ -0,0 +1,252 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Local stand-in of the Inthegra API, serving `Fixtures`.
+
+It answers `/signin`, `/linhas`, `/paradas`, `/paradasLinha`,
+`/veiculos` and `/veiculosLinha` under any prefix (e.g.: `/v1`),
+as the API does, with an optional latency added to each response.
+The requests are counted by endpoint.
+
+>>> server = MockServer(generate(), latency=0.05)
+>>> server.start()
+>>> stranspyra.configure(URL=server.url, API_KEY='bench',
+...                      EMAIL='bench', PASSWORD='bench')
+
+It can also be run alone, to point `settings.URL` to it:
+
+    $ python -m benchmarks.server --port 8765 --scale 2 --latency 0.05
+"""
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+from .fixtures import generate
+
+# Minutes a token is valid, as `minutos` of `/signin`.
+TOKEN_MINUTES = 10
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Answers the requests with the fixtures of `server`.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # The headers and the body are written apart, don't wait
+    # for the ACK of the headers to send the body.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, obj, status=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def endpoint(self):
+        url = urlparse(self.path)
+        params = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        return '/' + url.path.rstrip('/').rsplit('/', 1)[-1], params
+
+    def do_POST(self):
+        endpoint, _ = self.endpoint()
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        self.server.wait(endpoint)
+
+        if endpoint != '/signin':
+            return self.send({'message': 'api.error.notfound'}, 404)
+        self.send(self.server.signin())
+
+    def do_GET(self):
+        endpoint, params = self.endpoint()
+        self.server.wait(endpoint)
+
+        if not self.server.valid(self.headers.get('x-auth-token')):
+            return self.send({'message': 'api.error.token.expired'}, 401)
+
+        method = self.server.endpoints.get(endpoint)
+        if method is None:
+            return self.send({'message': 'api.error.notfound'}, 404)
+        self.send(method(params.get('busca')))
+
+
+class MockServer(ThreadingMixIn, HTTPServer):
+    """
+    The mock server, at a background thread.
+
+    @attribute data: The `Fixtures` served.
+    @attribute latency: Seconds added to each response.
+    @attribute jitter: Max random seconds added to `latency`.
+    @attribute counts: The number of requests, by endpoint.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, data, host='127.0.0.1', port=0, latency=0,
+                 jitter=0):
+        HTTPServer.__init__(self, (host, port), Handler)
+        self.data = data
+        self.latency = latency
+        self.jitter = jitter
+        self.counts = dict()
+        self.endpoints = {
+            '/linhas': self.routes,
+            '/paradas': self.stops,
+            '/paradasLinha': self.route_stops,
+            '/veiculos': self.buses,
+            '/veiculosLinha': self.route_buses,
+        }
+        self.__tokens__ = dict()
+        self.__lock__ = threading.Lock()
+        self.__thread__ = None
+
+    @property
+    def url(self):
+        """
+        The URL of the API, to be used as `settings.URL`.
+        """
+
+        return 'http://{0}:{1}/v1'.format(*self.server_address[:2])
+
+    def start(self):
+        """
+        Serves at a background thread.
+        """
+
+        self.__thread__ = threading.Thread(target=self.serve_forever)
+        self.__thread__.daemon = True
+        self.__thread__.start()
+        return self
+
+    def stop(self):
+        """
+        Stops serving and closes the socket.
+        """
+
+        self.shutdown()
+        self.server_close()
+
+    def wait(self, endpoint):
+        """
+        Counts a request to `endpoint` and waits the latency.
+        """
+
+        with self.__lock__:
+            self.counts[endpoint] = self.counts.get(endpoint, 0) + 1
+
+        delay = self.latency + random.uniform(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def requests(self):
+        """
+        Returns the total number of requests.
+        """
+
+        with self.__lock__:
+            return sum(self.counts.values())
+
+    def signin(self):
+        token = uuid.uuid4().hex
+        with self.__lock__:
+            self.__tokens__[token] = time.time() + TOKEN_MINUTES * 60
+        return {'token': token, 'minutos': TOKEN_MINUTES}
+
+    def valid(self, token):
+        with self.__lock__:
+            return self.__tokens__.get(token, 0) > time.time()
+
+    def routes(self, pattern):
+        if pattern is None:
+            return self.data.routes
+        return self.data.search(
+            self.data.routes, pattern, ('CodigoLinha', 'Denomicao'))
+
+    def stops(self, pattern):
+        if pattern is None:
+            return self.data.stops
+        return self.data.search(
+            self.data.stops, pattern, ('Denomicao', 'Endereco'))
+
+    def route_stops(self, code):
+        route = self.data.route(code)
+        if route is None:
+            return {'code': 130}
+        return {'Linha': route, 'Paradas': self.data.route_stops[code]}
+
+    def buses(self, pattern):
+        self.data.move()
+        buses = self.data.buses
+        return [
+            {'Linha': dict(route, Veiculos=buses[route['CodigoLinha']])}
+            for route in self.data.routes if buses[route['CodigoLinha']]
+        ]
+
+    def route_buses(self, code):
+        route = self.data.route(code)
+        if route is None or not self.data.buses[code]:
+            return {'code': 130}
+        return {'Linha': dict(route, Veiculos=self.data.buses[code])}
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Local stand-in of the Inthegra API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--scale', type=float, default=1,
+                        help='network size, times the Teresina one')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='seconds added to each response')
+    parser.add_argument('--jitter', type=float, default=0,
+                        help='max random seconds added to the latency')
+    args = parser.parse_args()
+
+    server = MockServer(generate(args.scale), args.host, args.port,
+                        args.latency, args.jitter)
+    print('Serving the Inthegra API at {0}'.format(server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
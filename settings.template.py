@@ -4,7 +4,19 @@ URL = 'https://api.inthegra.strans.teresina.pi.gov.br/v1'
 EMAIL = ''
 PASSWORD = ''
 USE_CACHE = True
+CACHE_BACKEND = 'memory'  # or 'sqlite', kept across restarts
+CACHE_PATH = 'stranspyra-cache.db'
+CACHE_EXPIRES = None  # seconds, for the entries cached permanently
+CACHE_MAX_ENTRIES = 10000
+CACHE_MAX_SIZE = None  # bytes
+TOKEN_FILE = None  # a path, to share the token between processes
+RATE_LIMIT = None  # requests per second
+RATE_BURST = None
+MAX_IN_FLIGHT = None
+SHARED_PATH = None  # a directory, to share the cache between processes
 
 REQUEST_OPTIONS = {
-
+    # 'timeout': (3.05, 10),
+    # 'pool_connections': 10,
+    # 'pool_maxsize': 10,
 }
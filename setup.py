@@ -14,6 +14,10 @@ setup(
         'requests',
         'geopy'
     ],
+    extras_require={
+        'async': ['aiohttp'],
+        'batch': ['numpy'],
+    },
     long_description="""This is a Python wrapper for the Inthegra API,
 designed to provides some features not implemented
 in the Inthegra API."""
@@ -80,10 +80,5 @@ Distance(0.72410974728))
 __version__ = '0.1.0'
 
 from . import api
+from .conf import configure
 from .models import *
-
-try:
-    import settings
-    api.auth()
-except ImportError:
-    pass
@@ -0,0 +1,341 @@
+# -*- coding: utf8 -*-
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Asyncio interface to the Inthegra API.
+
+Mirrors `stranspyra.api` and the blocking methods of the models
+with coroutines, using `aiohttp`. The objects returned are the
+same models of `stranspyra.models`.
+
+>>> from stranspyra import aio
+>>> routes = await aio.all(Route)
+>>> buses = await aio.get_buses_many(routes)
+
+Requires `aiohttp` (pip install stranspyra[async]).
+"""
+
+import asyncio
+import time
+import weakref
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+from . import api, metrics
+from . import scheduler as scheduling
+from .conf import settings
+from .exceptions import APIServerError
+from .models import BaseBus
+
+# Default limit of concurrent requests of the `*_many` functions.
+CONCURRENCY = 10
+
+# The sessions of the event loops, each one with the task closing
+# it (see `session`).
+__sessions__ = weakref.WeakKeyDictionary()
+
+
+def _timeout(options):
+    """
+    Maps the `timeout` of `settings.REQUEST_OPTIONS`, as used by
+    `requests`, to an `aiohttp.ClientTimeout`.
+    """
+
+    timeout = options.get('timeout')
+
+    if timeout is None:
+        return aiohttp.ClientTimeout()
+    if isinstance(timeout, (tuple, list)):
+        return aiohttp.ClientTimeout(connect=timeout[0], sock_read=timeout[1])
+    return aiohttp.ClientTimeout(total=timeout)
+
+
+def session():
+    """
+    Returns the `aiohttp.ClientSession` of the running event loop,
+    creating it on the first call at the loop. It must be called
+    inside a running event loop.
+
+    A session can't be used by other loop than the one creating
+    it, so each loop (e.g.: each `asyncio.run`) has its own. It's
+    closed by `close` or when the loop shuts down, cancelling its
+    pending tasks (as `asyncio.run` does).
+
+    The pool size is `pool_maxsize` of `settings.REQUEST_OPTIONS`.
+
+    @return: a `aiohttp.ClientSession` instance.
+    """
+
+    if aiohttp is None:
+        raise ImportError('aiohttp is required by stranspyra.aio')
+
+    loop = asyncio.get_running_loop()
+    current = __sessions__.get(loop)
+    if current is not None and not current[0].closed:
+        return current[0]
+
+    pool, options = api.request_options()
+    connector = aiohttp.TCPConnector(
+        limit=pool['pool_maxsize'],
+        ssl=None if options.get('verify', True) else False,
+    )
+    s = aiohttp.ClientSession(
+        connector=connector,
+        timeout=_timeout(options),
+        auto_decompress=True,
+    )
+    __sessions__[loop] = s, loop.create_task(_close_on_shutdown(s))
+
+    return s
+
+
+async def _close_on_shutdown(s):
+    # Waits until it's cancelled, when the loop shuts down, to
+    # close the session `s`. The entry holds the loop through
+    # this task, it's removed so the loop can be released.
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.create_future()
+    finally:
+        if __sessions__.get(loop, (None,))[0] is s:
+            del __sessions__[loop]
+        if not s.closed:
+            await s.close()
+
+
+async def close():
+    """
+    Closes the session of the running event loop and all its
+    connections.
+    """
+
+    current = __sessions__.pop(asyncio.get_running_loop(), None)
+
+    if current is not None:
+        s, closer = current
+        await s.close()
+        closer.cancel()
+
+
+async def _refresh(stale):
+    # Logs in at a thread, through the token manager of `api`.
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, api.tokens.refresh, stale)
+
+
+async def _acquire(scheduler, level):
+    # Takes a slot of the scheduler shared with `api.get`, waiting
+    # at a thread of the loop's executor if there's any limit.
+    if not scheduler.limited():
+        scheduler.acquire(level)
+        return
+
+    loop = asyncio.get_running_loop()
+    acquired = loop.run_in_executor(None, scheduler.acquire, level)
+    try:
+        await asyncio.shield(acquired)
+    except asyncio.CancelledError:
+        # Given back as soon as it's taken.
+        acquired.add_done_callback(lambda f: scheduler.release())
+        raise
+
+
+async def auth():
+    """
+    Authenticates the user, as `api.auth`, at a thread of the
+    loop's executor. The token is shared with `stranspyra.api`
+    (see `api.tokens`).
+
+    Concurrent calls wait for the login already in flight,
+    instead of each one logging in.
+
+    @return: a `dict` object with the keys `token` and `minutos`,
+    from json returned from the API.
+    """
+
+    return await _refresh(api.tokens.token)
+
+
+async def get(endpoint, **kwargs):
+    """
+    Makes a GET request to the API, as `api.get`.
+
+    @param endpoint: the endpoint URL (e.g.: '/linhas').
+
+    keyword args passed as URL params.
+
+    The request waits for a slot of `api.scheduler`, the same
+    rate limit and max of requests in flight of `api.get`.
+
+    @return: a json decoded object.
+
+    Raises `APIServerError` if it returns message with
+    'api.error'. If the token has expired, authenticates
+    again and retries once.
+    """
+
+    tokens = api.tokens
+    params = dict((k, str(v)) for k, v in kwargs.items())
+    level = scheduling.current(endpoint)
+
+    for retry in (True, False):
+        if not tokens.valid():
+            await _refresh(tokens.token)
+        elif not tokens.valid(tokens.margin):
+            tokens.refresh_async()
+
+        token = tokens.token
+
+        scheduler = api.scheduler()
+        await _acquire(scheduler, level)
+        try:
+            start = time.time() if metrics.enabled else 0
+            async with session().get(
+                settings.URL + endpoint,
+                headers={
+                    'date': api.date(),
+                    'x-api-key': settings.API_KEY,
+                    'x-auth-token': token,
+                },
+                params=params,
+            ) as res:
+                body = await res.read()
+
+                if metrics.enabled:
+                    metrics.request(
+                        endpoint, time.time() - start, len(body))
+                    start = time.time()
+
+                jres = await res.json(content_type=None)
+        finally:
+            scheduler.release()
+
+        if metrics.enabled:
+            metrics.decode(endpoint, time.time() - start)
+
+        message = api.error(jres)
+        if message is None:
+            return jres
+
+        if message != 'api.error.token.expired' or not retry:
+            raise APIServerError(message)
+
+        if metrics.enabled:
+            metrics.token_expired(endpoint)
+        await _refresh(token)
+
+
+async def all(cls):
+    """
+    Returns all elements of the endpoint of `cls`, as `Model.all`.
+
+    @param cls: A model class (e.g.: `Route`).
+
+    @return: A list of instances of `cls`.
+    """
+
+    return cls.load(await get(cls.endpoint))
+
+
+async def search(cls, pattern):
+    """
+    Searches the endpoint of `cls`, as `Model.search`.
+
+    @param cls: A model class (e.g.: `Route`).
+    @param pattern: The `busca` param.
+
+    @return: A list of instances of `cls`.
+    """
+
+    if issubclass(cls, BaseBus):
+        raise NotImplementedError('Busca não implementada para veiculos')
+
+    return cls.load(await get(cls.endpoint, busca=pattern))
+
+
+async def get_stops(route):
+    """
+    Returns the stops of `route`, as `Route.get_stops`.
+
+    @param route: A `Route` instance.
+
+    @return: A list of `Stop` instances.
+    """
+
+    return route.parse_stops(await get('/paradasLinha', busca=route.code))
+
+
+async def get_buses(route):
+    """
+    Returns the buses of `route`, as `Route.get_buses`.
+
+    @param route: A `Route` instance.
+
+    @return: A list of `Bus` instances.
+    """
+
+    return route.parse_buses(await get('/veiculosLinha', busca=route.code))
+
+
+async def gather(aws, limit=CONCURRENCY):
+    """
+    Runs the awaitables `aws` concurrently, at most `limit`
+    at the same time.
+
+    @param aws: A iterable of awaitables.
+    @param limit: The max number of awaitables running at once.
+
+    @return: A list with the results, in the order of `aws`.
+    """
+
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(aw):
+        async with semaphore:
+            return await aw
+
+    return await asyncio.gather(*[bounded(aw) for aw in aws])
+
+
+async def get_stops_many(routes, limit=CONCURRENCY):
+    """
+    Returns the stops of each one of `routes`, requesting
+    at most `limit` routes at the same time.
+
+    @return: A list with a list of `Stop` for each route.
+    """
+
+    return await gather([get_stops(r) for r in routes], limit)
+
+
+async def get_buses_many(routes, limit=CONCURRENCY):
+    """
+    Returns the buses of each one of `routes`, requesting
+    at most `limit` routes at the same time.
+
+    @return: A list with a list of `Bus` for each route.
+    """
+
+    return await gather([get_buses(r) for r in routes], limit)
@@ -19,13 +19,27 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
 # SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import requests
+import threading
 import time
 
-import settings
+from . import metrics
+from . import scheduler as scheduling
+from .conf import settings
 from .exceptions import APIServerError
+from .tokens import TokenManager
 
-token = ''
+# Keys of `settings.REQUEST_OPTIONS` used to configure the
+# connection pool, instead of being passed to `requests`.
+POOL_OPTIONS = {
+    'pool_connections': 10,
+    'pool_maxsize': 10,
+    'pool_block': False,
+    'max_retries': 0,
+}
+
+__session__ = None
+__session_lock__ = threading.Lock()
+__scheduler__ = None
 
 
 def date():
@@ -37,41 +51,186 @@ def date():
     return time.strftime('%a, %d %b %Y %H:%M:%S GMT')
 
 
-def auth():
+def request_options():
+    """
+    Splits `settings.REQUEST_OPTIONS` between the connection pool
+    options (see `POOL_OPTIONS`) and the options passed to each
+    request (e.g.: `timeout`, `verify`).
+
+    @return: a tuple with two `dict`, the pool options and the
+        request options.
+    """
+
+    pool = dict(POOL_OPTIONS)
+    options = dict(settings.REQUEST_OPTIONS)
+
+    for key in POOL_OPTIONS:
+        if key in options:
+            pool[key] = options.pop(key)
+
+    return pool, options
+
+
+def session():
+    """
+    Returns the shared `requests.Session`, creating it on the
+    first call.
+
+    The session keeps the connections to the API host alive
+    between calls, so only the first request pays for the TCP
+    and TLS handshake. It's safe to share between threads, each
+    thread takes a connection from the pool.
+
+    @return: a `requests.Session` instance.
+    """
+
+    global __session__
+
+    if __session__ is not None:
+        return __session__
+
+    with __session_lock__:
+        if __session__ is None:
+            # Imported on the first request, not with the package.
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            pool, _ = request_options()
+            adapter = HTTPAdapter(**pool)
+
+            s = requests.Session()
+            s.mount('http://', adapter)
+            s.mount('https://', adapter)
+            s.headers['Accept-Encoding'] = 'gzip, deflate'
+            __session__ = s
+
+    return __session__
+
+
+def scheduler():
+    """
+    Returns the shared `scheduler.Scheduler`, creating it on the
+    first call with `settings.RATE_LIMIT`, `settings.RATE_BURST`
+    and `settings.MAX_IN_FLIGHT`.
+
+    @return: a `scheduler.Scheduler` instance.
+    """
+
+    global __scheduler__
+
+    if __scheduler__ is not None:
+        return __scheduler__
+
+    with __session_lock__:
+        if __scheduler__ is None:
+            __scheduler__ = scheduling.Scheduler(
+                rate=settings.RATE_LIMIT,
+                burst=settings.RATE_BURST,
+                max_in_flight=settings.MAX_IN_FLIGHT,
+            )
+
+    return __scheduler__
+
+
+def close():
+    """
+    Closes the shared session and all its pooled connections,
+    and discards the scheduler.
+
+    The next request creates new ones. Call it after forking
+    a process, the connections can't be shared with the parent.
+    """
+
+    global __session__, __scheduler__
+
+    with __session_lock__:
+        if __session__ is not None:
+            __session__.close()
+            __session__ = None
+        __scheduler__ = None
+
+
+def credentials():
     """
-    Authenticates the user using the url, application key,
-    email and the password.
+    Returns the body sent to `/signin`.
+
+    @return: a `dict` with the user's email and password.
+    """
+
+    return {
+        'email': settings.EMAIL,
+        'password': settings.PASSWORD
+    }
+
+
+def error(jres):
+    """
+    Checks if a json decoded response is an API error.
+
+    @param jres: a json decoded object.
+
+    @return: the error message (e.g.: 'api.error.token.expired'),
+        or `None` if `jres` is not an error.
+    """
+
+    if isinstance(jres, dict) and \
+       jres.get('message', '').startswith('api.error'):
+        return jres['message']
+
+    return None
+
+
+def signin():
+    """
+    Logs in, making a request to `/signin` with the url,
+    application key, email and the password.
 
     @return: a `dict` object with the keys `token` and `minutos`,
     from json returned from the API.
     """
 
-    global token
     endpoint = '/signin'
 
     url = settings.URL
     key = settings.API_KEY
 
-    res = requests.post(
-        url + endpoint,
-        headers={
-            'date': date(),
-            'x-api-key': key,
-        },
-        json={
-            'email': settings.EMAIL,
-            'password': settings.PASSWORD
-        },
-        **settings.REQUEST_OPTIONS
-    )
+    _, options = request_options()
+
+    with scheduler().slot(scheduling.current(endpoint)):
+        start = time.time() if metrics.enabled else 0
+        res = session().post(
+            url + endpoint,
+            headers={
+                'date': date(),
+                'x-api-key': key,
+            },
+            json=credentials(),
+            **options
+        )
+
+    if metrics.enabled:
+        metrics.request(endpoint, time.time() - start, len(res.content))
 
     try:
-        res = res.json()
-        token = res['token']
-    except Exception:
-        pass
+        return res.json()
+    except ValueError:
+        return {}
+
 
-    return res
+# The access token, shared by all the threads (see `tokens`).
+tokens = TokenManager(signin)
+
+
+def auth():
+    """
+    Authenticates the user, replacing the current token. If other
+    thread is logging in, waits for its token instead.
+
+    @return: a `dict` object with the keys `token` and `minutos`,
+    from json returned from the API.
+    """
+
+    return tokens.refresh(tokens.token)
 
 
 def get(endpoint, **kwargs):
@@ -84,7 +243,16 @@ def get(endpoint, **kwargs):
     keyword args passed as URL params.
 
     `settings.REQUEST_OPTIONS` are passed as kwargs to
-    `requests.get`.
+    `requests.Session.get`, except the pool options (see
+    `request_options`). The request uses the shared
+    session, reusing a kept-alive connection when possible.
+
+    The request waits for a slot of the `scheduler`, by the
+    priority of the endpoint (see `scheduler.ENDPOINTS`).
+
+    The token is taken from `tokens`, logging in on the first
+    request and before it expires. If the API says it has
+    expired anyway, logs in again and retries once.
 
     @return: a json decoded object.
 
@@ -92,30 +260,44 @@ def get(endpoint, **kwargs):
     'api.error'.
     """
 
-    global token
-
     url = settings.URL
     key = settings.API_KEY
 
-    res = requests.get(
-        url + endpoint,
-        headers={
-            'date': date(),
-            'x-api-key': key,
-            'x-auth-token': token,
-        },
-        params=kwargs,
-        **settings.REQUEST_OPTIONS
-    )
-
-    jres = res.json()
-    if isinstance(jres, dict) and \
-       jres.get('message', '').startswith('api.error'):
+    _, options = request_options()
+    level = scheduling.current(endpoint)
+
+    for retry in (True, False):
+        token = tokens.get()
+
+        with scheduler().slot(level):
+            start = time.time() if metrics.enabled else 0
+            res = session().get(
+                url + endpoint,
+                headers={
+                    'date': date(),
+                    'x-api-key': key,
+                    'x-auth-token': token,
+                },
+                params=kwargs,
+                **options
+            )
+
+        if metrics.enabled:
+            metrics.request(endpoint, time.time() - start, len(res.content))
+            start = time.time()
+
+        jres = res.json()
+
+        if metrics.enabled:
+            metrics.decode(endpoint, time.time() - start)
 
-        if jres['message'] == 'api.error.token.expired' and token is not None:
-            auth()
-            return get(endpoint, **kwargs)
+        message = error(jres)
+        if message is None:
+            return jres
 
-        raise APIServerError(jres['message'])
+        if message != 'api.error.token.expired' or not retry:
+            raise APIServerError(message)
 
-    return jres
+        if metrics.enabled:
+            metrics.token_expired(endpoint)
+        tokens.refresh(token)
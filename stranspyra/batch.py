@@ -0,0 +1,190 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Vectorized distances, for searching the nearest object of
+many points at once.
+
+The distances from every point to every object are computed
+with the haversine formula over NumPy arrays. Then the few
+best candidates of each point are ranked with the exact
+`geopy.distance.distance`, so the results are the same of
+`Stop.nearest` and `Bus.nearest`.
+
+>>> engine = Engine(Stop.all())
+>>> engine.nearest([(-5.056221, -42.790308), (-5.090280, -42.813843)])
+[(<Stop 911 Campos Universitario - CCS>, Distance(0.0621590283922)),
+ (<Stop 215 RUA 07 DE SETEMBRO >, Distance(0.165885308859))]
+
+Requires `numpy`.
+"""
+
+from . import spatial
+from .spatial import EARTH_RADIUS, location
+from .tables import Table
+
+# Candidates of each point ranked by the exact distance.
+CANDIDATES = 4
+
+# NumPy, imported on the first use (see `available`).
+numpy = None
+
+# Max number of points per distance matrix, limiting the
+# memory used by large batches (points x objects floats).
+CHUNK = 1024
+
+
+def available():
+    """
+    If NumPy is installed, importing it on the first call.
+
+    @return: Boolean.
+    """
+
+    global numpy
+
+    if numpy is None:
+        try:
+            import numpy
+        except ImportError:
+            return False
+
+    return True
+
+
+def haversine(lat, long, lats, longs):
+    """
+    Computes the great-circle distance between the points
+    `lat`, `long` and `lats`, `longs`, in degrees.
+
+    The arguments are broadcast as NumPy arrays, e.g. a column
+    of points against a row of objects gives a matrix.
+
+    @return: A `numpy.ndarray` of distances in kilometers.
+    """
+
+    lat, long, lats, longs = map(numpy.radians, (lat, long, lats, longs))
+
+    a = numpy.sin((lats - lat) / 2) ** 2 + \
+        numpy.cos(lat) * numpy.cos(lats) * numpy.sin((longs - long) / 2) ** 2
+
+    return 2 * EARTH_RADIUS * numpy.arcsin(numpy.sqrt(numpy.minimum(a, 1)))
+
+
+class Engine(object):
+    """
+    Searches the nearest objects of batches of points.
+    """
+
+    def __init__(self, objs, key=location):
+        """
+        @constructor
+
+        @param objs: A list of objects (e.g.: `Stop` instances),
+            or a `tables.Table` (e.g.: `tables.StopTable`).
+        @param key: A callable returning the latitude and longitude
+            of an object, default are its `lat` and `long`.
+        """
+
+        if not available():
+            raise ImportError('numpy is required by stranspyra.batch')
+
+        if isinstance(objs, Table):
+            # The table arrays are used as they are.
+            self.objs = objs
+            self.lats, self.longs = objs.coordinates()
+            return
+
+        self.objs = list(objs)
+        coords = numpy.array(
+            [tuple(map(float, key(obj))) for obj in self.objs],
+            dtype=numpy.float64
+        ).reshape(-1, 2)
+        self.lats = coords[:, 0]
+        self.longs = coords[:, 1]
+
+    def __len__(self):
+        return len(self.objs)
+
+    def distances(self, points):
+        """
+        Computes the haversine distance from every point to
+        every object.
+
+        @param points: A list of pairs latitude and longitude.
+
+        @return: A `numpy.ndarray` with a row for each point and
+            a column for each object, in kilometers.
+        """
+
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+
+        return haversine(
+            points[:, 0:1], points[:, 1:2],
+            self.lats[numpy.newaxis, :], self.longs[numpy.newaxis, :]
+        )
+
+    def nearest(self, points, exact=True, candidates=CANDIDATES):
+        """
+        Searches the nearest object of each one of `points`.
+
+        @param points: A list of pairs latitude and longitude.
+        @param exact: If the best candidates must be ranked by
+            `geopy.distance.distance`. Otherwise, the haversine
+            distance is returned.
+        @param candidates: The number of candidates ranked.
+
+        @return: A list with a tuple of an object and a `Distance`
+            (see geopy.distance) for each point.
+        """
+
+        if not self.objs:
+            raise ValueError('No objects to search')
+
+        from geopy.distance import Distance
+
+        points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 2)
+        c = min(candidates if exact else 1, len(self.objs))
+
+        result = []
+        for start in range(0, len(points), CHUNK):
+            chunk = points[start:start + CHUNK]
+            dists = self.distances(chunk)
+
+            if c < len(self.objs):
+                best = numpy.argpartition(dists, c - 1, axis=1)[:, :c]
+            else:
+                best = numpy.tile(numpy.arange(c), (len(chunk), 1))
+
+            for point, row, idx in zip(chunk, dists, best):
+                if exact:
+                    lat, long = point
+                    d, i = min(
+                        (spatial.distance(
+                            (self.lats[i], self.longs[i]), (lat, long)
+                        ), i) for i in idx
+                    )
+                else:
+                    i = idx[0]
+                    d = Distance(kilometers=row[i])
+                result.append((self.objs[i], d))
+
+        return result
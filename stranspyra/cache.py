@@ -21,76 +21,655 @@
 
 """
 Implements object caching using decorators.
+
+Each entry is identified by the class and the code of the
+object, the method name and the call arguments, see `key`.
+
+The entries are kept by a backend, chosen by
+`settings.CACHE_BACKEND`:
+
+    'memory': in-process memory (default).
+    'sqlite': a SQLite file at `settings.CACHE_PATH`, kept
+        across restarts. The entries are read back on the first
+        access, so a new process starts warm.
+
+Both keep at most `settings.CACHE_MAX_ENTRIES` entries in
+memory, and at most `settings.CACHE_MAX_SIZE` bytes (measured
+as pickled, default is no limit), removing the least recently
+used ones first.
+
+The entries cached by `cached` expire after
+`settings.CACHE_EXPIRES` seconds (default is never).
 """
 
+import os
+import pickle
+import sqlite3
 import time
 import threading
+from collections import OrderedDict
+
+from . import metrics
+from .conf import settings
 
-try:
-    import settings
-    USE_CACHE = settings.USE_CACHE
-except ImportError:
-    USE_CACHE = False
+# Seconds the catalog of routes and stops (`Model.all`) is cached.
+CATALOG_EXPIRES = 3600
 
-__memcache__ = dict()
 __lock__ = threading.RLock()
-__timestamps__ = dict()
+__backend__ = None
+
+# Calls in progress, by key (see `single_flight`).
+__flights__ = dict()
+__flights_lock__ = threading.Lock()
+
+
+class MemoryBackend(object):
+    """
+    Keeps the entries in memory, with their expiration time,
+    evicting the least recently used when it's full.
+
+    @attribute hits: Number of `get` calls that found the entry.
+    @attribute misses: Number of `get` calls that didn't.
+    @attribute evictions: Number of entries removed because
+        the backend was full.
+    """
+
+    def __init__(self, max_entries=None, max_size=None):
+        """
+        @constructor
+
+        @param max_entries: Max number of entries, `None` for no limit.
+        @param max_size: Max sum of the pickled size of the entries,
+            in bytes, `None` for no limit.
+        """
+
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+        # key -> (value, expires, size), the last used at the end.
+        self.__data__ = OrderedDict()
+        self.__data_lock__ = threading.RLock()
+
+    def __len__(self):
+        return len(self.__data__)
+
+    def __lookup__(self, key, stale=0):
+        with self.__data_lock__:
+            value, expires, size = self.__data__.pop(key)
+            if expires is not None and expires + stale <= time.time():
+                self.size -= size
+                raise KeyError(key)
+
+            self.__data__[key] = (value, expires, size)
+            return value, expires
+
+    def entry(self, key, stale=0, count=True):
+        """
+        Returns the value of `key` and when it expires.
+
+        @param stale: Seconds the entry is still returned
+            after it has expired.
+        @param count: If the call is counted as a hit or miss.
+
+        @return: A tuple with the value and the expiration
+            timestamp (`None` for never).
+
+        Raises `KeyError` if `key` is not cached or has expired.
+        """
+
+        try:
+            entry = self.__lookup__(key, stale)
+        except KeyError:
+            if count:
+                self.misses += 1
+            raise
+
+        if count:
+            self.hits += 1
+        return entry
+
+    def get(self, key):
+        """
+        Returns the value of `key`.
+
+        Raises `KeyError` if `key` is not cached or has expired.
+        """
+
+        return self.entry(key)[0]
+
+    def set(self, key, value, expires=None, size=None):
+        """
+        Caches `value` as `key`.
+
+        @param expires: The timestamp when the entry expires,
+            `None` for never.
+        @param size: The pickled size of `value`, computed only
+            if there's a size limit and it's not given.
+        """
+
+        if size is None:
+            if self.max_size is not None:
+                size = len(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+            else:
+                size = 0
+
+        with self.__data_lock__:
+            self.delete(key)
+            self.__data__[key] = (value, expires, size)
+            self.size += size
+            self.evict()
+
+    def evict(self):
+        """
+        Removes the expired entries and then the least recently
+        used ones, until the limits are respected.
+        """
+
+        def full():
+            return (self.max_entries is not None and
+                    len(self.__data__) > self.max_entries) or \
+                   (self.max_size is not None and
+                    self.size > self.max_size)
+
+        with self.__data_lock__:
+            if not full():
+                return
+
+            self.purge()
+
+            while self.__data__ and full():
+                key = next(iter(self.__data__))
+                self.delete(key)
+                self.evictions += 1
+
+    def purge(self):
+        """
+        Removes the expired entries.
+        """
+
+        with self.__data_lock__:
+            now = time.time()
+            for key, (_, expires, _) in list(self.__data__.items()):
+                if expires is not None and expires <= now:
+                    self.delete(key)
+
+    def delete(self, key):
+        """
+        Removes `key`, if it's cached.
+        """
+
+        with self.__data_lock__:
+            entry = self.__data__.pop(key, None)
+            if entry is not None:
+                self.size -= entry[2]
+
+    def keys(self):
+        """
+        Returns all the cached keys.
+        """
+
+        return list(self.__data__.keys())
+
+    def clear(self):
+        """
+        Removes all the entries.
+        """
+
+        with self.__data_lock__:
+            self.__data__.clear()
+            self.size = 0
+
+    def stats(self):
+        """
+        Returns the cache counters.
+
+        @return: A `dict` with `hits`, `misses`, `evictions`,
+            `entries` and `size`.
+        """
+
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'entries': len(self.__data__),
+            'size': self.size,
+        }
+
+
+class SQLiteBackend(MemoryBackend):
+    """
+    Keeps the entries in a SQLite file, pickled. The recently
+    used entries are also kept in memory, the others are read
+    from the file when needed.
+
+    The keys are pickled apart from the values, so they're
+    listed (e.g.: by `invalidate`) without loading the values.
+    """
+
+    # Version of the table layout, a file of other version is
+    # emptied.
+    schema = 2
+
+    def __init__(self, path, **kwargs):
+        """
+        @constructor
+
+        @param path: The SQLite file path, created if it doesn't exist.
+
+        keyword args are passed to `MemoryBackend`.
+        """
+
+        super(SQLiteBackend, self).__init__(**kwargs)
+
+        self.path = path
+        self.__db__ = sqlite3.connect(
+            path, timeout=30, check_same_thread=False,
+            isolation_level=None)
+        self.__db_lock__ = threading.Lock()
+
+        with self.__db_lock__:
+            version, = self.__db__.execute('PRAGMA user_version').fetchone()
+            if version != self.schema:
+                self.__db__.execute('DROP TABLE IF EXISTS cache')
+                self.__db__.execute(
+                    'PRAGMA user_version = {0:d}'.format(self.schema))
+            self.__db__.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, pickled_key BLOB, value BLOB, '
+                'expires REAL)')
+            self.__db__.execute(
+                'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+
+        self.warm()
+
+    def __load__(self, data):
+        try:
+            return True, pickle.loads(bytes(data))
+        except Exception:
+            # Stale entry from a incompatible version.
+            return False, None
+
+    def warm(self):
+        """
+        Reads the entries not expired from the file, the most
+        recent last, so the memory limits are respected.
+        """
+
+        with self.__db_lock__:
+            rows = self.__db__.execute(
+                'SELECT pickled_key, value, expires FROM cache '
+                'ORDER BY rowid').fetchall()
+
+        for pickled_key, data, expires in rows:
+            ok, key = self.__load__(pickled_key)
+            loaded, value = self.__load__(data)
+            if ok and loaded:
+                MemoryBackend.set(self, key, value, expires, len(data))
+
+    def entry(self, key, stale=0, count=True):
+        try:
+            entry = self.__lookup__(key, stale)
+        except KeyError:
+            with self.__db_lock__:
+                row = self.__db__.execute(
+                    'SELECT value, expires FROM cache WHERE key = ?',
+                    (repr(key),)).fetchone()
+
+            expired = row is None or \
+                (row[1] is not None and row[1] + stale <= time.time())
+            loaded, value = (False, None) if expired else \
+                self.__load__(row[0])
+            if not loaded:
+                if count:
+                    self.misses += 1
+                raise KeyError(key)
+
+            entry = value, row[1]
+            MemoryBackend.set(self, key, entry[0], row[1], len(row[0]))
+
+        if count:
+            self.hits += 1
+        return entry
+
+    def set(self, key, value, expires=None):
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        pickled_key = pickle.dumps(key, pickle.HIGHEST_PROTOCOL)
+        MemoryBackend.set(self, key, value, expires, len(data))
+
+        with self.__db_lock__:
+            self.__db__.execute(
+                'INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                (repr(key), sqlite3.Binary(pickled_key),
+                 sqlite3.Binary(data), expires))
+
+    def remove(self, key):
+        """
+        Removes `key` from the memory and from the file.
+        """
+
+        self.delete(key)
+
+        with self.__db_lock__:
+            self.__db__.execute(
+                'DELETE FROM cache WHERE key = ?', (repr(key),))
+
+    def keys(self):
+        with self.__db_lock__:
+            rows = self.__db__.execute(
+                'SELECT pickled_key FROM cache').fetchall()
+
+        keys = set(super(SQLiteBackend, self).keys())
+        for pickled_key, in rows:
+            ok, key = self.__load__(pickled_key)
+            if ok:
+                keys.add(key)
+
+        return list(keys)
+
+    def clear(self):
+        super(SQLiteBackend, self).clear()
+
+        with self.__db_lock__:
+            self.__db__.execute('DELETE FROM cache')
+
+
+BACKENDS = {
+    'memory': lambda: MemoryBackend(
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        max_size=settings.CACHE_MAX_SIZE),
+    'sqlite': lambda: SQLiteBackend(
+        os.path.expanduser(settings.CACHE_PATH),
+        max_entries=settings.CACHE_MAX_ENTRIES,
+        max_size=settings.CACHE_MAX_SIZE),
+}
+
+
+def backend():
+    """
+    Returns the cache backend, chosen by `settings.CACHE_BACKEND`.
+    """
+
+    global __backend__
+
+    if __backend__ is None:
+        with __lock__:
+            if __backend__ is None:
+                __backend__ = BACKENDS[settings.CACHE_BACKEND]()
+
+    return __backend__
+
+
+def clear():
+    """
+    Removes all the cached entries.
+    """
+
+    backend().clear()
+
+
+def stats():
+    """
+    Returns the counters of the cache backend.
+
+    @return: A `dict` with `hits`, `misses`, `evictions`,
+        `entries` and `size`.
+    """
+
+    return backend().stats()
+
+
+def key(self, method, args=(), kwargs=None):
+    """
+    Returns the key of a cached call.
+
+    @param self: The object (or the class, for class methods)
+        owning the method.
+    @param method: The method name.
+
+    @return: A tuple `(class name, code, method, args)`, where
+        `code` is `None` for classes and `args` has the positional
+        and the sorted keyword arguments.
+    """
+
+    if isinstance(self, type):
+        cls, code = self.__name__, None
+    else:
+        cls, code = type(self).__name__, self.code
+
+    return (cls, code, method, tuple(args) +
+            tuple(sorted((kwargs or {}).items())))
+
+
+def invalidate(obj=None, method=None):
+    """
+    Removes the entries of `obj` and/or of the method named
+    `method`. Without arguments, the same as `clear`.
+
+    >>> invalidate(Route.get_route(401), 'get_buses')
+    >>> invalidate(Stop)  # Stop.all() and the others class methods
+
+    @param obj: A model instance or a model class.
+    @param method: A method name.
+
+    @return: The number of entries removed.
+    """
+
+    if obj is None and method is None:
+        n = len(backend())
+        clear()
+        return n
+
+    if obj is not None:
+        cls, code = key(obj, method)[:2]
+
+    b = backend()
+    remove = getattr(b, 'remove', b.delete)
+    n = 0
+    for k in b.keys():
+        if obj is not None and k[:2] != (cls, code):
+            continue
+        if method is not None and k[2] != method:
+            continue
+        remove(k)
+        n += 1
+
+    return n
+
+
+def store(obj, method, value, expires=None):
+    """
+    Caches `value` as the result of the method named `method`
+    of `obj`, called without arguments (e.g.: when fetched in
+    bulk). Does nothing if the cache is disabled.
+
+    >>> store(Route.get_route(401), 'get_buses', buses, 30)
+
+    @param obj: A model instance or a model class.
+    @param method: A method name.
+    @param value: The method result.
+    @param expires: Seconds the entry is valid, default is
+        `settings.CACHE_EXPIRES`, as `cached`.
+    """
+
+    if not settings.USE_CACHE:
+        return
+
+    if expires is None:
+        expires = settings.CACHE_EXPIRES
+    backend().set(key(obj, method), value, expiration(expires))
+
+
+class Flight(object):
+    """
+    A call in progress, shared by the threads waiting for it.
+    """
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def single_flight(k, func):
+    """
+    Calls `func`, unless there's already a call for the key `k`
+    in progress. In that case, waits for it and returns (or raises)
+    the same.
+
+    Calls with different keys don't wait for each other.
+
+    @param k: The cache key of the call.
+    @param func: A callable without arguments.
+
+    @return: The `func` result.
+    """
+
+    with __flights_lock__:
+        flight = __flights__.get(k)
+        leader = flight is None
+        if leader:
+            flight = __flights__[k] = Flight()
+
+    if not leader:
+        flight.done.wait()
+        if flight.error is not None:
+            raise flight.error
+        return flight.result
+
+    try:
+        flight.result = func()
+    except BaseException as e:
+        # Also when interrupted, so the waiters don't take `None`
+        # as the result.
+        flight.error = e
+        raise
+    finally:
+        with __flights_lock__:
+            del __flights__[k]
+        flight.done.set()
+
+    return flight.result
+
+
+def revalidate(k, func):
+    """
+    Calls `func` at a background thread, unless there's already a
+    call for the key `k` in progress (see `single_flight`).
+    """
+
+    if k in __flights__:
+        return
+
+    def run():
+        try:
+            single_flight(k, func)
+        except Exception:
+            # The stale value is still served, next call tries again.
+            pass
+
+    thread = threading.Thread(target=run)
+    thread.daemon = True
+    thread.start()
+
+
+def fetcher(k, method, self, args, kwargs, expires):
+    """
+    Returns a callable that calls the cached method and caches
+    its result, if it was not cached by a previous call while
+    this one was waiting.
+    """
+
+    def fetch():
+        try:
+            value, exp = backend().entry(k, count=False)
+            if exp is None or exp > time.time():
+                return value
+        except KeyError:
+            pass
+
+        ret = method(self, *args, **kwargs)
+        backend().set(k, ret, expiration(expires))
+        return ret
+    return fetch
+
+
+def expiration(expires):
+    """
+    Returns the timestamp `expires` seconds from now, or `None`.
+    """
+
+    if expires is None:
+        return None
+    return time.time() + expires
 
 
 def cached(method):
     """
     Static memory cache system decorator.
-    """
 
-    if not USE_CACHE:
-        return method
+    Concurrent calls missing the same entry make a single
+    call to `method` (see `single_flight`).
+    """
 
     def _cache_wrapper(self, *args, **kwargs):
-        global __memcache__, __lock__
+        if not settings.USE_CACHE:
+            return method(self, *args, **kwargs)
 
-        if method.__name__ in __memcache__.get(self.code, {}):
-            return __memcache__[self.code][method.__name__]
+        k = key(self, method.__name__, args, kwargs)
+        try:
+            value = backend().get(k)
+        except KeyError:
+            pass
+        else:
+            if metrics.enabled:
+                metrics.cache(k[0] + '.' + k[2], True)
+            return value
 
-        with __lock__:
-            ret = method(self, *args, **kwargs)
-            if self.code not in __memcache__:
-                __memcache__[self.code] = dict()
-            __memcache__[self.code][method.__name__] = ret
-            return ret
+        if metrics.enabled:
+            metrics.cache(k[0] + '.' + k[2], False)
+        return single_flight(
+            k, fetcher(
+                k, method, self, args, kwargs, settings.CACHE_EXPIRES))
     return _cache_wrapper
 
 
-def timestampcache(expires):
+def timestampcache(expires, stale=0):
     """
     Timestamp based memory cache system decorator.
 
+    Concurrent calls missing the same entry make a single
+    call to the method (see `single_flight`).
+
     @param expires: expiration time in seconds.
+    @param stale: seconds an expired entry is still returned,
+        while it's updated at a background thread.
     """
 
     def _decorator_wrapper(method):
-        if not USE_CACHE:
-            return method
-
         def _cache_wrapper(self, *args, **kwargs):
-            global __memcache__, __timestamps__, __lock__
+            if not settings.USE_CACHE:
+                return method(self, *args, **kwargs)
 
-            now = time.time()
-            last_update = __timestamps__.get(
-                self.code, {}
-            ).get(
-                method.__name__, now
-            )
-
-            if last_update > now:
-                return __memcache__[self.code][method.__name__]
-
-            with __lock__:
-                ret = method(self, *args, **kwargs)
-                if self.code not in __memcache__:
-                    __memcache__[self.code] = dict()
-                    __timestamps__[self.code] = dict()
-                __memcache__[self.code][method.__name__] = ret
-                __timestamps__[self.code][method.__name__] = now + expires
-                return ret
+            k = key(self, method.__name__, args, kwargs)
+            fetch = fetcher(k, method, self, args, kwargs, expires)
+
+            try:
+                value, exp = backend().entry(k, stale)
+                if exp is not None and exp <= time.time():
+                    revalidate(k, fetch)
+            except KeyError:
+                pass
+            else:
+                if metrics.enabled:
+                    metrics.cache(k[0] + '.' + k[2], True)
+                return value
+
+            if metrics.enabled:
+                metrics.cache(k[0] + '.' + k[2], False)
+            return single_flight(k, fetch)
         return _cache_wrapper
     return _decorator_wrapper
@@ -0,0 +1,213 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Compact variants of the models.
+
+`CompactRoute`, `CompactStop` and `CompactBus` work as `Route`,
+`Stop` and `Bus`, but keep their attributes in `__slots__`,
+convert them once when loaded (floats for coordinates, a
+`datetime.time` for `hour`, a boolean for `circular`) and drop
+the object returned by the API. They're faster to create and
+use less memory, for loading the whole catalog:
+
+>>> stops = CompactStop.all()
+>>> stops[0].lat
+-5.056221
+>>> CompactRoute.get_route(401).get_buses()[0].hour
+datetime.time(12, 5)
+
+The objects linked are also compact (e.g.: the stops of a
+`CompactRoute` are `CompactStop` instances), and the buses have
+their own fleet (see `fleet.Fleet`). The variants subclass the
+methods of the models (`BaseRoute`, `BaseStop` and `BaseBus`),
+so they're not instances of `Route`, `Stop` and `Bus`.
+"""
+
+import datetime
+
+from . import fleet, network
+from .models import (
+    Model, BaseRoute, BaseStop, BaseBus, __registry_lock__, restore)
+
+
+def boolean(value):
+    """
+    Converts the API booleans, that may be strings, to `bool`.
+    """
+
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return bool(value)
+    return u'{0}'.format(value).strip().lower() in (
+        'true', 't', 's', 'sim', 'y', 'yes', '1')
+
+
+def hour(value):
+    """
+    Converts a hour like '12:05' (or '12:05:30') to a
+    `datetime.time`, keeping `value` if it's not a valid hour.
+    """
+
+    if isinstance(value, datetime.time):
+        return value
+
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.datetime.strptime(value, fmt).time()
+        except (TypeError, ValueError):
+            pass
+
+    return value
+
+
+class Compact(Model):
+    """
+    The compact variants base. The raw object is not kept and
+    the attributes out of the mapper start as `None`.
+    """
+
+    __slots__ = ()
+    __fields__ = ()
+    __extra__ = ()
+    __key__ = None
+    keep_raw = False
+
+    def __init__(self, obj=None):
+        for name in self.__extra__:
+            if not hasattr(self, name):
+                setattr(self, name, None)
+
+        super(Compact, self).__init__(obj)
+
+    def __reduce__(self):
+        # The slots out of the mapper are kept as the state.
+        state = dict((name, getattr(self, name)) for name in self.__extra__)
+        return restore, (self.__class__, self.raw(), state)
+
+    def to_python(self):
+        """
+        Same as `Model.to_python`, through the fields computed
+        by `compact`.
+        """
+
+        obj = self.obj
+        for key, attr, cast in self.__fields__:
+            value = obj[key]
+            setattr(self, attr, cast(value) if cast else value)
+
+    @classmethod
+    def build(cls, objs):
+        """
+        Same as `Model.build`, but setting the slots straight
+        from the objects, without a call to the model for each
+        one, under a single lock of the registry.
+        """
+
+        registry = cls.registry()
+        new = object.__new__
+        fields, extra, key = cls.__fields__, cls.__extra__, cls.__key__
+
+        instances = []
+        with __registry_lock__:
+            for obj in objs:
+                code = obj.get(key)
+                instance = registry.get(code)
+                if instance is None:
+                    instance = new(cls)
+                    instance.obj = None
+                    for name in extra:
+                        setattr(instance, name, None)
+                    registry[code] = instance
+
+                for field, attr, cast in fields:
+                    value = obj[field]
+                    setattr(instance, attr, cast(value) if cast else value)
+                instances.append(instance)
+
+        return instances
+
+
+def compact(cls):
+    """
+    Computes the fields of the compact variant `cls`, from its
+    `mapper`, `casts` and `__slots__` (with `obj`).
+
+    @param cls: A `Compact` subclass.
+
+    @return: `cls`.
+    """
+
+    cls.__fields__ = tuple(
+        (key, attr, cls.casts.get(attr)) for key, attr in cls.mapper.items()
+    )
+    cls.__extra__ = tuple(
+        name for name in cls.__slots__
+        if name != 'obj' and name not in cls.mapper.values()
+    )
+    cls.__key__ = cls.code_key()
+
+    return cls
+
+
+@compact
+class CompactRoute(Compact, BaseRoute):
+    """
+    The compact variant of `Route`.
+    """
+
+    __slots__ = ('obj', 'code', 'description', 'source', 'dest', 'circular')
+
+    casts = {'circular': boolean}
+
+
+@compact
+class CompactStop(Compact, BaseStop):
+    """
+    The compact variant of `Stop`, with the coordinates as
+    `float`.
+    """
+
+    __slots__ = ('obj', 'code', 'description', 'address', 'lat', 'long')
+
+    casts = {'lat': float, 'long': float}
+
+
+@compact
+class CompactBus(Compact, BaseBus):
+    """
+    The compact variant of `Bus`, with the coordinates as
+    `float` and the hour as a `datetime.time`.
+    """
+
+    __slots__ = ('obj', 'code', '__lat__', '__long__', 'hour',
+                 '__route__', '__route_code__')
+
+    casts = {'__lat__': float, '__long__': float, 'hour': hour}
+
+
+CompactRoute.stop_model = CompactStop
+CompactRoute.bus_model = CompactBus
+CompactBus.route_model = CompactRoute
+
+CompactRoute.network = CompactStop.network = network.Network(CompactRoute)
+CompactBus.fleet = fleet.Fleet(model=CompactBus)
@@ -0,0 +1,144 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Settings of the wrapper.
+
+The settings are read from the `settings` module of your
+application (see `settings.template.py`) on the first use, not
+on import. They can also be configured programmatically, taking
+precedence over the module:
+
+>>> import stranspyra
+>>> stranspyra.configure(API_KEY='...', EMAIL='...', PASSWORD='...')
+
+The settings not found in both have the values of `DEFAULTS`.
+"""
+
+import threading
+
+# Values of the settings not configured.
+DEFAULTS = {
+    'URL': 'https://api.inthegra.strans.teresina.pi.gov.br/v1',
+    'REQUEST_OPTIONS': {},
+    'TOKEN_FILE': None,
+    'RATE_LIMIT': None,
+    'RATE_BURST': None,
+    'MAX_IN_FLIGHT': None,
+    'USE_CACHE': False,
+    'CACHE_BACKEND': 'memory',
+    'CACHE_PATH': 'stranspyra-cache.db',
+    'CACHE_EXPIRES': None,
+    'CACHE_MAX_ENTRIES': 10000,
+    'CACHE_MAX_SIZE': None,
+    'SHARED_PATH': None,
+}
+
+# Marks the `settings` module as not imported yet.
+UNLOADED = object()
+
+
+class Settings(object):
+    """
+    Lazy access to the settings, as attributes
+    (e.g.: `settings.URL`).
+
+    Raises `AttributeError` for a setting not configured and
+    without default (e.g.: `API_KEY`).
+    """
+
+    def __init__(self):
+        self.__options__ = dict()
+        self.__settings__ = UNLOADED
+        self.__lock__ = threading.Lock()
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+
+        if name in self.__options__:
+            return self.__options__[name]
+
+        module = self.module()
+        if module is not None and hasattr(module, name):
+            return getattr(module, name)
+
+        if name in DEFAULTS:
+            return DEFAULTS[name]
+
+        raise AttributeError(
+            'The setting {0} is not configured, set it in settings.py '
+            'or through stranspyra.configure.'.format(name))
+
+    def module(self):
+        """
+        Returns the `settings` module, imported on the first call.
+
+        @return: A module, or `None` if there's no `settings`.
+        """
+
+        if self.__settings__ is UNLOADED:
+            with self.__lock__:
+                if self.__settings__ is UNLOADED:
+                    try:
+                        import settings
+                    except ImportError:
+                        settings = None
+                    self.__settings__ = settings
+
+        return self.__settings__
+
+    def configure(self, **options):
+        """
+        Sets the settings in `options`, over the module ones.
+        """
+
+        self.__options__.update(options)
+
+    def reset(self):
+        """
+        Discards the settings configured, keeping the module ones.
+        """
+
+        self.__options__.clear()
+
+
+settings = Settings()
+
+
+def configure(**options):
+    """
+    Configures the settings programmatically (e.g.: `API_KEY`,
+    `EMAIL`, `PASSWORD`, `URL`, `REQUEST_OPTIONS`, `USE_CACHE`),
+    over the `settings` module.
+
+    The user is authenticated again on the next request and a new
+    HTTP session is created. Set the cache settings before the
+    first cached call.
+
+    @param options: The settings, by name.
+    """
+
+    from . import api
+
+    settings.configure(**options)
+    api.close()
+    api.tokens.clear()
@@ -1,7 +1,15 @@
 
-class RouteNotFoundError(Exception):
+class NotFoundError(Exception):
+    pass
+
+
+class RouteNotFoundError(NotFoundError):
     pass
 
 
 class APIServerError(Exception):
     pass
+
+
+class SnapshotError(ValueError):
+    pass
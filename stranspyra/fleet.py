@@ -0,0 +1,250 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Shared snapshot of the whole fleet.
+
+The position of a bus is only available through `veiculos`,
+which returns all the buses. The `Fleet` keeps the last
+response, as a `tables.FleetTable`, and fetches it again at
+most once every `INTERVAL` seconds, no matter how many buses
+are read.
+
+>>> from stranspyra import fleet
+>>> fleet.default.get('02521')
+<Bus 02521 - 0401 UNIVERSIDADE>
+
+The snapshot keeps only the table: the `Bus` instances are
+created when asked (e.g.: `Snapshot.get`), from the row views.
+
+The buses can come from other source than `veiculos`, like the
+cache shared by the processes (see `shared`), through
+`Fleet.source`.
+"""
+
+import threading
+import time
+
+from .tables import FleetTable, Table
+
+# Seconds a fleet snapshot is used before fetching it again.
+INTERVAL = 30
+
+
+class Snapshot(object):
+    """
+    The fleet at a moment.
+
+    @attribute model: The model of the instances created,
+        default is `Bus`.
+    @attribute timestamp: When the buses were fetched.
+    """
+
+    def __init__(self, table, timestamp=None, model=None):
+        """
+        @constructor
+
+        @param table: A `tables.FleetTable`, or a list of `Bus`
+            instances. It's frozen (see `tables.Table.freeze`).
+        @param timestamp: When the buses were fetched, default
+            is now.
+        @param model: The model of the instances created.
+        """
+
+        if not isinstance(table, Table):
+            table = FleetTable.from_models(table)
+
+        self.model = model
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.__table__ = table.freeze()
+
+    def __len__(self):
+        return len(self.__table__)
+
+    def __iter__(self):
+        return iter(self.__table__)
+
+    def __contains__(self, code):
+        return self.__table__.position(code) is not None
+
+    def row(self, code):
+        """
+        Returns the row of the bus identified by `code`, or `None`.
+
+        @return: A `tables.BusRow`.
+        """
+
+        return self.__table__.find(code)
+
+    def get(self, code):
+        """
+        Returns the bus identified by `code`, or `None`.
+
+        @return: A instance of `model`.
+        """
+
+        row = self.__table__.find(code)
+        return None if row is None else row.to_model(self.model)
+
+    def buses(self, route_code=None):
+        """
+        Returns the buses, as instances of `model`.
+
+        @param route_code: Only the buses of this route, default
+            is all.
+        """
+
+        table = self.__table__
+        rows = table if route_code is None else table.by_route(route_code)
+        return [row.to_model(self.model) for row in rows]
+
+    def table(self):
+        """
+        Returns the buses as a `tables.FleetTable` (read-only).
+        """
+
+        return self.__table__
+
+    def age(self):
+        """
+        Returns the seconds since the buses were fetched.
+        """
+
+        return time.time() - self.timestamp
+
+
+class Fleet(object):
+    """
+    Keeps the latest `Snapshot` of the fleet.
+
+    @attribute model: The model of the instances created,
+        default is `Bus`.
+    @attribute source: A callable updating the fleet (see
+        `update`), used instead of `veiculos` when set.
+    @attribute listeners: The callables called with the previous
+        and the new snapshots on each update, at the thread
+        updating the fleet (e.g.: any call of `snapshot`), after
+        the fleet lock is released.
+    """
+
+    def __init__(self, interval=INTERVAL, model=None):
+        """
+        @constructor
+
+        @param interval: Seconds a snapshot is used before
+            fetching the buses again.
+        @param model: The model of the instances created.
+        """
+
+        self.interval = interval
+        self.model = model
+        self.listeners = []
+        self.source = None
+        self.__snapshot__ = None
+        self.__lock__ = threading.Lock()
+        # The updates made by each thread while it holds the lock.
+        self.__local__ = threading.local()
+
+    def update(self, buses, timestamp=None):
+        """
+        Replaces the snapshot by `buses`, calling each one of
+        `listeners` with the previous and the new snapshots.
+
+        @param buses: A `tables.FleetTable`, or a list of `Bus`
+            instances.
+
+        @return: The new `Snapshot`.
+        """
+
+        snapshot = Snapshot(buses, timestamp, self.model)
+        previous, self.__snapshot__ = self.__snapshot__, snapshot
+
+        pending = getattr(self.__local__, 'pending', None)
+        if pending is not None:
+            pending.append((previous, snapshot))
+        else:
+            self.notify(previous, snapshot)
+
+        return snapshot
+
+    def notify(self, previous, snapshot):
+        """
+        Calls each one of `listeners` with the `previous` and the
+        new `snapshot`.
+        """
+
+        for listener in list(self.listeners):
+            listener(previous, snapshot)
+
+    def snapshot(self, refresh=False):
+        """
+        Returns the current snapshot, fetching the buses if it's
+        older than `interval` (or if `refresh` is set), or
+        from `source`. Threads calling it at the same time make a
+        single request.
+
+        @return: A `Snapshot` instance.
+        """
+
+        snapshot = self.__snapshot__
+        if snapshot is not None and not refresh and \
+           snapshot.age() < self.interval:
+            return snapshot
+
+        # The listeners may read the fleet: the updates made under
+        # the lock are notified once it's released.
+        self.__local__.pending = pending = []
+        try:
+            with self.__lock__:
+                if self.__snapshot__ is not snapshot:
+                    # Updated by another thread while this one waited.
+                    return self.__snapshot__
+
+                if self.source is not None:
+                    self.source()
+                    return self.__snapshot__
+
+                return self.update(FleetTable.fetch())
+        finally:
+            self.__local__.pending = None
+            for previous, current in pending:
+                self.notify(previous, current)
+
+    def get(self, code):
+        """
+        Returns the bus identified by `code` at the current
+        snapshot, or `None` if it's not running.
+        """
+
+        return self.snapshot().get(code)
+
+    def row(self, code):
+        """
+        Returns the row of the bus identified by `code` at the
+        current snapshot, or `None` if it's not running.
+
+        @return: A `tables.BusRow`.
+        """
+
+        return self.snapshot().row(code)
+
+
+default = Fleet()
@@ -0,0 +1,514 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Caching gateway to the Inthegra API, for many clients.
+
+The gateway answers the same endpoints of the API, from memory.
+The fleet (`veiculos`) and the catalog (`linhas` and `paradas`)
+are fetched at a background thread, every `fleet.INTERVAL` and
+`cache.CATALOG_EXPIRES` seconds, the buses of each route
+(`veiculosLinha`) are taken from the fleet and the other
+responses (e.g.: `paradasLinha`, the searches) are fetched on
+the first request and kept until they expire, up to
+`MAX_ENTRIES` (the least recently used are dropped). So the
+requests to the API don't depend on the number of clients.
+
+The responses have an `ETag`, answering `304 Not Modified` to
+`If-None-Match`, and are compressed by gzip when the client
+accepts it.
+
+It's run with the settings of the API (see `conf`):
+
+    $ python -m stranspyra.gateway --port 8080
+
+And the clients just point to it:
+
+>>> stranspyra.configure(URL='http://127.0.0.1:8080/v1',
+...                      API_KEY='...', EMAIL='...', PASSWORD='...')
+
+The clients are not authenticated by the API: `/signin` returns
+a token of the gateway, that is not checked. With `keys`, only
+the requests with one of them as `x-api-key` are answered.
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+import zlib
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+from . import api
+from . import cache
+from . import fleet
+from .cache import CATALOG_EXPIRES
+from .conf import configure
+from .exceptions import APIServerError, NotFoundError
+
+log = logging.getLogger(__name__)
+
+PORT = 8080
+
+# Minutes a token of the gateway is valid, as `minutos` of `/signin`.
+TOKEN_MINUTES = 60
+
+# Seconds the responses are kept, by endpoint.
+EXPIRES = {
+    '/linhas': CATALOG_EXPIRES,
+    '/paradas': CATALOG_EXPIRES,
+    '/paradasLinha': CATALOG_EXPIRES,
+    '/veiculos': fleet.INTERVAL,
+}
+
+# The responses fetched at the background thread, before they
+# expire (without `busca`).
+POLLED = ('/veiculos', '/linhas', '/paradas')
+
+# Seconds between the checks of the background thread.
+CHECK_INTERVAL = 1
+
+# Max of the responses kept out of `POLLED` (e.g.: the searches).
+MAX_ENTRIES = 1024
+
+# Seconds an expired response out of `POLLED` is kept, to be
+# served if the API fails.
+STALE = 60
+
+
+class Entry(object):
+    """
+    A response of the API, ready to be sent.
+
+    @attribute body: The json encoded response.
+    @attribute etag: The `ETag` of `body`.
+    @attribute fetched: When it was fetched.
+    @attribute expires: When it expires.
+    """
+
+    def __init__(self, obj, expires):
+        self.obj = obj
+        self.body = json.dumps(obj, separators=(',', ':')).encode('utf-8')
+        self.etag = '"{0}"'.format(hashlib.sha1(self.body).hexdigest())
+        self.fetched = time.time()
+        self.expires = self.fetched + expires
+        self.__gzip__ = None
+
+    def gzip(self):
+        """
+        Returns `body` compressed by gzip, on the first call.
+        """
+
+        if self.__gzip__ is None:
+            compressor = zlib.compressobj(6, zlib.DEFLATED,
+                                          16 + zlib.MAX_WBITS)
+            self.__gzip__ = compressor.compress(self.body) + \
+                compressor.flush()
+        return self.__gzip__
+
+    def max_age(self):
+        """
+        Returns the seconds until it expires.
+        """
+
+        return max(0, int(self.expires - time.time()))
+
+    def matches(self, header):
+        """
+        If the `If-None-Match` header has the `etag`.
+        """
+
+        if not header:
+            return False
+        if header.strip() == '*':
+            return True
+
+        tags = [t.strip() for t in header.split(',')]
+        return any(t == self.etag or t == 'W/' + self.etag for t in tags)
+
+
+class Handler(BaseHTTPRequestHandler):
+    """
+    Answers the requests from the entries of `server`.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # The headers and the body are written apart, don't wait
+    # for the ACK of the headers to send the body.
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def send(self, obj, status=200):
+        body = json.dumps(obj).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_entry(self, entry):
+        self.send_header('ETag', entry.etag)
+        self.send_header('Cache-Control',
+                         'max-age={0}'.format(entry.max_age()))
+        self.send_header('Vary', 'Accept-Encoding')
+
+    def endpoint(self):
+        url = urlparse(self.path)
+        params = dict((k, v[0]) for k, v in parse_qs(url.query).items())
+        return '/' + url.path.rstrip('/').rsplit('/', 1)[-1], params
+
+    def allowed(self):
+        keys = self.server.keys
+        if keys is None or self.headers.get('x-api-key') in keys:
+            return True
+
+        self.send({'message': 'api.error.key.invalid'}, 401)
+        return False
+
+    def do_POST(self):
+        endpoint, _ = self.endpoint()
+        self.rfile.read(int(self.headers.get('Content-Length') or 0))
+
+        if not self.allowed():
+            return
+        if endpoint != '/signin':
+            return self.send({'message': 'api.error.notfound'}, 404)
+        self.send({'token': uuid.uuid4().hex, 'minutos': TOKEN_MINUTES})
+
+    def do_GET(self):
+        endpoint, params = self.endpoint()
+
+        if not self.allowed():
+            return
+        if endpoint not in self.server.endpoints:
+            return self.send({'message': 'api.error.notfound'}, 404)
+
+        try:
+            entry = self.server.get(endpoint, params.get('busca'))
+        except NotFoundError:
+            return self.send({'message': 'api.error.notfound'}, 404)
+        except APIServerError as e:
+            return self.send({'message': u'{0}'.format(e)}, 502)
+        except Exception:
+            log.exception('Error fetching %s', self.path)
+            return self.send({'message': 'api.error.gateway'}, 502)
+
+        if entry.matches(self.headers.get('If-None-Match')):
+            self.server.count('not_modified')
+            self.send_response(304)
+            self.send_entry(entry)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+
+        body = entry.body
+        gzip = 'gzip' in (self.headers.get('Accept-Encoding') or '')
+        if gzip:
+            body = entry.gzip()
+
+        self.server.count('responses')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_entry(entry)
+        if gzip:
+            self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Gateway(ThreadingMixIn, HTTPServer):
+    """
+    The gateway server.
+
+    @attribute keys: The `x-api-key` values accepted, or `None`
+        for any.
+    @attribute endpoints: The endpoints answered.
+    @attribute counts: The counters of `stats`.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=PORT, keys=None,
+                 max_entries=MAX_ENTRIES):
+        """
+        @constructor
+
+        @param host: The address listened.
+        @param port: The port listened, `0` for any free one.
+        @param keys: A list of the `x-api-key` values accepted,
+            default is any.
+        @param max_entries: Max of the responses kept, besides
+            the `POLLED` ones.
+        """
+
+        HTTPServer.__init__(self, (host, port), Handler)
+        self.keys = set(keys) if keys else None
+        self.endpoints = ('/linhas', '/paradas', '/paradasLinha',
+                          '/veiculos', '/veiculosLinha')
+        self.counts = dict(responses=0, not_modified=0, fetches=0,
+                           errors=0)
+        # The polled entries are kept apart, never dropped (see
+        # `keep`).
+        self.__polled__ = dict()
+        self.__entries__ = cache.MemoryBackend(max_entries=max_entries)
+        self.__routes__ = None, frozenset()
+        self.__lock__ = threading.Lock()
+        self.__running__ = threading.Event()
+        self.__serving__ = False
+
+    @property
+    def url(self):
+        """
+        The URL of the gateway, to be used as `settings.URL`.
+        """
+
+        return 'http://{0}:{1}/v1'.format(*self.server_address[:2])
+
+    def count(self, name):
+        with self.__lock__:
+            self.counts[name] += 1
+
+    def fetch(self, endpoint, busca=None):
+        """
+        Fetches `endpoint` from the API, replacing its entry.
+        Concurrent calls for the same entry make a single request.
+
+        @return: The new `Entry`.
+        """
+
+        def _fetch():
+            params = {} if busca is None else {'busca': busca}
+            self.count('fetches')
+            entry = Entry(api.get(endpoint, **params), EXPIRES[endpoint])
+            self.keep(endpoint, busca, entry)
+            return entry
+
+        return cache.single_flight(('gateway', endpoint, busca), _fetch)
+
+    def entry(self, endpoint, busca=None):
+        """
+        Returns the entry kept of `endpoint`, even if it has
+        expired, or `None`.
+        """
+
+        if busca is None and endpoint in POLLED:
+            return self.__polled__.get(endpoint)
+
+        try:
+            return self.__entries__.entry((endpoint, busca), count=False)[0]
+        except KeyError:
+            return None
+
+    def keep(self, endpoint, busca, entry):
+        """
+        Keeps `entry` as the response of `endpoint`. The polled
+        ones are never dropped, the others are dropped `STALE`
+        seconds after they expire or when there're more than
+        `max_entries`.
+        """
+
+        if busca is None and endpoint in POLLED:
+            self.__polled__[endpoint] = entry
+        else:
+            self.__entries__.set((endpoint, busca), entry,
+                                 entry.expires + STALE)
+
+    def route_codes(self):
+        """
+        Returns the codes of the routes of the `linhas` entry.
+
+        @return: A `frozenset`.
+        """
+
+        routes = self.get('/linhas')
+        entry, codes = self.__routes__
+        if entry is not routes:
+            codes = frozenset(r['CodigoLinha'] for r in routes.obj)
+            self.__routes__ = routes, codes
+        return codes
+
+    def get(self, endpoint, busca=None):
+        """
+        Returns the entry of `endpoint`, fetching it if it's not
+        kept or has expired. If the API fails, the expired entry
+        is returned, if there's one.
+
+        @param endpoint: The endpoint (e.g.: '/linhas').
+        @param busca: The `busca` param of the request.
+
+        @return: A `Entry` instance.
+        """
+
+        if endpoint == '/veiculosLinha':
+            return self.route_buses(busca)
+
+        entry = self.entry(endpoint, busca)
+        if entry is not None and entry.expires > time.time():
+            return entry
+
+        try:
+            return self.fetch(endpoint, busca)
+        except Exception:
+            if entry is None:
+                raise
+            self.count('errors')
+            log.warning('Serving an expired %s', endpoint, exc_info=True)
+            return entry
+
+    def route_buses(self, code):
+        """
+        Returns the entry of the buses of the route `code`, as
+        `veiculosLinha`, taken from the `veiculos` entry.
+
+        Raises `NotFoundError` if the route is not at `linhas`.
+        """
+
+        if code not in self.route_codes():
+            raise NotFoundError(u'Linha {0} não encontrada.'.format(code))
+
+        buses = self.get('/veiculos')
+
+        entry = self.entry('/veiculosLinha', code)
+        if entry is not None and entry.fetched >= buses.fetched:
+            return entry
+
+        obj = {'code': 130}
+        for route in buses.obj:
+            if route['Linha']['CodigoLinha'] == code:
+                obj = route
+                break
+
+        entry = Entry(obj, buses.expires - time.time())
+        entry.fetched = buses.fetched
+        self.keep('/veiculosLinha', code, entry)
+        return entry
+
+    def refresh(self):
+        """
+        Fetches the entries of `POLLED` that have expired, or are
+        about to expire in `CHECK_INTERVAL` seconds, and drops the
+        others that have expired (see `keep`).
+        """
+
+        self.__entries__.purge()
+
+        for endpoint in POLLED:
+            entry = self.entry(endpoint)
+            if entry is None or \
+               entry.expires - CHECK_INTERVAL <= time.time():
+                try:
+                    self.fetch(endpoint)
+                except Exception:
+                    self.count('errors')
+                    log.exception('Error fetching %s', endpoint)
+
+    def poll(self):
+        while not self.__running__.wait(CHECK_INTERVAL):
+            self.refresh()
+
+    def stats(self):
+        """
+        Returns the counters of the gateway.
+
+        @return: A `dict` with the number of `responses`, the
+            `not_modified` responses, the `fetches` from the API,
+            the `errors`, the `entries` kept and the `evictions`
+            of entries (see `max_entries`).
+        """
+
+        with self.__lock__:
+            stats = dict(self.counts)
+        stats['entries'] = len(self.__polled__) + len(self.__entries__)
+        stats['evictions'] = self.__entries__.evictions
+        return stats
+
+    def start(self, background=True):
+        """
+        Fetches the polled entries and starts polling them.
+
+        @param background: If it also serves at a background
+            thread, otherwise `serve_forever` must be called.
+        """
+
+        self.refresh()
+
+        self.__running__.clear()
+        self.__serving__ = background
+        targets = [self.poll] + ([self.serve_forever] if background else [])
+        for target in targets:
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        return self
+
+    def stop(self):
+        """
+        Stops polling and serving, and closes the socket.
+        """
+
+        self.__running__.set()
+        if self.__serving__:
+            self.shutdown()
+            self.__serving__ = False
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Caching gateway to the Inthegra API.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--upstream', default=None,
+                        help='URL of the API, default is settings.URL')
+    parser.add_argument('--key', action='append', dest='keys',
+                        help='x-api-key accepted (repeatable), '
+                             'default is any')
+    args = parser.parse_args()
+
+    if args.upstream:
+        configure(URL=args.upstream)
+
+    logging.basicConfig(level=logging.INFO)
+    gateway = Gateway(args.host, args.port, args.keys)
+    log.info('Serving the Inthegra API at %s', gateway.url)
+    try:
+        gateway.start(background=False)
+        gateway.serve_forever()
+    except KeyboardInterrupt:
+        gateway.stop()
+
+
+if __name__ == '__main__':
+    main()
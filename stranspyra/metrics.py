@@ -0,0 +1,384 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Instrumentation of the hot paths of the wrapper.
+
+Disabled by default, the instrumented code only checks
+`enabled`. When enabled, the metrics below are kept and each
+event is sent to the hooks subscribed:
+
+    stranspyra_request_seconds{endpoint}     API round-trips
+    stranspyra_response_bytes_total{endpoint}
+    stranspyra_decode_seconds{endpoint}      JSON decoding
+    stranspyra_auth_total{reason}            logins ('login', 'refresh')
+    stranspyra_token_expired_total           tokens refused by the API
+    stranspyra_cache_hits_total{method}      by cached method
+    stranspyra_cache_misses_total{method}
+    stranspyra_parse_seconds{method}         `Model.load`
+    stranspyra_nearest_seconds{method}       `nearest` of the models
+
+>>> from stranspyra import metrics
+>>> metrics.enable()
+>>> metrics.subscribe(lambda event, data: log.debug('%s %r', event, data))
+>>> Stop.nearest(-5.05, -42.79)
+>>> print(metrics.export())  # Prometheus text format
+# TYPE stranspyra_request_seconds histogram
+stranspyra_request_seconds_bucket{endpoint="/paradas",le="0.005"} 0
+...
+"""
+
+import functools
+import logging
+import threading
+import time
+
+log = logging.getLogger(__name__)
+
+# If the events are recorded, checked by the instrumented code.
+enabled = False
+
+# Upper bounds of the histograms buckets, in seconds.
+BUCKETS = (.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10)
+
+# Type and description of each metric.
+METRICS = {
+    'stranspyra_request_seconds': (
+        'histogram', 'Latency of the requests to the API.'),
+    'stranspyra_response_bytes_total': (
+        'counter', 'Bytes received from the API.'),
+    'stranspyra_decode_seconds': (
+        'histogram', 'Time decoding the JSON responses.'),
+    'stranspyra_auth_total': (
+        'counter', 'Logins to the API.'),
+    'stranspyra_token_expired_total': (
+        'counter', 'Requests refused for an expired token.'),
+    'stranspyra_cache_hits_total': (
+        'counter', 'Calls answered by the cache.'),
+    'stranspyra_cache_misses_total': (
+        'counter', 'Calls not found at the cache.'),
+    'stranspyra_parse_seconds': (
+        'histogram', 'Time mapping the responses to models.'),
+    'stranspyra_nearest_seconds': (
+        'histogram', 'Time searching the nearest objects.'),
+}
+
+
+class Histogram(object):
+    """
+    Counts of observed values by bucket, with their sum.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+
+        self.counts[i] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """
+        Returns the count of the values up to each bucket bound,
+        the last is `+Inf`.
+
+        @return: A list of tuples of bound and count.
+        """
+
+        total, result = 0, []
+        for bound, n in zip(self.buckets + (float('inf'),), self.counts):
+            total += n
+            result.append((bound, total))
+        return result
+
+
+class Registry(object):
+    """
+    Keeps the counters and histograms, by name and labels.
+    """
+
+    def __init__(self):
+        self.counters = dict()
+        self.histograms = dict()
+        self.__lock__ = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        """
+        Increments the counter `name` of `labels`.
+        """
+
+        k = (name, tuple(sorted(labels.items())))
+        with self.__lock__:
+            self.counters[k] = self.counters.get(k, 0) + value
+
+    def observe(self, name, value, **labels):
+        """
+        Adds `value` to the histogram `name` of `labels`.
+        """
+
+        k = (name, tuple(sorted(labels.items())))
+        with self.__lock__:
+            histogram = self.histograms.get(k)
+            if histogram is None:
+                histogram = self.histograms[k] = Histogram()
+            histogram.observe(value)
+
+    def clear(self):
+        """
+        Resets all the metrics.
+        """
+
+        with self.__lock__:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        """
+        Returns the metrics as plain values.
+
+        @return: A `dict` of `counters` (value by name and labels)
+            and `histograms` (`count` and `sum` by name and labels).
+        """
+
+        with self.__lock__:
+            return {
+                'counters': dict(self.counters),
+                'histograms': dict(
+                    (k, {'count': h.count, 'sum': h.sum})
+                    for k, h in self.histograms.items()),
+            }
+
+    def export(self):
+        """
+        Returns the metrics in the Prometheus text format.
+
+        @return: A `str`.
+        """
+
+        with self.__lock__:
+            # The lines of each metric, by labels.
+            series = dict()
+            for (name, labels), value in self.counters.items():
+                series.setdefault(name, []).append((labels, [
+                    '{0}{1} {2}'.format(name, format_labels(labels), value)
+                ]))
+
+            for (name, labels), h in self.histograms.items():
+                lines = []
+                for bound, count in h.cumulative():
+                    le = labels + (('le', format_bound(bound)),)
+                    lines.append('{0}_bucket{1} {2}'.format(
+                        name, format_labels(le), count))
+                lines.append('{0}_sum{1} {2!r}'.format(
+                    name, format_labels(labels), h.sum))
+                lines.append('{0}_count{1} {2}'.format(
+                    name, format_labels(labels), h.count))
+                series.setdefault(name, []).append((labels, lines))
+
+        out = []
+        for name in sorted(series):
+            kind, description = METRICS.get(name, ('untyped', name))
+            out.append('# HELP {0} {1}'.format(name, description))
+            out.append('# TYPE {0} {1}'.format(name, kind))
+            for _, lines in sorted(series[name], key=lambda x: x[0]):
+                out.extend(lines)
+
+        return '\n'.join(out) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(
+        '{0}="{1}"'.format(k, u'{0}'.format(v).replace('\\', '\\\\')
+                           .replace('"', '\\"').replace('\n', '\\n'))
+        for k, v in labels) + '}'
+
+
+def format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+
+registry = Registry()
+__hooks__ = []
+
+
+def enable():
+    """
+    Starts recording the events.
+    """
+
+    global enabled
+    enabled = True
+
+
+def disable():
+    """
+    Stops recording the events, keeping the metrics recorded.
+    """
+
+    global enabled
+    enabled = False
+
+
+def subscribe(hook):
+    """
+    Calls `hook(event, data)` for each event recorded, where
+    `event` is 'request', 'decode', 'auth', 'token_expired',
+    'cache', 'parse' or 'nearest' and `data` a `dict`.
+    """
+
+    __hooks__.append(hook)
+
+
+def unsubscribe(hook):
+    """
+    Stops calling `hook`.
+    """
+
+    if hook in __hooks__:
+        __hooks__.remove(hook)
+
+
+def emit(event, **data):
+    # A failing hook doesn't break the instrumented code, nor
+    # the other hooks.
+    for hook in list(__hooks__):
+        try:
+            hook(event, data)
+        except Exception:
+            log.exception('Metrics hook %r failed on %s', hook, event)
+
+
+def request(endpoint, seconds, size):
+    """
+    Records a request to `endpoint`, that took `seconds` and
+    received `size` bytes.
+    """
+
+    registry.observe('stranspyra_request_seconds', seconds,
+                     endpoint=endpoint)
+    registry.inc('stranspyra_response_bytes_total', size, endpoint=endpoint)
+    emit('request', endpoint=endpoint, seconds=seconds, size=size)
+
+
+def decode(endpoint, seconds):
+    """
+    Records the decoding of a response of `endpoint`.
+    """
+
+    registry.observe('stranspyra_decode_seconds', seconds,
+                     endpoint=endpoint)
+    emit('decode', endpoint=endpoint, seconds=seconds)
+
+
+def auth(reason):
+    """
+    Records a login, `reason` is 'login' (there was no token)
+    or 'refresh'.
+    """
+
+    registry.inc('stranspyra_auth_total', reason=reason)
+    emit('auth', reason=reason)
+
+
+def token_expired(endpoint):
+    """
+    Records a request to `endpoint` refused for an expired token.
+    """
+
+    registry.inc('stranspyra_token_expired_total')
+    emit('token_expired', endpoint=endpoint)
+
+
+def cache(method, hit):
+    """
+    Records a call of a cached `method` (e.g.: 'Route.get_stops').
+    """
+
+    if hit:
+        registry.inc('stranspyra_cache_hits_total', method=method)
+    else:
+        registry.inc('stranspyra_cache_misses_total', method=method)
+    emit('cache', method=method, hit=hit)
+
+
+def timed(event):
+    """
+    Decorator recording the time of the calls of a class method
+    at `stranspyra_<event>_seconds`, by 'Class.method'.
+
+    >>> @classmethod
+    ... @timed('nearest')
+    ... def nearest(cls, lat, long):
+    """
+
+    name = 'stranspyra_{0}_seconds'.format(event)
+
+    def _decorator_wrapper(method):
+        @functools.wraps(method)
+        def _timed_wrapper(cls, *args, **kwargs):
+            if not enabled:
+                return method(cls, *args, **kwargs)
+
+            start = time.time()
+            try:
+                return method(cls, *args, **kwargs)
+            finally:
+                seconds = time.time() - start
+                label = '{0}.{1}'.format(cls.__name__, method.__name__)
+                registry.observe(name, seconds, method=label)
+                emit(event, method=label, seconds=seconds)
+        return _timed_wrapper
+    return _decorator_wrapper
+
+
+def snapshot():
+    """
+    Returns the metrics recorded (see `Registry.snapshot`).
+    """
+
+    return registry.snapshot()
+
+
+def export():
+    """
+    Returns the metrics recorded in the Prometheus text format.
+    """
+
+    return registry.export()
+
+
+def reset():
+    """
+    Discards the metrics recorded.
+    """
+
+    registry.clear()
@@ -38,12 +38,63 @@ ALVORADA/MUTIRAO - EXT 01>]
 
 """
 
-from geopy.distance import distance
 import itertools
+import operator
+import threading
+import time
+import weakref
+from multiprocessing.pool import ThreadPool
 
 from . import api
-from .exceptions import RouteNotFoundError
-from .cache import cached, timestampcache
+from . import batch
+from . import cache
+from . import fleet
+from . import metrics
+from . import network
+from . import planner
+from . import spatial
+from .exceptions import NotFoundError, RouteNotFoundError
+from .cache import cached, timestampcache, CATALOG_EXPIRES
+from .search import SearchIndex
+from .tables import FleetTable
+from .spatial import distance
+
+
+# Seconds the buses of a route are cached (see `Route.get_buses`).
+BUSES_EXPIRES = 30
+
+__registries__ = dict()
+__registry_lock__ = threading.RLock()
+
+
+def restore(cls, obj, state):
+    """
+    Returns the instance of `cls` with the code of `obj`, for the
+    unpickled objects. If there's one alive, it's returned as it
+    is, an older state (e.g.: from a persistent cache) doesn't
+    replace the current one. Otherwise it's created from `obj`
+    and `state`.
+
+    @param cls: The model.
+    @param obj: The object of the API, see `Model.raw`.
+    @param state: The attributes of the instance pickled.
+
+    @return: A instance of `cls`.
+    """
+
+    registry = cls.registry()
+    code = obj.get(cls.code_key())
+
+    with __registry_lock__:
+        instance = registry.get(code)
+        if instance is not None:
+            return instance
+
+        instance = cls(obj)
+        for name, value in state.items():
+            setattr(instance, name, value)
+
+    return instance
 
 
 class Model(object):
@@ -59,8 +110,35 @@ class Model(object):
     of the Inthegra API. The keys are all in portuguese and CamelCase style.
     """
 
+    __slots__ = ('__weakref__',)
+
     endpoint = None
     mapper = {}
+    casts = {}
+    keep_raw = True
+    search_fields = ()
+    __search__ = None
+
+    def __new__(cls, obj=None):
+        """
+        Returns the instance of `cls` with the code of `obj`, if
+        there's one alive, so that each object of the API has a
+        single instance (updated in place by `__init__`).
+        """
+
+        if not obj:
+            return super(Model, cls).__new__(cls)
+
+        registry = cls.registry()
+        code = obj.get(cls.code_key())
+
+        with __registry_lock__:
+            instance = registry.get(code)
+            if instance is None:
+                instance = super(Model, cls).__new__(cls)
+                registry[code] = instance
+
+        return instance
 
     def __init__(self, obj=None):
         """
@@ -73,31 +151,146 @@ class Model(object):
         self.obj = obj
         if self.obj:
             self.to_python()
+            if not self.keep_raw:
+                self.obj = None
+
+    def __reduce__(self):
+        # Unpickled objects are also the registered ones, see
+        # `restore`.
+        return restore, (self.__class__, self.raw(), self.__dict__)
+
+    def raw(self):
+        """
+        Returns the object as returned by the Inthegra API. If it
+        was not kept (see `keep_raw`), it's rebuilt from the
+        attributes of the `mapper`.
+
+        @return: A `dict`.
+        """
+
+        if self.obj:
+            return self.obj
+
+        return dict(
+            (key, getattr(self, attr)) for key, attr in self.mapper.items()
+        )
+
+    @classmethod
+    def registry(cls):
+        """
+        Returns the instances of the model alive, by code.
+
+        @return: A `weakref.WeakValueDictionary`.
+        """
+
+        registry = __registries__.get(cls)
+        if registry is None:
+            with __registry_lock__:
+                registry = __registries__.setdefault(
+                    cls, weakref.WeakValueDictionary())
+
+        return registry
+
+    @classmethod
+    def code_key(cls):
+        """
+        Returns the API key mapped to `code`.
+        """
+
+        for key, attr in cls.mapper.items():
+            if attr == 'code':
+                return key
+
+    @classmethod
+    def get(cls, code):
+        """
+        Returns the instance identified by `code`, from the
+        instances already loaded. If it's not loaded, loads
+        all the elements of the endpoint (see `Model.all`).
+
+        @param code: The object code.
+
+        @return: A instance of the model.
+
+        Raises `NotFoundError` if there's no such object.
+        """
+
+        obj = cls.registry().get(code)
+        if obj is None:
+            # Looked up at the list, the registry keeps weak
+            # references, the instances may be gone without it.
+            obj = next((o for o in cls.all() if o.code == code), None)
+
+        if obj is None:
+            raise NotFoundError(
+                '{0} {1} não encontrado.'.format(cls.__name__, code))
+
+        return obj
 
     def to_python(self):
         """
         Maps the Inthegra's endpoint object to Python attributes
         of the `mapper`.
 
-        Note: It does not make casting yet.
+        The attributes in `casts` are converted by its callable,
+        the others are kept as returned by the API.
         """
 
         for key, attr in self.mapper.items():
-            setattr(self, attr, self.obj[key])
+            value = self.obj[key]
+            if attr in self.casts:
+                value = self.casts[attr](value)
+            setattr(self, attr, value)
 
     @classmethod
+    @timestampcache(CATALOG_EXPIRES)
     def all(cls):
         """
         All the endpoints of the API returns all of its elements if
         called without params. This method returns all elements of
         a endpoint as objects.
 
+        This method is cached for `cache.CATALOG_EXPIRES` seconds,
+        for each model. The search index (see `Model.search_index`)
+        is rebuilt from the elements retrieved.
+
         @return: A list of instances of the model.
         """
 
         info = api.get(cls.endpoint)
 
-        return map(cls, info)
+        objs = cls.load(info)
+        if cls.search_fields:
+            cls.__search__ = SearchIndex(objs, cls.search_fields)
+
+        return objs
+
+    @classmethod
+    @metrics.timed('parse')
+    def load(cls, info):
+        """
+        Maps a list of objects returned by the endpoint to
+        instances of the model.
+
+        @param info: A json decoded list from the endpoint.
+
+        @return: A list of instances of the model.
+        """
+
+        return cls.build(info)
+
+    @classmethod
+    def build(cls, objs):
+        """
+        Creates the instances of the objects returned by the API,
+        the same as calling the model for each one (see `load`).
+
+        @param objs: A list of objects of the endpoint.
+
+        @return: A list of instances of the model.
+        """
+
+        return [cls(obj) for obj in objs]
 
     def __eq__(self, other):
         """
@@ -112,16 +305,30 @@ class Model(object):
         """
         return self.code == other.code
 
+    def __hash__(self):
+        return hash(self.code)
+
     def update(self):
         """
-        Retrieves all the elements of the endpoint, search
-        for the current one and updates.
+        Updates the object from the elements of the endpoint
+        loaded by `Model.all` (cached, see `cache.CATALOG_EXPIRES`,
+        fetched again if the cache is disabled).
+
+        Raises `NotFoundError` if the object is no longer at the
+        endpoint.
         """
 
-        objs = self.__class__.all()
-        this = filter(lambda x: x == self, objs)
-        self.obj = this[0].obj
+        # Not through `get`: the registry would return `self`.
+        this = next(
+            (o for o in self.__class__.all() if o.code == self.code), None)
+        if this is None:
+            raise NotFoundError('{0} {1} não encontrado.'.format(
+                self.__class__.__name__, self.code))
+
+        self.obj = this.raw()
         self.to_python()
+        if not self.keep_raw:
+            self.obj = None
 
     @classmethod
     def search(cls, pattern):
@@ -133,11 +340,48 @@ class Model(object):
             You can use the code of some object or something
             like a neighborhood for `Route`.
 
+        If the search index of the model is loaded (see
+        `Model.search_index`), the search is made locally,
+        without any request.
+
         @return: A list of instances of `cls`.
         """
+        index = cls.search_index()
+        if index is not None:
+            return index.search(pattern)
+
         info = api.get(cls.endpoint, busca=pattern)
 
-        return map(cls, info)
+        return cls.load(info)
+
+    @classmethod
+    def search_index(cls, load=False):
+        """
+        Returns the local search index of the model, over the
+        `search_fields` of all its elements. It's built when
+        `Model.all` retrieves the elements, and rebuilt when it
+        expires with them (see `cache.CATALOG_EXPIRES`).
+
+        @param load: If the index must be built now, when
+            it's not loaded.
+
+        @return: A `SearchIndex` instance, or `None`
+            if it's not loaded.
+        """
+
+        if not cls.search_fields:
+            return None
+
+        index = cls.__search__
+        if (index is None and load) or \
+           (index is not None and index.age() >= CATALOG_EXPIRES):
+            objs = cls.all()
+            if cls.__search__ is index:
+                # Cached elements, `Model.all` didn't rebuild it.
+                cls.__search__ = SearchIndex(objs, cls.search_fields)
+            index = cls.__search__
+
+        return index
 
     @classmethod
     def filter(cls, func):
@@ -153,17 +397,14 @@ class Model(object):
         return filter(func, cls.all())
 
 
-class Route(Model):
+class BaseRoute(Model):
     """
-    Provides a model to access the endpoint `linhas`.
-
-    @attribute code: A unique `str` that identifies the route (e.g.: '0401').
-    @attribute description: A `str` route description (e.g.: 'UNIVERSIDADE').
-    @attribute source: A `str` that identifies the route's start point.
-    @attribute dest: A `str` that identifies the route's end point.
-    @attribute circular: A boolean, if the route returns to the source.
+    The methods of `Route`, without the instance attributes, so the
+    compact variant keeps them in slots (see `compact`).
     """
 
+    __slots__ = ()
+
     endpoint = '/linhas'
     mapper = {
         'CodigoLinha': 'code',
@@ -172,17 +413,22 @@ class Route(Model):
         'Retorno': 'dest',
         'Circular': 'circular'
     }
+    search_fields = ('code', 'description', 'source', 'dest')
 
     @classmethod
     def traceroute(self, source, dest):
         """
         Trace a route between `source` and `dest`.
 
-        First, find the nearest stop to `source` and the nearest to `dest`
+        First, plan a trip without transfers through `planner.default`,
+        considering the stops around `source` and `dest`. Otherwise,
+        find the nearest stop to `source` and the nearest to `dest`
         and try to find a common route to both. Otherwise, fallbacks searching
         for all routes of the `source` stop and `dest` stop, choosing the one
         what is nearest to the `source` or `dest`.
 
+        For trips with transfers, see `Route.plan`.
+
         @param source: a pair latitude and longitude
         @param dest: a pair latitude and longitude
 
@@ -190,6 +436,17 @@ class Route(Model):
             (<dest stop>, <distance to the nearest stop>), <route>)
         """
 
+        trips = planner.default.plan(source, dest, transfers=0, limit=1)
+        if trips:
+            trip = trips[0]
+            return (
+                (trip.source, distance(
+                    (trip.source.lat, trip.source.long), source)),
+                (trip.dest, distance(
+                    (trip.dest.lat, trip.dest.long), dest)),
+                trip.routes[0]
+            )
+
         sourcestop, dsrc = Stop.nearest(source[0], source[1])
         deststop, ddst = Stop.nearest(dest[0], dest[1])
         sourceroutes = sourcestop.get_routes()
@@ -199,21 +456,24 @@ class Route(Model):
             if i == j:
                 return (sourcestop, dsrc), (deststop, ddst), i
 
+        # Compared by the distance only, the models have no order.
+        first = operator.itemgetter(0)
         dist, stop, route = min(
-            min(
+            min((
                 Stop.nearest(
                     source[0],
                     source[1],
                     route=route
                 )[::-1] + (route,) for route in destroutes
-            ),
-            min(
+            ), key=first),
+            min((
                 Stop.nearest(
                     dest[0],
                     dest[1],
                     route=route
                 )[::-1] + (route,) for route in sourceroutes
-            )
+            ), key=first),
+            key=first
         )
 
         sourcestop = Stop.nearest(source[0], source[1], route=route)
@@ -221,56 +481,198 @@ class Route(Model):
 
         return sourcestop, deststop, route
 
+    @classmethod
+    def plan(cls, source, dest, transfers=2, limit=3):
+        """
+        Plans trips between `source` and `dest`, with at most
+        `transfers` transfers, through `planner.default`.
+
+        The first call builds the graph of the routes network,
+        the next ones take a few milliseconds.
+
+        @param source: a pair latitude and longitude
+        @param dest: a pair latitude and longitude
+        @param transfers: the max number of transfers.
+        @param limit: the max number of itineraries.
+
+        @return: A list of `planner.Itinerary`, from the fastest.
+        """
+
+        return planner.default.plan(source, dest, transfers, limit)
+
+    @classmethod
+    def plan_many(cls, pairs, transfers=2, limit=3, processes=None):
+        """
+        Plans trips for many pairs of points, through
+        `planner.default`, split between worker processes.
+
+        @param pairs: A iterable of pairs `(source, dest)`.
+        @param transfers: the max number of transfers.
+        @param limit: the max number of itineraries of each pair.
+        @param processes: the number of workers, default is the
+            number of CPUs.
+
+        @return: A generator of tuples with the position of the
+            pair at `pairs` and a list of `planner.Itinerary`,
+            as soon as each one is planned.
+        """
+
+        return planner.default.plan_many(
+            pairs, transfers, limit, processes)
+
+    @classmethod
+    def prefetch_stops(cls, routes=None, refresh=False,
+                       workers=network.WORKERS):
+        """
+        Fetches the stops of many routes at once, through `workers`
+        threads, indexing them at the `network` and caching them as
+        `get_stops` would. The routes already fetched are not fetched
+        again, unless `refresh` is set.
+
+        >>> stops = Route.prefetch_stops()
+        >>> stops[Route.get_route(401)][:2]
+        [<Stop 2244 PC1 UFPI>, <Stop 875 RUA DIRCE DE OLIVEIRA 4 >]
+
+        @param routes: A list of `Route` instances, default is all.
+        @param refresh: If the routes already fetched must be
+            fetched again.
+        @param workers: The number of threads fetching at once.
+
+        @return: A `dict` of the list of stops, by route.
+        """
+
+        cls.network.load(routes, refresh=refresh, workers=workers)
+        if routes is None:
+            routes = cls.network.all()
+
+        result = dict()
+        for route in routes:
+            result[route] = cls.network.stops(route)
+            cache.store(route, 'get_stops', result[route])
+
+        return result
+
+    @classmethod
+    def prefetch_buses(cls, routes=None, workers=network.WORKERS):
+        """
+        Fetches the buses of many routes at once, caching them as
+        `get_buses` would.
+
+        The buses of all routes (default) are fetched by a single
+        request to `veiculos`, otherwise each route is fetched
+        from `veiculosLinha` through `workers` threads.
+
+        @param routes: A list of `Route` instances, default is all.
+        @param workers: The number of threads fetching at once.
+
+        @return: A `dict` of the list of buses, by route.
+        """
+
+        if routes is None:
+            result = dict((route, []) for route in cls.all())
+            routes = dict((route.code, route) for route in result)
+            for bus in cls.bus_model.all():
+                route = routes.get(bus.__route_code__)
+                if route is not None:
+                    bus.__route__ = route
+                    result[route].append(bus)
+        else:
+            routes = list(routes)
+            pool = ThreadPool(max(min(workers, len(routes)), 1))
+            try:
+                buses = pool.map(lambda route: route.parse_buses(
+                    api.get('/veiculosLinha', busca=route.code)), routes)
+            finally:
+                pool.close()
+            result = dict(zip(routes, buses))
+
+        for route, buses in result.items():
+            cache.store(route, 'get_buses', buses, BUSES_EXPIRES)
+
+        return result
+
     @cached
     def get_stops(self):
         """
         Return all the stops of a route, using `paradasLinha` endpoint.
 
         This method is permanently cached when this is called for a
-        object, and it's cached for that object.
+        object, and it's cached for that object. The stops are also
+        indexed at the `network` of the model (`network.default`),
+        if it's already loaded the request is not made.
+
+        To fetch the stops of many routes, see `prefetch_stops`.
 
         @return: A list of `Stop` instances.
         """
 
-        info = api.get('/paradasLinha', busca=self.code)
+        return self.network.stops(self)
+
+    def parse_stops(self, info):
+        """
+        Maps the object returned by `paradasLinha` to a list of
+        `Stop` instances.
+
+        @param info: A json decoded object from `paradasLinha`.
+
+        @return: A list of `Stop` instances.
+        """
 
         # Handling a unknown erro on Inthegra API
         # Bad bad documented?
         if info.get('code', 0) == 130:
             return []
 
-        return map(Stop, info['Paradas'])
+        return self.stop_model.load(info['Paradas'])
 
-    @timestampcache(30)
+    @timestampcache(BUSES_EXPIRES)
     def get_buses(self):
         """
         Return all the buses of a route, using `veiculosLinha` endpoint.
 
-        This method is cached for 30 seconds, for the object from it was
-        called.
+        This method is cached for `BUSES_EXPIRES` seconds, for the
+        object from it was called. To fetch the buses of many routes,
+        see `prefetch_buses`. When the fleet has a `source` (see
+        `Bus.all`), the buses are taken from it.
 
         @return: A list of `Bus` instances.
         """
 
+        buses = self.bus_model.fleet
+        if buses.source is not None:
+            return buses.snapshot().buses(self.code)
+
         info = api.get('/veiculosLinha', busca=self.code)
 
+        return self.parse_buses(info)
+
+    def parse_buses(self, info):
+        """
+        Maps the object returned by `veiculosLinha` to a list of
+        `Bus` instances of this route.
+
+        @param info: A json decoded object from `veiculosLinha`.
+
+        @return: A list of `Bus` instances.
+        """
+
         if info.get('code', 0) == 130:
             return []
 
-        buses = []
-        for i in info['Linha']['Veiculos']:
-            bus = Bus(i)
+        buses = self.bus_model.build(info['Linha']['Veiculos'])
+        for bus in buses:
             # It's saves the real route at `__route__`, cause
             # get_route is a cached-lazy method.
+            bus.__route_code__ = self.code
             bus.__route__ = self
-            buses.append(bus)
 
         return buses
 
     @classmethod
     def get_route(cls, route):
         """
-        Return the first route that `code` matches exactly with `route`.
+        Return the route that `code` matches exactly with `route`,
+        from the loaded routes (see `Model.get`).
 
         You can use a int with `route` too:
 
@@ -284,18 +686,20 @@ class Route(Model):
         Raises `RouteNotFoundError` if no route was found.
         """
 
-        lines = cls.search(route)
-        for i in lines:
-            if isinstance(route, int):
+        code = str(route).zfill(4) if isinstance(route, int) else route
+
+        try:
+            return cls.get(code)
+        except NotFoundError:
+            pass
+
+        if isinstance(route, int):
+            for i in list(cls.registry().values()):
                 try:
                     if int(i.code) == route:
                         return i
                 except ValueError:
-                    if i.code == str(route).zfill(4):
-                        return i
-            else:
-                if route == i.code:
-                    return i
+                    pass
 
         raise RouteNotFoundError('Linha {0} não encontrada.'.format(route))
 
@@ -303,17 +707,26 @@ class Route(Model):
         return u'<Route {0} {1}>'.format(self.code, self.description)
 
 
-class Stop(Model):
+class Route(BaseRoute):
     """
-    Model for `paradas` endpoint.
+    Provides a model to access the endpoint `linhas`.
 
-    @attribute code: A unique `int` that identifies the stop.
-    @attribute description: A `str` description.
-    @attribute address: A `str`, the stop's address location.
-    @attribute lat: A `float` coercible `str`.
-    @attribute long: A `float` coercible `str`.
+    @attribute code: A unique `str` that identifies the route (e.g.: '0401').
+    @attribute description: A `str` route description (e.g.: 'UNIVERSIDADE').
+    @attribute source: A `str` that identifies the route's start point.
+    @attribute dest: A `str` that identifies the route's end point.
+    @attribute circular: A boolean, if the route returns to the source.
+    """
+
+
+class BaseStop(Model):
+    """
+    The methods of `Stop`, without the instance attributes (see
+    `BaseRoute`).
     """
 
+    __slots__ = ()
+
     endpoint = '/paradas'
     mapper = {
         'CodigoParada': 'code',
@@ -322,6 +735,11 @@ class Stop(Model):
         'Lat': 'lat',
         'Long': 'long'
     }
+    search_fields = ('code', 'description', 'address')
+    __spatial__ = None
+    __spatial_time__ = 0
+    __spatial_lock__ = threading.Lock()
+    __engine__ = None
 
     def __repr__(self):
         return u'<Stop {0} {1}>'.format(self.code, self.description)
@@ -331,31 +749,26 @@ class Stop(Model):
         """
         Returns all the routes that have this stop.
 
-        Warning: Don't use that if it's not required.
-            This method is too slow and several requests.
-            However, it's useful to find what bus should
-            be got.
+        The routes come from the `network` of the model
+        (`network.default`). The first call loads it, fetching the
+        stops of every route in parallel, the next ones are just
+        a lookup.
 
         @return: A list of `Route` instances.
         """
-        # FIXME: **too slow**
 
-        lines = Route.all()
-        r = []
-        for line in lines:
-            if filter(lambda x: x == self, line.get_stops()):
-                r.append(line)
-
-        return r
+        return self.network.routes(self)
 
     @classmethod
+    @metrics.timed('nearest')
     def nearest(cls, lat, long, **kwargs):
         """
         Search for the nearest stop from `lat` and `long`
         params.
 
         You should specify the stops to search, default is
-        `Stop.all()`.
+        `Stop.all()`, searched through the spatial index
+        (see `Stop.index`).
 
         @param lat: A float coercible value of latitude (eg.: -5.065533).
         @param long: A float coercible value of longitude (eg.: -42.065533).
@@ -375,7 +788,10 @@ class Stop(Model):
         elif kwargs.get('route', False):
             stops = kwargs['route'].get_stops()
         else:
-            stops = cls.all()
+            return cls.index().nearest(lat, long)
+
+        if batch.available():
+            return batch.Engine(stops).nearest([(lat, long)])[0]
 
         dists = map(lambda stop: distance(
                 (stop.lat, stop.long),
@@ -384,16 +800,136 @@ class Stop(Model):
 
         return min(zip(dists, stops))[::-1]
 
+    @classmethod
+    @metrics.timed('nearest')
+    def nearest_batch(cls, points, exact=True, **kwargs):
+        """
+        Search for the nearest stop of each one of `points`,
+        computing the distances at once (see `batch.Engine`).
+
+        Requires `numpy`.
+
+        @param points: A list of pairs latitude and longitude.
+        @param exact: If the distances must be the same of
+            `Stop.nearest`, otherwise they're approximated by
+            the haversine formula (faster).
 
-class Bus(Model):
+        keywords params:
+            stops:
+                A list of `Stop` instance.
+            route:
+                A `Route` instance.
+
+        @return: A list with a tuple of a `Stop` object and a
+            `Distance` object (see geopy.distance) for each point.
+        """
+
+        if kwargs.get('stops', False):
+            engine = batch.Engine(kwargs['stops'])
+        elif kwargs.get('route', False):
+            engine = batch.Engine(kwargs['route'].get_stops())
+        else:
+            index = cls.index()
+            engine = cls.__engine__
+            if engine is None or engine.objs is not index.objs:
+                engine = batch.Engine(index.objs)
+                # Shares the list, so it's known the index it came from.
+                engine.objs = index.objs
+                cls.__engine__ = engine
+
+        return engine.nearest(points, exact)
+
+    @classmethod
+    def index(cls, refresh=False):
+        """
+        Returns the spatial index of all the stops, building
+        it on the first call.
+
+        The stops are fetched again after `spatial.EXPIRES`
+        seconds (or if `refresh` is set), but the index is
+        only rebuilt if some stop has changed.
+
+        @param refresh: If the stops must be fetched now.
+
+        @return: A `spatial.SpatialIndex` instance.
+        """
+
+        index = cls.__spatial__
+        if index is not None and not refresh and \
+           time.time() - cls.__spatial_time__ < spatial.EXPIRES:
+            return index
+
+        with cls.__spatial_lock__:
+            if cls.__spatial__ is not index:
+                # Rebuilt by another thread while this one waited.
+                return cls.__spatial__
+
+            if refresh:
+                cache.invalidate(cls, 'all')
+
+            stops = cls.all()
+            if index is None or \
+               index.signature != spatial.signature(stops):
+                index = spatial.SpatialIndex(stops)
+
+            cls.__spatial__ = index
+            cls.__spatial_time__ = time.time()
+
+        return index
+
+    @classmethod
+    def k_nearest(cls, lat, long, k):
+        """
+        Search for the `k` nearest stops from `lat` and `long`,
+        using the spatial index (see `Stop.index`).
+
+        @param lat: A float coercible value of latitude (eg.: -5.065533).
+        @param long: A float coercible value of longitude (eg.: -42.065533).
+        @param k: The number of stops.
+
+        @return: A list of tuples with a `Stop` object and a
+            `Distance` object (see geopy.distance), from the nearest.
+        """
+
+        return cls.index().k_nearest(lat, long, k)
+
+    @classmethod
+    def within(cls, lat, long, radius):
+        """
+        Search for the stops at most `radius` kilometers from
+        `lat` and `long`, using the spatial index (see `Stop.index`).
+
+        @param lat: A float coercible value of latitude (eg.: -5.065533).
+        @param long: A float coercible value of longitude (eg.: -42.065533).
+        @param radius: The distance in kilometers.
+
+        @return: A list of tuples with a `Stop` object and a
+            `Distance` object (see geopy.distance), from the nearest.
+        """
+
+        return cls.index().within(lat, long, radius)
+
+
+class Stop(BaseStop):
     """
-    Model for `veiculos` endpoint.
+    Model for `paradas` endpoint.
 
-    @attribute code: a `int` unique identify.
-    @attribute lat: a `float` coercible `str` for latitude.
-    @attribute long: a `float` coercible `str` for longitude.
-    @attribue hour: the last location update of the bus.
+    @attribute code: A unique `int` that identifies the stop.
+    @attribute description: A `str` description.
+    @attribute address: A `str`, the stop's address location.
+    @attribute lat: A `float` coercible `str`.
+    @attribute long: A `float` coercible `str`.
     """
+
+
+class BaseBus(Model):
+    """
+    The methods of `Bus`, without the instance attributes (see
+    `BaseRoute`).
+    """
+
+    __slots__ = ()
+
     endpoint = '/veiculos'
     mapper = {
         'CodigoVeiculo': 'code',
@@ -415,9 +951,15 @@ class Bus(Model):
         if self.__route__ is not None:
             return self.__route__
         if self.__route_code__ is not None:
-            self.__route__ = Route.get_route(self.__route_code__)
+            self.__route__ = self.route_model.get_route(self.__route_code__)
             return self.__route__
 
+    def __move__(self, route_code):
+        # The route memoized is dropped if the bus is at other one.
+        self.__route_code__ = route_code
+        if self.__route__ is not None and self.__route__.code != route_code:
+            self.__route__ = None
+
     @classmethod
     def all(cls):
         """
@@ -427,16 +969,43 @@ class Bus(Model):
         it does not returns the list of objects, but a
         list of routes with a list of buses inside.
 
+        The buses are also kept as the current snapshot of
+        the `fleet` of the model (`fleet.default` for `Bus`).
+        When the fleet has a `source` (e.g.: the cache shared
+        by the processes, see `shared`), the buses come from it
+        instead.
+
         @return: A `Bus` instances list.
         """
+        if cls.fleet.source is not None:
+            return cls.fleet.snapshot().buses()
+
         info = api.get(cls.endpoint)
+        cls.fleet.update(FleetTable.from_response(info))
+
+        return cls.load(info)
 
-        buses = []
+    @classmethod
+    @metrics.timed('parse')
+    def load(cls, info):
+        """
+        Maps the list of routes returned by `veiculos` to a
+        flat list of buses, keeping the route code of each one.
+
+        @param info: A json decoded list from `veiculos`.
+
+        @return: A `Bus` instances list.
+        """
+
+        cars, codes = [], []
         for route in info:
             for car in route['Linha']['Veiculos']:
-                bus = cls(car)
-                bus.__route_code__ = route['Linha']['CodigoLinha']
-                buses.append(bus)
+                cars.append(car)
+                codes.append(route['Linha']['CodigoLinha'])
+
+        buses = cls.build(cars)
+        for bus, code in zip(buses, codes):
+            bus.__move__(code)
 
         return buses
 
@@ -452,6 +1021,7 @@ class Bus(Model):
             self.code, self.route.code, self.route.description)
 
     @classmethod
+    @metrics.timed('nearest')
     def nearest(cls, lat, long, **kwargs):
         """
         Search for the nearest buses from `lat` and `long`
@@ -472,12 +1042,11 @@ class Bus(Model):
         @return: A tuple with a `Bus` object and a `Distance`
             object (see geopy.distance).
         """
-        if kwargs.get('buses', False):
-            buses = kwargs['buses']
-        elif kwargs.get('route', False):
-            buses = kwargs['route'].get_buses()
-        else:
-            buses = cls.all()
+        buses = cls.__buses__(kwargs)
+
+        if batch.available():
+            return batch.Engine(buses, key=cls.location).nearest(
+                [(lat, long)])[0]
 
         dists = map(lambda bus: distance(
                 # Avoid using cached location, to avoid more requests.
@@ -487,11 +1056,98 @@ class Bus(Model):
 
         return min(zip(dists, buses))[::-1]
 
+    @classmethod
+    @metrics.timed('nearest')
+    def nearest_batch(cls, points, exact=True, **kwargs):
+        """
+        Search for the nearest bus of each one of `points`,
+        computing the distances at once (see `batch.Engine`).
+        The buses are fetched only once for all the points.
+
+        Requires `numpy`.
+
+        @param points: A list of pairs latitude and longitude.
+        @param exact: If the distances must be the same of
+            `Bus.nearest`, otherwise they're approximated by
+            the haversine formula (faster).
+
+        keywords params:
+            buses:
+                A list of `Bus` instance.
+            route:
+                A `Route` instance.
+
+        @return: A list with a tuple of a `Bus` object and a
+            `Distance` object (see geopy.distance) for each point.
+        """
+
+        engine = batch.Engine(cls.__buses__(kwargs), key=cls.location)
+
+        return engine.nearest(points, exact)
+
+    @classmethod
+    def __buses__(cls, kwargs):
+        if kwargs.get('buses', False):
+            return kwargs['buses']
+        elif kwargs.get('route', False):
+            return kwargs['route'].get_buses()
+        return cls.all()
+
+    @staticmethod
+    def location(bus):
+        """
+        Returns the last known location of `bus`, without
+        making any request.
+
+        @return: A tuple with the latitude and longitude.
+        """
+
+        return bus.__lat__, bus.__long__
+
+    @classmethod
+    def get(cls, code):
+        """
+        Returns the bus identified by `code`, from the current
+        snapshot of the `fleet` of the model.
+
+        @param code: The bus code.
+
+        @return: A `Bus` instance.
+
+        Raises `NotFoundError` if the bus is not running.
+        """
+
+        bus = cls.fleet.get(code)
+        if bus is None:
+            raise NotFoundError('Veiculo {0} não encontrado.'.format(code))
+
+        return bus
+
+    def update(self):
+        """
+        Updates the bus from the current snapshot of the
+        `fleet` of the model, fetched at most once every
+        `fleet.INTERVAL` seconds for all the buses.
+
+        If the bus is not at the snapshot, it keeps its
+        last known location.
+        """
+
+        row = self.fleet.row(self.code)
+        if row is None:
+            return
+
+        self.obj = row.raw()
+        self.to_python()
+        if not self.keep_raw:
+            self.obj = None
+        self.__move__(row.route_code)
+
     @property
-    @timestampcache(30)
     def lat(self):
         """
-        Retrieves the bus's latitude as a `str`.
+        Retrieves the bus's latitude as a `str`, from
+        the fleet snapshot (see `Bus.update`).
 
         @return: a `float` coercible `str`
         """
@@ -499,12 +1155,36 @@ class Bus(Model):
         return self.__lat__
 
     @property
-    @timestampcache(30)
     def long(self):
         """
-        Retrieves the bus's longitude as a `str`.
+        Retrieves the bus's longitude as a `str`, from
+        the fleet snapshot (see `Bus.update`).
 
         @return: a `float` coercible `str`
         """
         self.update()
         return self.__long__
+
+
+class Bus(BaseBus):
+    """
+    Model for `veiculos` endpoint.
+
+    @attribute code: a `int` unique identify.
+    @attribute lat: a `float` coercible `str` for latitude.
+    @attribute long: a `float` coercible `str` for longitude.
+    @attribue hour: the last location update of the bus.
+    """
+
+
+# The models of the objects linked, replaced by the variants
+# (see `compact`).
+Route.stop_model = Stop
+Route.bus_model = Bus
+Bus.route_model = Route
+
+# The snapshot of the buses (see `Bus.all`).
+Bus.fleet = fleet.default
+
+# The index of the routes and stops linked.
+Route.network = Stop.network = network.default
@@ -0,0 +1,240 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Index of the links between routes and stops.
+
+The Inthegra API only provides the stops of a route
+(`paradasLinha`), the opposite would need a request for
+each route. The `Network` fetches all the route stop lists
+once, in parallel, and answers both directions from memory.
+
+>>> from stranspyra import network
+>>> network.default.load()
+>>> network.default.routes(stop)
+[<Route 0401 UNIVERSIDADE>, <Route 0365 UNIVERSIDADE CIRCULAR 2 VIA SHOPPING>]
+"""
+
+import threading
+from multiprocessing.pool import ThreadPool
+
+from . import api
+
+# Default number of threads used to fetch the route stop lists.
+WORKERS = 8
+
+
+def fetch_stops(route):
+    """
+    Fetches the stops of `route` from `paradasLinha`, without
+    using any cache.
+
+    @param route: A `Route` instance.
+
+    @return: A list of `Stop` instances.
+    """
+
+    return route.parse_stops(api.get('/paradasLinha', busca=route.code))
+
+
+class Network(object):
+    """
+    Route to stops and stop to routes index.
+
+    Every lookup is a `dict` access. The index is filled
+    route by route, so it can be refreshed incrementally.
+    """
+
+    def __init__(self, model=None):
+        """
+        @constructor
+
+        @param model: The route model loaded by `load`, default
+            is `Route`.
+        """
+
+        self.model = model
+        self.__routes__ = dict()
+        self.__stops__ = dict()
+        self.__index__ = dict()
+        self.__lock__ = threading.RLock()
+        self.__loaded__ = False
+
+    def __len__(self):
+        return len(self.__routes__)
+
+    def __contains__(self, route):
+        return route.code in self.__routes__
+
+    def add(self, route, stops):
+        """
+        Indexes (or reindexes) the stops of `route`.
+
+        @param route: A `Route` instance.
+        @param stops: A list of `Stop` instances.
+        """
+
+        with self.__lock__:
+            self.remove(route)
+
+            self.__routes__[route.code] = route
+            self.__stops__[route.code] = stops
+            for stop in stops:
+                routes = self.__index__.setdefault(stop.code, [])
+                if route not in routes:
+                    routes.append(route)
+
+    def extend(self, links, complete=False):
+        """
+        Indexes the stops of many routes at once (e.g.: from a
+        snapshot).
+
+        @param links: A `dict` of the list of stops by route.
+        @param complete: If `links` has all the routes, so
+            `routes` doesn't load them.
+        """
+
+        with self.__lock__:
+            for route, stops in links.items():
+                self.add(route, stops)
+            if complete:
+                self.__loaded__ = True
+
+    def remove(self, route):
+        """
+        Removes `route` from the index, if it's indexed.
+
+        @param route: A `Route` instance.
+        """
+
+        with self.__lock__:
+            self.__routes__.pop(route.code, None)
+            for stop in self.__stops__.pop(route.code, []):
+                routes = self.__index__.get(stop.code, [])
+                if route in routes:
+                    routes.remove(route)
+                if not routes:
+                    self.__index__.pop(stop.code, None)
+
+    def load(self, routes=None, refresh=False, workers=WORKERS):
+        """
+        Fetches the stops of `routes` in parallel and indexes them.
+
+        Only the routes not indexed yet are fetched, unless
+        `refresh` is set. When `routes` is not given, all the
+        routes are loaded and the routes not found anymore are
+        removed from the index.
+
+        @param routes: A list of `Route` instances, default is
+            `Route.all()` (or the `all` of `model`).
+        @param refresh: If the routes already indexed must be
+            fetched again.
+        @param workers: The number of threads fetching at once.
+        """
+
+        complete = routes is None
+        if complete:
+            model = self.model
+            if model is None:
+                from .models import Route as model
+
+            routes = model.all()
+            codes = set(r.code for r in routes)
+            for route in self.all():
+                if route.code not in codes:
+                    self.remove(route)
+
+        if not refresh:
+            routes = [r for r in routes if r not in self]
+
+        if routes:
+            pool = ThreadPool(min(workers, len(routes)))
+            try:
+                stops = pool.map(fetch_stops, routes)
+            finally:
+                pool.close()
+
+            for route, s in zip(routes, stops):
+                self.add(route, s)
+
+        if complete:
+            self.__loaded__ = True
+
+    @property
+    def loaded(self):
+        """
+        If all the routes were loaded (see `load`).
+        """
+
+        return self.__loaded__
+
+    def all(self):
+        """
+        Returns all the indexed routes.
+
+        @return: A list of `Route` instances.
+        """
+
+        return list(self.__routes__.values())
+
+    def stops(self, route):
+        """
+        Returns the stops of `route`, fetching and indexing
+        them if `route` is not indexed yet.
+
+        @param route: A `Route` instance.
+
+        @return: A list of `Stop` instances.
+        """
+
+        if route not in self:
+            self.add(route, fetch_stops(route))
+
+        return list(self.__stops__[route.code])
+
+    def routes(self, stop):
+        """
+        Returns the routes passing by `stop`. All the routes
+        must be loaded (see `load`), otherwise they're loaded first.
+
+        @param stop: A `Stop` instance.
+
+        @return: A list of `Route` instances.
+        """
+
+        if not self.__loaded__:
+            self.load()
+
+        return list(self.__index__.get(stop.code, []))
+
+    def clear(self):
+        """
+        Removes everything from the index.
+        """
+
+        with self.__lock__:
+            self.__routes__.clear()
+            self.__stops__.clear()
+            self.__index__.clear()
+            self.__loaded__ = False
+
+
+default = Network()
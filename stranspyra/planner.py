@@ -0,0 +1,494 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Trip planner over the routes network.
+
+The stops and routes loaded at `network.default` are turned
+into a graph: the sequence of stops of each route, and walking
+links between stops close to each other. The trips are searched
+by rounds, as in RAPTOR: the round `k` finds the best way to
+reach each stop taking `k` buses, so the itineraries with less
+transfers are found first.
+
+There's no timetable at the Inthegra API, so the duration of a
+trip is estimated from the distances and the average speeds
+(`BUS_SPEED`, `WALK_SPEED`), plus a waiting time (`WAIT`) for
+each bus taken.
+
+>>> planner = Planner()
+>>> planner.plan((-5.0902805, -42.8138435), (-5.0869447, -42.8040027))
+[<Itinerary 14 min: walk 0.17 km, 0617 HD-PLA. BELA VISTA SHOPPING VIA M., walk 0.06 km>, ...]
+"""
+
+import itertools
+import math
+import os
+import threading
+from concurrent.futures import (
+    FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait)
+
+from . import network
+from .spatial import SpatialIndex, distance
+
+# Average speeds, in kilometers per minute.
+BUS_SPEED = 20 / 60.
+WALK_SPEED = 4.5 / 60.
+
+# Minutes waiting for each bus taken.
+WAIT = 10
+
+# Max walking distance, in kilometers, between two stops in a
+# transfer and between the source/dest and its stops.
+WALK_RADIUS = 0.4
+ACCESS_RADIUS = 1.0
+
+# Max number of stops considered around the source and the dest.
+ACCESS_STOPS = 5
+
+INFINITY = float('inf')
+
+
+class Leg(object):
+    """
+    A part of a itinerary.
+
+    @attribute route: The `Route` taken, `None` if walking.
+    @attribute start: The `Stop` where the leg starts, `None` if
+        it's the source point.
+    @attribute end: The `Stop` where the leg ends, `None` if it's
+        the dest point.
+    @attribute distance: The distance, in kilometers.
+    @attribute minutes: The estimated duration.
+    """
+
+    def __init__(self, route, start, end, distance, minutes):
+        self.route = route
+        self.start = start
+        self.end = end
+        self.distance = distance
+        self.minutes = minutes
+
+    def __repr__(self):
+        if self.route is None:
+            return u'walk {0:.2f} km'.format(self.distance)
+        return u'{0} {1}'.format(self.route.code, self.route.description)
+
+
+class Itinerary(object):
+    """
+    A trip between two points.
+
+    @attribute legs: A list of `Leg`, walking and riding.
+    @attribute minutes: The estimated duration.
+    """
+
+    def __init__(self, legs, minutes):
+        self.legs = legs
+        self.minutes = minutes
+
+    @property
+    def routes(self):
+        """
+        The routes taken, in order.
+        """
+
+        return [leg.route for leg in self.legs if leg.route is not None]
+
+    @property
+    def transfers(self):
+        """
+        The number of transfers between buses.
+        """
+
+        return max(len(self.routes) - 1, 0)
+
+    @property
+    def source(self):
+        """
+        The first stop of the trip.
+        """
+
+        return next(leg.start for leg in self.legs if leg.route is not None)
+
+    @property
+    def dest(self):
+        """
+        The last stop of the trip.
+        """
+
+        return [leg.end for leg in self.legs if leg.route is not None][-1]
+
+    def __repr__(self):
+        return u'<Itinerary {0:.0f} min: {1}>'.format(
+            self.minutes, u', '.join(repr(leg) for leg in self.legs))
+
+
+class Planner(object):
+    """
+    Plans trips between points, with transfers.
+
+    The graph is built on the first plan (see `build`), from
+    `network.default`, loading it if needed.
+    """
+
+    def __init__(self, network=network.default):
+        self.network = network
+        self.__lock__ = threading.Lock()
+        self.__built__ = False
+
+    def __getstate__(self):
+        # Sent to the worker processes (see `plan_many`), only
+        # the built graph is needed.
+        state = self.__dict__.copy()
+        del state['__lock__']
+        del state['network']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__lock__ = threading.Lock()
+        self.network = network.default
+
+    def build(self):
+        """
+        Builds the graph from the routes and stops of the network.
+        Call it again to rebuild after the network changes.
+        """
+
+        with self.__lock__:
+            if not self.network.loaded:
+                self.network.load()
+
+            routes = sorted(self.network.all(), key=lambda r: r.code)
+
+            stops = []
+            ids = dict()
+            sequences = []
+            for route in routes:
+                seq = []
+                for stop in self.network.stops(route):
+                    if stop.code not in ids:
+                        ids[stop.code] = len(stops)
+                        stops.append(stop)
+                    seq.append(ids[stop.code])
+                if getattr(route, 'circular', False) and seq:
+                    seq.append(seq[0])
+                sequences.append(seq)
+
+            index = SpatialIndex(stops)
+
+            # Minutes from the first stop of the route, for each stop.
+            elapsed = []
+            for seq in sequences:
+                acc = [0.0]
+                for a, b in zip(seq, seq[1:]):
+                    acc.append(acc[-1] + self.__km__(index, a, b) / BUS_SPEED)
+                elapsed.append(acc)
+
+            # stop -> [(route, position)]
+            serving = [[] for _ in stops]
+            for r, seq in enumerate(sequences):
+                for pos, s in enumerate(seq):
+                    serving[s].append((r, pos))
+
+            # stop -> [(stop, km)]
+            walks = []
+            for s, (lat, long) in enumerate(index.coords):
+                walks.append([
+                    (t, km) for t, km in index.around(lat, long, WALK_RADIUS)
+                    if t != s
+                ])
+
+            self.routes = routes
+            self.stops = stops
+            self.index = index
+            self.sequences = sequences
+            self.elapsed = elapsed
+            self.serving = serving
+            self.walks = walks
+            self.__built__ = True
+
+    @staticmethod
+    def __km__(index, a, b):
+        pa, pb = index.points[a], index.points[b]
+        return math.hypot(pa[0] - pb[0], pa[1] - pb[1])
+
+    def access(self, point, candidates=ACCESS_STOPS):
+        """
+        Returns the stops around `point`, at most `ACCESS_RADIUS`
+        kilometers away.
+
+        @param point: A pair latitude and longitude.
+        @param candidates: The max number of stops.
+
+        @return: A list of tuples with a stop position and its
+            distance, in kilometers.
+        """
+
+        return self.index.around(
+            point[0], point[1], ACCESS_RADIUS)[:candidates]
+
+    def __rounds__(self, origins, transfers):
+        # Label of a stop: (minutes, parent), where parent is
+        # None for the origins, ('ride', route, board, alight)
+        # or ('walk', stop, label of that stop).
+        best = [INFINITY] * len(self.stops)
+        labels = dict()
+        for s, km in origins:
+            minutes = km / WALK_SPEED
+            if minutes < best[s]:
+                best[s] = minutes
+                labels[s] = (minutes, None)
+
+        rounds = [labels]
+        marked = set(labels)
+
+        for k in range(1, transfers + 2):
+            previous = rounds[-1]
+            labels = dict(previous)
+
+            queue = dict()
+            for s in marked:
+                for r, pos in self.serving[s]:
+                    if pos < queue.get(r, INFINITY):
+                        queue[r] = pos
+
+            improved = set()
+            for r, start in queue.items():
+                seq = self.sequences[r]
+                elapsed = self.elapsed[r]
+                board = None
+                for pos in range(start, len(seq)):
+                    s = seq[pos]
+                    if board is not None:
+                        minutes = board[1] + elapsed[pos] - elapsed[board[0]]
+                        if minutes < best[s]:
+                            best[s] = minutes
+                            labels[s] = (minutes, ('ride', r, board[0], pos))
+                            improved.add(s)
+
+                    if s in previous:
+                        minutes = previous[s][0] + WAIT
+                        if board is None or minutes - elapsed[pos] < \
+                           board[1] - elapsed[board[0]]:
+                            board = (pos, minutes)
+
+            for s in list(improved):
+                label = labels[s]
+                for t, km in self.walks[s]:
+                    minutes = label[0] + km / WALK_SPEED
+                    if minutes < best[t]:
+                        best[t] = minutes
+                        labels[t] = (minutes, ('walk', s, label))
+                        improved.add(t)
+
+            rounds.append(labels)
+            marked = improved
+            if not marked:
+                break
+
+        return rounds
+
+    def __legs__(self, rounds, k, s):
+        legs = []
+        label = rounds[k][s]
+
+        while label[1] is not None:
+            parent = label[1]
+            if parent[0] == 'walk':
+                _, t, walked = parent
+                km = self.__km__(self.index, t, s)
+                legs.append(Leg(
+                    None, self.stops[t], self.stops[s], km, km / WALK_SPEED))
+                s, label = t, walked
+                continue
+
+            _, r, board, alight = parent
+            seq = self.sequences[r]
+            elapsed = self.elapsed[r]
+            legs.append(Leg(
+                self.routes[r], self.stops[seq[board]], self.stops[s],
+                (elapsed[alight] - elapsed[board]) * BUS_SPEED,
+                elapsed[alight] - elapsed[board]))
+
+            # The boarding label is at the previous round,
+            # k is decreased until finding where it was set.
+            s = seq[board]
+            k -= 1
+            while k > 0 and rounds[k - 1].get(s) is rounds[k][s]:
+                k -= 1
+            label = rounds[k][s]
+
+        return s, legs[::-1]
+
+    def plan(self, source, dest, transfers=2, limit=3,
+             candidates=ACCESS_STOPS):
+        """
+        Plans trips from `source` to `dest`.
+
+        @param source: A pair latitude and longitude.
+        @param dest: A pair latitude and longitude.
+        @param transfers: The max number of transfers.
+        @param limit: The max number of itineraries.
+        @param candidates: The number of stops considered around
+            `source` and `dest`.
+
+        @return: A list of `Itinerary`, from the fastest. It's
+            empty if no trip was found.
+        """
+
+        if not self.__built__:
+            self.build()
+
+        rounds = self.__rounds__(self.access(source, candidates), transfers)
+        egress = self.access(dest, candidates)
+
+        found = []
+        for k in range(1, len(rounds)):
+            for s, km in egress:
+                label = rounds[k].get(s)
+                if label is None or label[1] is None or \
+                   rounds[k - 1].get(s) is label:
+                    continue
+                found.append((label[0] + km / WALK_SPEED, k, s, km))
+
+        found.sort(key=lambda x: x[0])
+
+        itineraries = []
+        seen = set()
+        for minutes, k, s, km in found:
+            first, legs = self.__legs__(rounds, k, s)
+            routes = tuple(leg.route.code for leg in legs if leg.route)
+            if routes in seen:
+                continue
+            seen.add(routes)
+
+            start = self.stops[first]
+            walk = distance(source, (start.lat, start.long)).km
+            legs.insert(0, Leg(None, None, start, walk, walk / WALK_SPEED))
+
+            end = self.stops[s]
+            if legs[-1].route is None:
+                # Walks to the dest from where the bus was left.
+                km += legs[-1].distance
+                end = legs.pop().start
+            legs.append(Leg(None, end, None, km, km / WALK_SPEED))
+
+            itineraries.append(Itinerary(legs, minutes))
+            if len(itineraries) >= limit:
+                break
+
+        return itineraries
+
+    def plan_many(self, pairs, transfers=2, limit=3, processes=None,
+                  chunksize=8):
+        """
+        Plans trips for many pairs of points, split between
+        `processes` worker processes. The graph is built once
+        and sent to each worker when it starts.
+
+        The results are yielded as soon as they're ready, not
+        in the order of `pairs`:
+
+        >>> for i, trips in planner.plan_many(pairs):
+        ...     report(pairs[i], trips)
+
+        @param pairs: A iterable of pairs `(source, dest)`.
+        @param transfers: The max number of transfers.
+        @param limit: The max number of itineraries of each pair.
+        @param processes: The number of workers, default is the
+            number of CPUs. With 1, plans at this process.
+        @param chunksize: The number of pairs sent at once to
+            each worker.
+
+        @return: A generator of tuples with the position of the
+            pair at `pairs` and a list of `Itinerary`.
+        """
+
+        if not self.__built__:
+            self.build()
+
+        jobs = (
+            (i, source, dest, transfers, limit)
+            for i, (source, dest) in enumerate(pairs)
+        )
+
+        if processes == 1:
+            for job in jobs:
+                yield job[0], self.plan(*job[1:])
+            return
+
+        processes = processes or os.cpu_count() or 1
+        pool = ProcessPoolExecutor(processes, initializer=__worker_init__,
+                                   initargs=(self,))
+        pending = set()
+        try:
+            for chunk in chunks(jobs, chunksize):
+                pending.add(pool.submit(__worker_plan__, chunk))
+                if len(pending) < processes * 2:
+                    continue
+
+                # Keeps at most two chunks by worker in the queue.
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for result in future.result():
+                        yield result
+
+            for future in as_completed(pending):
+                for result in future.result():
+                    yield result
+            pending = set()
+        finally:
+            for future in pending:
+                future.cancel()
+            pool.shutdown()
+
+
+def chunks(iterable, size):
+    """
+    Splits `iterable` in lists of `size` items (the last one
+    may be shorter).
+    """
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def __worker_init__(planner):
+    global __worker__
+    __worker__ = planner
+
+
+def __worker_plan__(jobs):
+    return [
+        (i, __worker__.plan(source, dest, transfers, limit))
+        for i, source, dest, transfers, limit in jobs
+    ]
+
+
+__worker__ = None
+
+default = Planner()
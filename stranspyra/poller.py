@@ -0,0 +1,284 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Background fleet poller, with change events.
+
+The `Poller` fetches the whole fleet at a background thread,
+every `interval` seconds, and compares it with the previous
+snapshot of `fleet.default`. The differences are sent to the
+subscribers as `Event` objects, so any number of consumers
+share a single request.
+
+>>> poller = Poller(interval=15)
+>>> poller.subscribe(lambda event: print(event), kinds=[MOVED])
+>>> poller.start()
+
+Or consuming the events as a generator:
+
+>>> for event in poller.events():
+...     if event.kind == APPEARED:
+...         print(event.bus)
+
+The snapshots fetched by other means (e.g.: `Bus.all`) also
+generate events, while the poller is started.
+"""
+
+import threading
+
+try:
+    from queue import Queue, Empty
+except ImportError:
+    from Queue import Queue, Empty
+
+from . import fleet
+
+MOVED = 'moved'
+APPEARED = 'appeared'
+DISAPPEARED = 'disappeared'
+ROUTE_CHANGED = 'route_changed'
+
+
+class Event(object):
+    """
+    A change of a bus between two snapshots.
+
+    @attribute kind: `MOVED`, `APPEARED`, `DISAPPEARED` or
+        `ROUTE_CHANGED`.
+    @attribute row: The `tables.BusRow` of the bus, at the
+        current snapshot (or the previous, if it has disappeared).
+    @attribute previous: The bus state before (see
+        `tables.BusRow.state`), `None` if it has appeared.
+    @attribute current: The bus state now, `None` if it has
+        disappeared.
+    """
+
+    def __init__(self, kind, row, previous, current, model=None):
+        self.kind = kind
+        self.row = row
+        self.previous = previous
+        self.current = current
+        self.model = model
+
+    @property
+    def code(self):
+        """
+        The code of the bus.
+        """
+        return self.row.code
+
+    @property
+    def bus(self):
+        """
+        The `Bus` instance, created when it's read.
+        """
+        return self.row.to_model(self.model)
+
+    def __repr__(self):
+        return u'<Event {0} {1}>'.format(self.kind, self.code)
+
+
+def diff(previous, current):
+    """
+    Compares two snapshots of the fleet.
+
+    @param previous: A `fleet.Snapshot`, or `None`.
+    @param current: A `fleet.Snapshot`.
+
+    @return: A list of `Event`.
+    """
+
+    before = previous.table() if previous is not None else None
+    after = current.table()
+    model = current.model
+    events = []
+
+    for row in after:
+        state = row.state()
+        old_row = before.find(row.code) if before is not None else None
+        if old_row is None:
+            events.append(Event(APPEARED, row, None, state, model))
+            continue
+        old = old_row.state()
+        if old[2] != state[2]:
+            events.append(Event(ROUTE_CHANGED, row, old, state, model))
+        if old[:2] != state[:2]:
+            events.append(Event(MOVED, row, old, state, model))
+
+    if before is not None:
+        for row in before:
+            if after.position(row.code) is None:
+                events.append(
+                    Event(DISAPPEARED, row, row.state(), None, model))
+
+    return events
+
+
+class Poller(object):
+    """
+    Polls the fleet at a background thread.
+
+    @attribute polls: Number of requests made.
+    @attribute errors: Number of requests failed.
+    """
+
+    def __init__(self, interval=fleet.INTERVAL, fleet=fleet.default):
+        """
+        @constructor
+
+        @param interval: Seconds between each request.
+        @param fleet: The `fleet.Fleet` updated.
+        """
+
+        self.interval = interval
+        self.fleet = fleet
+        self.polls = 0
+        self.errors = 0
+        self.__subscribers__ = []
+        self.__lock__ = threading.Lock()
+        self.__stop__ = threading.Event()
+        self.__thread__ = None
+
+    def subscribe(self, callback, kinds=None):
+        """
+        Calls `callback` with each `Event`, at the thread updating
+        the fleet: the poller thread, or any other one calling
+        `fleet.snapshot` (e.g.: by `Bus.all`). It's called after
+        the fleet lock is released, so it may read the fleet.
+
+        @param callback: A callable receiving an `Event`.
+        @param kinds: A list of the event kinds wanted, default
+            is all of them.
+
+        @return: `callback`, to use with `unsubscribe`.
+        """
+
+        with self.__lock__:
+            self.__subscribers__.append((callback, kinds))
+
+        return callback
+
+    def unsubscribe(self, callback):
+        """
+        Stops calling `callback` (compared by equality, so a
+        method can be given again, e.g.: `obj.method`).
+        """
+
+        with self.__lock__:
+            self.__subscribers__ = [
+                s for s in self.__subscribers__ if s[0] != callback
+            ]
+
+    def events(self, kinds=None, timeout=None):
+        """
+        Yields the events as they happen.
+
+        @param kinds: A list of the event kinds wanted, default
+            is all of them.
+        @param timeout: Seconds without events before stopping,
+            default is waiting forever.
+
+        @return: A generator of `Event`.
+        """
+
+        queue = Queue()
+        # Bound once, each `queue.put` is a new method object.
+        put = self.subscribe(queue.put, kinds)
+        try:
+            while True:
+                try:
+                    yield queue.get(timeout=timeout)
+                except Empty:
+                    return
+        finally:
+            self.unsubscribe(put)
+
+    def publish(self, previous, current):
+        """
+        Sends the differences between the snapshots to the
+        subscribers. It's called by the fleet on each update.
+        """
+
+        events = diff(previous, current)
+        for callback, kinds in list(self.__subscribers__):
+            for event in events:
+                if kinds is not None and event.kind not in kinds:
+                    continue
+                try:
+                    callback(event)
+                except Exception:
+                    # A failing subscriber must not stop the others.
+                    pass
+
+    def poll(self):
+        """
+        Fetches the fleet once, publishing the changes.
+
+        @return: The new `fleet.Snapshot`.
+        """
+
+        self.polls += 1
+        return self.fleet.snapshot(refresh=True)
+
+    def __run__(self):
+        while not self.__stop__.is_set():
+            try:
+                self.poll()
+            except Exception:
+                # Tries again at the next interval.
+                self.errors += 1
+            self.__stop__.wait(self.interval)
+
+    def start(self):
+        """
+        Starts polling at a background (daemon) thread.
+        """
+
+        if self.running:
+            return
+
+        self.__stop__.clear()
+        self.fleet.listeners.append(self.publish)
+        self.__thread__ = threading.Thread(target=self.__run__)
+        self.__thread__.daemon = True
+        self.__thread__.start()
+
+    def stop(self, wait=True):
+        """
+        Stops polling.
+
+        @param wait: If it must wait for the thread to finish.
+        """
+
+        self.__stop__.set()
+        if self.publish in self.fleet.listeners:
+            self.fleet.listeners.remove(self.publish)
+        if wait and self.__thread__ is not None:
+            self.__thread__.join()
+        self.__thread__ = None
+
+    @property
+    def running(self):
+        """
+        If the poller thread is running.
+        """
+
+        return self.__thread__ is not None and self.__thread__.is_alive()
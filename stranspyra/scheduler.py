@@ -0,0 +1,266 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Scheduler of the requests to the API.
+
+All the requests of `api` take a slot of the `Scheduler` before
+being made. It limits the request rate (a token bucket of
+`settings.RATE_LIMIT` requests per second, with bursts of up to
+`settings.RATE_BURST`) and the requests in flight
+(`settings.MAX_IN_FLIGHT`), both unlimited by default.
+
+The requests waiting are served by priority: `REALTIME` (the
+fleet), then `DEFAULT`, then `BULK` (the catalog and the stops of
+the routes, usually prefetched). The priority comes from the
+endpoint (see `ENDPOINTS`), unless set for the thread:
+
+>>> from stranspyra import scheduler
+>>> with scheduler.priority(scheduler.BULK):
+...     routes = [Route.get_route(code) for code in codes]
+
+The scheduler's counters help tuning the limits:
+
+>>> api.scheduler().stats()['wait']
+{'realtime': 0.0, 'default': 0.012, 'bulk': 0.48}
+"""
+
+import heapq
+import itertools
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+# Priority classes, the lowest is served first.
+REALTIME = 0
+DEFAULT = 1
+BULK = 2
+
+NAMES = {REALTIME: 'realtime', DEFAULT: 'default', BULK: 'bulk'}
+
+# Priority of the requests to each endpoint.
+ENDPOINTS = {
+    '/signin': REALTIME,
+    '/veiculos': REALTIME,
+    '/veiculosLinha': REALTIME,
+    '/linhas': DEFAULT,
+    '/paradas': BULK,
+    '/paradasLinha': BULK,
+}
+
+__local__ = threading.local()
+
+
+@contextmanager
+def priority(level):
+    """
+    Sets the priority of the requests made by the current
+    thread inside the block, over the endpoint ones.
+
+    @param level: `REALTIME`, `DEFAULT` or `BULK`, or any other
+        number (the lowest is served first).
+    """
+
+    previous = getattr(__local__, 'priority', None)
+    __local__.priority = level
+    try:
+        yield
+    finally:
+        __local__.priority = previous
+
+
+def current(endpoint):
+    """
+    Returns the priority of a request to `endpoint` by the
+    current thread.
+    """
+
+    level = getattr(__local__, 'priority', None)
+    if level is not None:
+        return level
+    return ENDPOINTS.get(endpoint, DEFAULT)
+
+
+class TokenBucket(object):
+    """
+    Allows `rate` requests per second, in bursts of up to
+    `burst` requests. Not thread-safe, used under the lock
+    of the `Scheduler`.
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        self.burst = max(float(burst or rate), 1.)
+        self.tokens = self.burst
+        self.timestamp = time.time()
+
+    def take(self):
+        """
+        Takes a token, if there's one.
+
+        @return: 0 if the token was taken, otherwise the seconds
+            until there's one.
+        """
+
+        now = time.time()
+        self.tokens = min(
+            self.burst, self.tokens + (now - self.timestamp) * self.rate)
+        self.timestamp = now
+
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        return (1 - self.tokens) / self.rate
+
+
+class Scheduler(object):
+    """
+    Gives slots to make requests, by priority, within the rate
+    limit and the max of requests in flight.
+    """
+
+    def __init__(self, rate=None, burst=None, max_in_flight=None):
+        """
+        @constructor
+
+        @param rate: Max requests per second, `None` is unlimited.
+        @param burst: Max requests at once within the rate,
+            default is `rate`.
+        @param max_in_flight: Max requests in progress, `None`
+            is unlimited.
+        """
+
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # Other levels than the `NAMES` ones are counted as well.
+        self.requests = defaultdict(int, ((level, 0) for level in NAMES))
+        self.waited = defaultdict(float, ((level, 0.) for level in NAMES))
+        self.max_wait = defaultdict(float, ((level, 0.) for level in NAMES))
+        self.__queue__ = []
+        self.__counter__ = itertools.count()
+        self.__cond__ = threading.Condition()
+
+    def limited(self):
+        """
+        If there's any limit, otherwise the slots are given at
+        once.
+        """
+
+        return self.bucket is not None or self.max_in_flight is not None
+
+    def acquire(self, level=DEFAULT):
+        """
+        Waits for a slot, after the requests of higher priority
+        (and the ones of the same priority waiting before).
+
+        @param level: The request priority.
+
+        @return: The seconds waited.
+        """
+
+        start = time.time()
+        with self.__cond__:
+            if self.limited():
+                self.__wait__(level)
+
+            waited = time.time() - start
+            self.in_flight += 1
+            self.requests[level] += 1
+            self.waited[level] += waited
+            self.max_wait[level] = max(self.max_wait[level], waited)
+
+        return waited
+
+    def __wait__(self, level):
+        entry = (level, next(self.__counter__))
+        heapq.heappush(self.__queue__, entry)
+
+        try:
+            while True:
+                timeout = None
+                if self.__queue__[0] == entry and (
+                        self.max_in_flight is None or
+                        self.in_flight < self.max_in_flight):
+                    if self.bucket is None:
+                        break
+                    timeout = self.bucket.take()
+                    if not timeout:
+                        break
+                self.__cond__.wait(timeout)
+        finally:
+            self.__queue__.remove(entry)
+            heapq.heapify(self.__queue__)
+            # The next one in the queue may take a slot now.
+            self.__cond__.notify_all()
+
+    def release(self):
+        """
+        Gives back the slot of a finished request.
+        """
+
+        with self.__cond__:
+            self.in_flight -= 1
+            self.__cond__.notify_all()
+
+    @contextmanager
+    def slot(self, level=DEFAULT):
+        """
+        Holds a slot while inside the block.
+
+        >>> with scheduler.slot(REALTIME):
+        ...     res = session.get(url)
+        """
+
+        self.acquire(level)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        """
+        Returns the scheduler counters, by priority name (or
+        the level, if it has no name at `NAMES`).
+
+        @return: A `dict` with `in_flight`, `queued` (the requests
+            waiting), `requests`, `wait` (the mean seconds waited)
+            and `max_wait`.
+        """
+
+        with self.__cond__:
+            queued = dict((name, 0) for name in NAMES.values())
+            for level, _ in self.__queue__:
+                name = NAMES.get(level, level)
+                queued[name] = queued.get(name, 0) + 1
+
+            return {
+                'in_flight': self.in_flight,
+                'queued': queued,
+                'requests': dict(
+                    (NAMES.get(k, k), v) for k, v in self.requests.items()),
+                'wait': dict(
+                    (NAMES.get(k, k), self.waited[k] / v if v else 0.)
+                    for k, v in self.requests.items()),
+                'max_wait': dict(
+                    (NAMES.get(k, k), v) for k, v in self.max_wait.items()),
+            }
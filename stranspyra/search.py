@@ -0,0 +1,189 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Local full-text search over the models.
+
+The text of the fields of each object is normalized (lower
+case, without accents) and split in words. A query matches
+an object if each word of the query is a word, or a prefix of
+a word, of the object. The objects matching more words
+exactly come first.
+
+>>> index = SearchIndex(Route.all(), Route.search_fields)
+>>> index.search('universidade')
+[<Route 0401 UNIVERSIDADE>, <Route 0365 UNIVERSIDADE CIRCULAR 2 VIA SHOPPING>, ...]
+"""
+
+import bisect
+import re
+import time
+import unicodedata
+
+WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text):
+    """
+    Returns `text` in lower case, without accents.
+
+    @param text: A `str` or something coercible to it.
+
+    @return: A unicode string.
+    """
+
+    if isinstance(text, bytes):
+        text = text.decode('utf8')
+    elif not isinstance(text, type(u'')):
+        text = u'{0}'.format(text)
+
+    text = unicodedata.normalize('NFKD', text)
+    return u''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    """
+    Splits `text` in normalized words.
+
+    @return: A list of unicode strings.
+    """
+
+    return WORD.findall(normalize(text))
+
+
+def codes(code):
+    """
+    Returns the words that match the code of an object exactly,
+    e.g.: '0401' is matched by '0401' and '401', and 'T0401' is
+    also matched by '401'.
+    """
+
+    words = set(tokenize(code))
+    for word in list(words):
+        digits = word.lstrip(u'abcdefghijklmnopqrstuvwxyz')
+        words.add(digits)
+        words.add(digits.lstrip(u'0'))
+
+    words.discard(u'')
+    return words
+
+
+class SearchIndex(object):
+    """
+    Inverted index of the words of a list of objects.
+
+    @attribute signature: A hash of the indexed text.
+    @attribute timestamp: When the index was built.
+    """
+
+    # Weight of a word matched exactly, prefixes weight 1.
+    EXACT = 2
+    # Weight of a code matched exactly.
+    CODE = 4
+
+    def __init__(self, objs, fields):
+        """
+        @constructor
+
+        @param objs: A list of objects (e.g.: `Route` instances).
+        @param fields: The names of the attributes indexed. The
+            `code` attribute, if given, is matched as in `codes`.
+        """
+
+        self.objs = list(objs)
+        self.fields = tuple(fields)
+        self.timestamp = time.time()
+
+        # word -> {object position: weight}
+        self.__words__ = dict()
+        text = []
+
+        for i, obj in enumerate(self.objs):
+            for field in self.fields:
+                value = getattr(obj, field, None)
+                if value is None:
+                    continue
+                text.append(value)
+
+                if field == 'code':
+                    words, weight = codes(value), self.CODE
+                else:
+                    words, weight = tokenize(value), self.EXACT
+
+                for word in words:
+                    found = self.__words__.setdefault(word, {})
+                    found[i] = max(found.get(i, 0), weight)
+
+        self.signature = hash(tuple(text))
+        self.__sorted__ = sorted(self.__words__)
+
+    def __len__(self):
+        return len(self.objs)
+
+    def age(self):
+        """
+        Returns the seconds since the index was built.
+        """
+
+        return time.time() - self.timestamp
+
+    def __match__(self, word):
+        # {object position: weight} of the objects with `word`,
+        # exactly or as a prefix.
+        found = dict(self.__words__.get(word, {}))
+
+        start = bisect.bisect_right(self.__sorted__, word)
+        for other in self.__sorted__[start:]:
+            if not other.startswith(word):
+                break
+            for i in self.__words__[other]:
+                found.setdefault(i, 1)
+
+        return found
+
+    def search(self, query, limit=None):
+        """
+        Searches the objects matching all the words of `query`.
+
+        @param query: A `str` or something coercible to it
+            (e.g.: 401, 'universidade', 'Av. Frei Serafim').
+        @param limit: The max number of results.
+
+        @return: A list of objects, the best ranked first.
+        """
+
+        scores = None
+        for word in set(tokenize(query)):
+            found = self.__match__(word)
+            if scores is None:
+                scores = found
+            else:
+                scores = dict(
+                    (i, s + found[i]) for i, s in scores.items() if i in found
+                )
+            if not scores:
+                return []
+
+        if scores is None:
+            return []
+
+        ranked = sorted(scores, key=lambda i: (-scores[i], i))
+        return [self.objs[i] for i in ranked[:limit]]
@@ -0,0 +1,413 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Cache shared by the processes of a server (e.g.: the workers of
+a pre-fork server).
+
+One process, the refresher, fetches the fleet every
+`fleet.INTERVAL` seconds and the network every `NETWORK_INTERVAL`
+seconds, writing them to files at `settings.SHARED_PATH` (better
+at a memory filesystem, like `/dev/shm`). The other processes
+map the files in memory (see `snapshot`) and load them, without
+any request. The access token is shared at the same directory
+(see `tokens`).
+
+>>> import stranspyra
+>>> stranspyra.configure(SHARED_PATH='/dev/shm/stranspyra',
+...                      USE_CACHE=True)
+>>> from stranspyra import shared
+>>> shared.attach()  # at each worker, after the fork
+>>> Bus.all()  # from the shared fleet
+
+The refresher is elected by a lock at the directory: the first
+process attached is the refresher and, if it exits, another one
+takes its place. The files are replaced at once, each process
+sees the previous or the new file.
+
+The mapped files can also be read without creating models:
+
+>>> shared.default.fleet.table().by_route('0401')
+[<BusRow 02521 - 0401>]
+>>> shared.default.network.route('0401').stops()
+"""
+
+import logging
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from . import api
+from . import fleet
+from . import network
+from . import snapshot
+from .conf import settings
+from .models import Route, Stop
+from .tables import FleetTable
+
+log = logging.getLogger(__name__)
+
+# Seconds between the snapshots of the network.
+NETWORK_INTERVAL = 1800
+
+# Seconds between the checks of the files.
+CHECK_INTERVAL = 1
+
+NETWORK_FILE = 'network.snap'
+FLEET_FILE = 'fleet.snap'
+TOKEN_FILE = 'token.json'
+LOCK_FILE = 'refresher.lock'
+
+FLEET_MAGIC = b'STRNFLET'
+
+FLEET_SECTIONS = (
+    ('string_offsets', 'I'),
+    ('string_data', 'B'),
+    ('bus_code', 'I'),
+    ('bus_route', 'I'),
+    ('bus_hour', 'i'),
+    ('bus_lat', 'd'),
+    ('bus_long', 'd'),
+    ('text_row', 'I'),
+    ('text_lat', 'I'),
+    ('text_long', 'I'),
+)
+
+default = None
+
+
+class SharedFleetTable(FleetTable):
+    """
+    The buses of a `FleetFile`, as a `tables.FleetTable`,
+    read-only.
+    """
+
+    def __init__(self, mapped):
+        self.codes = snapshot.Strings(mapped, mapped.column('bus_code'))
+        self.routes = snapshot.Strings(mapped, range(mapped.counts[0]))
+        self.route_rows = mapped.column('bus_route')
+        self.hours = mapped.column('bus_hour')
+        self.lats = mapped.column('bus_lat')
+        self.longs = mapped.column('bus_long')
+        lats = snapshot.Strings(mapped, mapped.column('text_lat'))
+        longs = snapshot.Strings(mapped, mapped.column('text_long'))
+        self.texts = dict(
+            (row, (lats[i], longs[i]))
+            for i, row in enumerate(mapped.column('text_row')))
+        self.frozen = True
+        self.__rows__ = None
+
+    def by_route(self, route_code):
+        return [row for row in self if row.route_code == route_code]
+
+
+class FleetFile(snapshot.MappedFile):
+    """
+    A snapshot of the fleet, mapped in memory.
+    """
+
+    magic = FLEET_MAGIC
+    sections = FLEET_SECTIONS
+
+    def table(self):
+        """
+        Returns the buses as a `SharedFleetTable`, without copy.
+        """
+
+        return SharedFleetTable(self)
+
+
+def dump_fleet(path, table):
+    """
+    Writes the fleet to `path`, replacing it at once.
+
+    @param table: A `tables.FleetTable`.
+    """
+
+    strings = snapshot.StringTable()
+    texts = sorted(table.texts.items())
+    sections = dict(
+        bus_code=strings.column(table.codes),
+        bus_route=[strings.add(table.routes[r]) for r in table.route_rows],
+        bus_hour=table.hours,
+        bus_lat=table.lats,
+        bus_long=table.longs,
+        text_row=[row for row, _ in texts],
+        text_lat=strings.column(lat for _, (lat, _) in texts),
+        text_long=strings.column(long for _, (_, long) in texts),
+    )
+    sections.update(strings.sections())
+
+    snapshot.write(path, snapshot.pack(
+        FleetFile, sections, counts=(len(strings), len(table), 0, 0)))
+
+
+class Shared(object):
+    """
+    The shared cache of a process.
+
+    @attribute path: The shared directory.
+    @attribute refresher: If this process is the refresher.
+    @attribute fleet: The last `FleetFile` loaded, or `None`.
+    @attribute network: The last `snapshot.Snapshot` loaded,
+        or `None`.
+    """
+
+    def __init__(self, path=None, fleet=fleet.default):
+        """
+        @constructor
+
+        @param path: The shared directory, default is
+            `settings.SHARED_PATH`. It's created if needed.
+        @param fleet: The `fleet.Fleet` loaded from the shared
+            fleet.
+        """
+
+        self.path = os.path.expanduser(path or settings.SHARED_PATH)
+        # The processes starting at once may create it as well.
+        os.makedirs(self.path, exist_ok=True)
+
+        self.target = fleet
+        self.refresher = False
+        self.fleet = None
+        self.network = None
+        self.__lock__ = threading.RLock()
+        self.__lock_file__ = None
+        self.__loaded__ = dict()
+        self.__refreshed__ = dict()
+        self.__running__ = threading.Event()
+        self.__thread__ = None
+
+    def file(self, name):
+        """
+        Returns the path of the file `name` at the shared directory.
+        """
+
+        return os.path.join(self.path, name)
+
+    def elect(self):
+        """
+        Tries to become the refresher, if no other process is.
+
+        @return: If this process is the refresher.
+        """
+
+        if self.refresher or fcntl is None:
+            return self.refresher
+
+        f = open(self.file(LOCK_FILE), 'a')
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except (IOError, OSError):
+            f.close()
+            return False
+
+        self.__lock_file__ = f
+        self.refresher = True
+        log.info('Process %d is the refresher of %s',
+                 os.getpid(), self.path)
+        return True
+
+    def resign(self):
+        """
+        Stops being the refresher, so another process takes
+        its place.
+        """
+
+        with self.__lock__:
+            if self.__lock_file__ is not None:
+                self.__lock_file__.close()
+                self.__lock_file__ = None
+            self.refresher = False
+
+    def due(self, name, interval):
+        last = self.__refreshed__.get(name)
+        if last is None and os.path.exists(self.file(name)):
+            last = os.path.getmtime(self.file(name))
+        return last is None or time.time() - last >= interval
+
+    def refresh(self, force=False):
+        """
+        Writes the shared files that are due, if this process
+        is the refresher.
+
+        @param force: If the files must be written even if
+            they're not due.
+        """
+
+        if not self.refresher:
+            return
+
+        if force or self.due(FLEET_FILE, self.target.interval):
+            dump_fleet(self.file(FLEET_FILE), FleetTable.fetch())
+            self.__refreshed__[FLEET_FILE] = time.time()
+
+        if force or self.due(NETWORK_FILE, NETWORK_INTERVAL):
+            # Fetched again, not from the cache loaded from the file.
+            routes = Route.load(api.get(Route.endpoint))
+            stops = Stop.load(api.get(Stop.endpoint))
+            index = network.Network()
+            index.load(routes)
+            links = dict((route, index.stops(route)) for route in routes)
+
+            snapshot.dump(self.file(NETWORK_FILE), routes, stops, links)
+            self.__refreshed__[NETWORK_FILE] = time.time()
+
+    def changed(self, name):
+        """
+        If the file `name` was replaced since it was loaded.
+        """
+
+        try:
+            stat = os.stat(self.file(name))
+        except OSError:
+            return False
+
+        return self.__loaded__.get(name) != (stat.st_ino, stat.st_mtime)
+
+    def load(self):
+        """
+        Loads the shared files replaced since the last call: the
+        fleet is set as the snapshot of `fleet.default` and the
+        network is installed (see `snapshot.Snapshot.install`).
+        """
+
+        with self.__lock__:
+            if self.changed(NETWORK_FILE):
+                previous, self.network = self.network, self.__open__(
+                    snapshot.Snapshot, NETWORK_FILE)
+                self.network.install()
+                if previous is not None:
+                    previous.close()
+
+            if self.changed(FLEET_FILE):
+                # The previous file is unmapped when its snapshot
+                # is released (e.g.: after the poller compares it).
+                self.fleet = self.__open__(FleetFile, FLEET_FILE)
+                self.target.update(self.fleet.table(), self.fleet.created)
+
+    def __open__(self, cls, name):
+        path = self.file(name)
+        stat = os.stat(path)
+        mapped = cls(path)
+        self.__loaded__[name] = stat.st_ino, stat.st_mtime
+        return mapped
+
+    def source(self):
+        """
+        Updates `fleet.default` instead of requesting the buses:
+        from the shared file or, at the refresher, fetching them
+        and writing the file (see `fleet.Fleet.source`). Until the
+        file is written, they're requested.
+        """
+
+        with self.__lock__:
+            self.refresh()
+            self.load()
+
+            if self.fleet is None:
+                # Not written by the refresher yet.
+                self.target.update(FleetTable.fetch())
+
+    def check(self):
+        """
+        Refreshes the files (becoming the refresher if there's
+        none) and loads them.
+        """
+
+        try:
+            self.elect()
+            self.refresh()
+            self.load()
+        except Exception:
+            log.exception('Error refreshing the shared cache %s', self.path)
+
+    def run(self):
+        while not self.__running__.wait(CHECK_INTERVAL):
+            self.check()
+
+    def start(self):
+        """
+        Loads the shared files and starts checking them at a
+        background thread, every `CHECK_INTERVAL` seconds.
+        """
+
+        if settings.TOKEN_FILE is None:
+            settings.configure(TOKEN_FILE=self.file(TOKEN_FILE))
+
+        self.check()
+        self.target.source = self.source
+
+        self.__running__.clear()
+        self.__thread__ = threading.Thread(
+            target=self.run, name='stranspyra-shared')
+        self.__thread__.daemon = True
+        self.__thread__.start()
+
+    def stop(self):
+        """
+        Stops the background thread and the refreshing.
+        """
+
+        self.__running__.set()
+        if self.__thread__ is not None:
+            self.__thread__.join()
+            self.__thread__ = None
+        if self.target.source == self.source:
+            self.target.source = None
+        self.resign()
+
+
+def attach(path=None):
+    """
+    Starts using the shared cache at this process, as `default`.
+    With pre-fork servers, it must be called at each worker,
+    after the fork.
+
+    @param path: The shared directory, default is
+        `settings.SHARED_PATH`.
+
+    @return: The `Shared` instance.
+    """
+
+    global default
+
+    detach()
+    default = Shared(path)
+    default.start()
+    return default
+
+
+def detach():
+    """
+    Stops using the shared cache at this process.
+    """
+
+    global default
+
+    if default is not None:
+        default.stop()
+        default = None
@@ -0,0 +1,689 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Binary snapshot of the static network: the routes, the stops and
+the stops of each route.
+
+The snapshot is written once (e.g.: by a deploy job) and opened
+by the workers, that map the file and read it in place, without
+parsing, sharing its pages through the OS cache:
+
+>>> from stranspyra import snapshot
+>>> snapshot.dump('network.snap')  # Route.all, Stop.all, get_stops
+>>> net = snapshot.open('network.snap')
+>>> net.route('0401').stops()[:2]
+[<StopRow 2244 PC1 UFPI>, <StopRow 875 RUA DIRCE DE OLIVEIRA 4 >]
+>>> net.stops.find(2244).routes()
+[<RouteRow 0401 UNIVERSIDADE>, ...]
+
+The models can also be loaded from it, so the catalog and the
+stops of the routes are not requested (see `Snapshot.install`).
+
+The file is little-endian, starting with the header (`HEADER`:
+magic, version, flags, creation time and counts), followed by the
+offset and size of each one of `SECTIONS`, 8 bytes aligned. The
+strings are kept once, at a string table (`string_offsets` and
+`string_data`), the columns have their ids. The stops of each
+route (`links`) and the routes of each stop (`stop_routes`) are
+kept as compressed sparse rows, delimited by `route_first` and
+`stop_first`. `route_order` and `stop_order` are the rows sorted
+by code, for the lookups by code.
+"""
+
+import bisect
+import io
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import time
+from array import array
+
+from . import cache
+from .cache import CATALOG_EXPIRES
+from .compact import boolean
+from .exceptions import SnapshotError
+from .models import Route, Stop
+from .search import SearchIndex
+from .tables import Row, StopRow, StopTable, Table
+
+MAGIC = b'STRNSNAP'
+VERSION = 1
+
+# The stop codes are integers.
+FLAG_INT_STOP_CODES = 1
+
+HEADER = struct.Struct('<8sIIdIIII')
+SECTION = struct.Struct('<QQ')
+
+# The sections, in the file order, with their array type.
+SECTIONS = (
+    ('string_offsets', 'I'),
+    ('string_data', 'B'),
+    ('route_code', 'I'),
+    ('route_description', 'I'),
+    ('route_source', 'I'),
+    ('route_dest', 'I'),
+    ('route_circular', 'B'),
+    ('route_first', 'I'),
+    ('route_order', 'I'),
+    ('stop_code', 'I'),
+    ('stop_description', 'I'),
+    ('stop_address', 'I'),
+    ('stop_lat', 'd'),
+    ('stop_long', 'd'),
+    ('stop_first', 'I'),
+    ('stop_order', 'I'),
+    ('links', 'I'),
+    ('stop_routes', 'I'),
+)
+
+# Array type codes of 4 bytes unsigned integers.
+UINT32 = 'I' if array('I').itemsize == 4 else 'L'
+LITTLE_ENDIAN = sys.byteorder == 'little'
+
+
+def typecode(code):
+    return UINT32 if code == 'I' else code
+
+
+def text(value):
+    return u'{0}'.format(value)
+
+
+class Strings(object):
+    """
+    A column of strings of the snapshot, decoded on access.
+    """
+
+    def __init__(self, snapshot, ids, convert=None):
+        self.snapshot = snapshot
+        self.ids = ids
+        self.convert = convert
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, i):
+        value = self.snapshot.string(self.ids[i])
+        return self.convert(value) if self.convert else value
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+class Lookup(object):
+    """
+    Finds the row of a code, by binary search over the rows
+    sorted by code.
+    """
+
+    def __init__(self, codes, order):
+        self.codes = codes
+        self.order = order
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, i):
+        return self.codes[self.order[i]]
+
+    def find(self, code):
+        i = bisect.bisect_left(self, code)
+        if i < len(self) and self[i] == code:
+            return self.order[i]
+        return None
+
+
+class RouteRow(Row):
+    """
+    A view of a route at a snapshot. Has the attributes of
+    `Route`, with `circular` as a boolean.
+    """
+
+    __slots__ = ()
+
+    @property
+    def description(self):
+        return self.table.descriptions[self.row]
+
+    @property
+    def source(self):
+        return self.table.sources[self.row]
+
+    @property
+    def dest(self):
+        return self.table.dests[self.row]
+
+    @property
+    def circular(self):
+        return bool(self.table.circulars[self.row])
+
+    def stops(self):
+        """
+        Returns the stops of the route, in order.
+
+        @return: A list of `StopRow` views.
+        """
+
+        return self.table.snapshot.stops_of(self.row)
+
+    def to_model(self):
+        """
+        Returns the `Route` instance of this row.
+        """
+
+        return Route.get(self.code)
+
+    def __repr__(self):
+        return u'<RouteRow {0} {1}>'.format(self.code, self.description)
+
+
+class SnapshotStopRow(StopRow):
+    """
+    A view of a stop at a snapshot, as `tables.StopRow`.
+    """
+
+    __slots__ = ()
+
+    def routes(self):
+        """
+        Returns the routes passing by the stop.
+
+        @return: A list of `RouteRow` views.
+        """
+
+        return self.table.snapshot.routes_of(self.row)
+
+
+class RouteTable(Table):
+    """
+    The routes of a snapshot.
+    """
+
+    row = RouteRow
+
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+        self.codes = Strings(snapshot, snapshot.column('route_code'))
+        self.descriptions = Strings(
+            snapshot, snapshot.column('route_description'))
+        self.sources = Strings(snapshot, snapshot.column('route_source'))
+        self.dests = Strings(snapshot, snapshot.column('route_dest'))
+        self.circulars = snapshot.column('route_circular')
+        self.lats = self.longs = None
+        self.frozen = True
+        self.__lookup__ = Lookup(self.codes, snapshot.column('route_order'))
+
+    def position(self, code):
+        return self.__lookup__.find(code)
+
+
+class SnapshotStopTable(StopTable):
+    """
+    The stops of a snapshot, as a `tables.StopTable` (e.g.: it
+    can be searched by `batch.Engine`), read-only.
+    """
+
+    row = SnapshotStopRow
+
+    def __init__(self, snapshot):
+        convert = int if snapshot.flags & FLAG_INT_STOP_CODES else None
+
+        self.snapshot = snapshot
+        self.codes = Strings(snapshot, snapshot.column('stop_code'), convert)
+        self.descriptions = Strings(
+            snapshot, snapshot.column('stop_description'))
+        self.addresses = Strings(snapshot, snapshot.column('stop_address'))
+        self.lats = snapshot.column('stop_lat')
+        self.longs = snapshot.column('stop_long')
+        self.frozen = True
+        self.__lookup__ = Lookup(self.codes, snapshot.column('stop_order'))
+
+    def position(self, code):
+        return self.__lookup__.find(code)
+
+
+class MappedFile(object):
+    """
+    The base of the files mapped in memory: a header (`HEADER`)
+    followed by the offset and size of each one of `sections`.
+
+    @attribute version: The format version of the file.
+    @attribute flags: The flags of the file.
+    @attribute created: When the file was written.
+    @attribute counts: The 4 counts of the header.
+    """
+
+    magic = MAGIC
+    version = VERSION
+    sections = SECTIONS
+
+    def __init__(self, path):
+        """
+        @constructor
+
+        @param path: The file path.
+
+        Raises `SnapshotError` if it's not a valid file.
+        """
+
+        self.path = path
+        with io.open(path, 'rb') as f:
+            self.__mmap__ = mmap.mmap(
+                f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__views__ = []
+
+        try:
+            self.__header__()
+        except Exception:
+            self.close()
+            raise
+
+    def __header__(self):
+        buf = self.__mmap__
+        if len(buf) < HEADER.size + SECTION.size * len(self.sections):
+            raise SnapshotError('{0}: too short'.format(self.path))
+
+        header = HEADER.unpack_from(buf, 0)
+        magic, version, self.flags, self.created = header[:4]
+        self.counts = header[4:]
+        if magic != self.magic:
+            raise SnapshotError('{0}: not a {1} file'.format(
+                self.path, type(self).__name__))
+        if version != self.version:
+            raise SnapshotError('{0}: unsupported version {1}'.format(
+                self.path, version))
+
+        self.__sections__ = dict()
+        for i, (name, code) in enumerate(self.sections):
+            offset, size = SECTION.unpack_from(
+                buf, HEADER.size + i * SECTION.size)
+            if offset + size > len(buf):
+                raise SnapshotError('{0}: truncated'.format(self.path))
+            self.__sections__[name] = offset, size, code
+
+        self.__string_offsets__ = self.column('string_offsets')
+        self.__string_data__ = self.view('string_data')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def view(self, name):
+        """
+        Returns the bytes of the section `name`, without copy.
+
+        @return: A `memoryview`.
+        """
+
+        offset, size, _ = self.__sections__[name]
+        view = memoryview(self.__mmap__)[offset:offset + size]
+        self.__views__.append(view)
+        return view
+
+    def column(self, name):
+        """
+        Returns the array of the section `name`. It's a view of
+        the file, except at big-endian platforms, where it's
+        converted.
+
+        @return: A `memoryview` or a `array.array`.
+        """
+
+        code = typecode(self.__sections__[name][2])
+        view = self.view(name)
+
+        if LITTLE_ENDIAN:
+            column = view.cast(code)
+            self.__views__.append(column)
+            return column
+
+        column = array(code)
+        column.frombytes(view.tobytes())
+        column.byteswap()
+        return column
+
+    def string(self, i):
+        """
+        Returns the string `i` of the string table.
+        """
+
+        start, end = self.__string_offsets__[i], \
+            self.__string_offsets__[i + 1]
+        return self.__string_data__[start:end].tobytes().decode('utf-8')
+
+    def close(self):
+        """
+        Unmaps the file. The rows and columns can't be used after.
+        While other arrays still point to the file (e.g.: the
+        NumPy arrays of `coordinates`), it's unmapped when they're
+        released.
+        """
+
+        try:
+            for view in reversed(self.__views__):
+                view.release()
+            self.__mmap__.close()
+        except BufferError:
+            pass
+        self.__views__ = []
+
+
+class Snapshot(MappedFile):
+    """
+    A snapshot of the network, mapped in memory.
+
+    @attribute routes: A `RouteTable`.
+    @attribute stops: A `SnapshotStopTable`.
+    """
+
+    def __init__(self, path):
+        """
+        @constructor
+
+        @param path: The snapshot file.
+
+        Raises `SnapshotError` if it's not a valid snapshot.
+        """
+
+        super(Snapshot, self).__init__(path)
+
+        self.routes = RouteTable(self)
+        self.stops = SnapshotStopTable(self)
+        self.__links__ = self.column('links')
+        self.__stop_routes__ = self.column('stop_routes')
+        self.__route_first__ = self.column('route_first')
+        self.__stop_first__ = self.column('stop_first')
+
+    def route(self, code):
+        """
+        Returns the route of `code`, or `None`.
+
+        @return: A `RouteRow`.
+        """
+
+        return self.routes.find(code)
+
+    def stop(self, code):
+        """
+        Returns the stop of `code`, or `None`.
+
+        @return: A `SnapshotStopRow`.
+        """
+
+        return self.stops.find(code)
+
+    def stops_of(self, row):
+        """
+        Returns the stops of the route at `row`.
+        """
+
+        first = self.__route_first__
+        return [self.stops[self.__links__[i]]
+                for i in range(first[row], first[row + 1])]
+
+    def routes_of(self, row):
+        """
+        Returns the routes of the stop at `row`.
+        """
+
+        first = self.__stop_first__
+        return [self.routes[self.__stop_routes__[i]]
+                for i in range(first[row], first[row + 1])]
+
+    def install(self, network=None):
+        """
+        Loads the models from the snapshot: the `Route` and `Stop`
+        instances are created and cached as `Route.all`, `Stop.all`
+        and `Route.get_stops` (if the cache is enabled), and indexed
+        at `network`, so they aren't requested.
+
+        @param network: A `network.Network`, default is the
+            `network` of the models.
+
+        @return: A `dict` of the list of stops, by route.
+        """
+
+        stops = Stop.load([
+            {'CodigoParada': row.code, 'Denomicao': row.description,
+             'Endereco': row.address, 'Lat': repr(row.lat),
+             'Long': repr(row.long)}
+            for row in self.stops
+        ])
+        routes = Route.load([
+            {'CodigoLinha': row.code, 'Denomicao': row.description,
+             'Origem': row.source, 'Retorno': row.dest,
+             'Circular': row.circular}
+            for row in self.routes
+        ])
+
+        first = self.__route_first__
+        links = dict(
+            (route, [stops[self.__links__[j]]
+                     for j in range(first[i], first[i + 1])])
+            for i, route in enumerate(routes)
+        )
+
+        (network or Route.network).extend(links, complete=True)
+        Route.__search__ = SearchIndex(routes, Route.search_fields)
+        Stop.__search__ = SearchIndex(stops, Stop.search_fields)
+        cache.store(Route, 'all', routes, CATALOG_EXPIRES)
+        cache.store(Stop, 'all', stops, CATALOG_EXPIRES)
+        for route, s in links.items():
+            cache.store(route, 'get_stops', s)
+
+        return links
+
+
+def open(path):
+    """
+    Opens a snapshot file (see `Snapshot`).
+    """
+
+    return Snapshot(path)
+
+
+class StringTable(object):
+    """
+    Builds the string table of a file, keeping each string once.
+    """
+
+    def __init__(self):
+        self.ids = dict()
+        self.offsets = array(UINT32, [0])
+        self.data = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def add(self, value):
+        """
+        Adds `value` (converted to text, `None` as empty).
+
+        @return: The string id.
+        """
+
+        value = u'' if value is None else text(value)
+        if value not in self.ids:
+            encoded = value.encode('utf-8')
+            self.ids[value] = len(self.ids)
+            self.data.append(encoded)
+            self.offsets.append(self.offsets[-1] + len(encoded))
+        return self.ids[value]
+
+    def column(self, values):
+        """
+        Adds `values`, returning the column of their ids.
+        """
+
+        return array(UINT32, [self.add(value) for value in values])
+
+    def sections(self):
+        """
+        Returns the `string_offsets` and `string_data` sections.
+        """
+
+        return {
+            'string_offsets': self.offsets,
+            'string_data': array('B', b''.join(self.data)),
+        }
+
+
+def pack(cls, sections, flags=0, counts=(0, 0, 0, 0)):
+    """
+    Returns the bytes of a file read by `cls`.
+
+    @param cls: A `MappedFile` class, with the `magic`, the
+        `version` and the `sections` layout.
+    @param sections: A `dict` of the arrays of each section.
+    @param flags: The flags of the header.
+    @param counts: The 4 counts of the header.
+    """
+
+    position = HEADER.size + SECTION.size * len(cls.sections)
+    table, body = [], []
+    for name, code in cls.sections:
+        values = array(typecode(code), sections[name])
+        if not LITTLE_ENDIAN:
+            values.byteswap()
+        chunk = values.tobytes()
+        padding = -position % 8
+        body.append(b'\0' * padding)
+        position += padding
+        table.append(SECTION.pack(position, len(chunk)))
+        body.append(chunk)
+        position += len(chunk)
+
+    header = HEADER.pack(cls.magic, cls.version, flags, time.time(),
+                         *counts)
+    return header + b''.join(table) + b''.join(body)
+
+
+def write(path, data):
+    """
+    Writes `data` to `path` at once: the readers have either the
+    previous or the new file, never a partial one.
+    """
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.snapshot-', dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)
+        os.rename(tmp, path)
+    except Exception:
+        os.remove(tmp)
+        raise
+
+
+def dump(path, routes=None, stops=None, links=None):
+    """
+    Writes a snapshot of the network at `path`, replacing it at
+    once (see `write`).
+
+    @param path: The snapshot file.
+    @param routes: A list of `Route` instances, default is
+        `Route.all()`.
+    @param stops: A list of `Stop` instances, default is
+        `Stop.all()`. The stops of the routes are added.
+    @param links: A `dict` of the list of stops by route, default
+        is fetched by `Route.prefetch_stops`.
+    """
+
+    if routes is None:
+        routes = Route.all()
+    if stops is None:
+        stops = Stop.all()
+    if links is None:
+        links = Route.prefetch_stops(routes)
+
+    stops = list(stops)
+    rows = dict((stop.code, i) for i, stop in enumerate(stops))
+    for route in routes:
+        for stop in links.get(route, ()):
+            if stop.code not in rows:
+                rows[stop.code] = len(stops)
+                stops.append(stop)
+
+    write(path, encode(routes, stops, rows, links))
+
+
+def encode(routes, stops, rows, links):
+    """
+    Returns the bytes of a snapshot.
+
+    @param routes: A list of `Route` instances.
+    @param stops: A list of `Stop` instances.
+    @param rows: A `dict` of the row of each stop, by code.
+    @param links: A `dict` of the list of stops by route.
+    """
+
+    strings = StringTable()
+
+    flags = FLAG_INT_STOP_CODES if all(
+        isinstance(stop.code, int) for stop in stops) else 0
+    convert = int if flags & FLAG_INT_STOP_CODES else text
+
+    route_rows = dict((route.code, i) for i, route in enumerate(routes))
+    route_links, route_first = [], [0]
+    for route in routes:
+        route_links.extend(rows[s.code] for s in links.get(route, ()))
+        route_first.append(len(route_links))
+
+    stop_routes = [[] for _ in stops]
+    for route in routes:
+        for s in links.get(route, ()):
+            stop_routes[rows[s.code]].append(route_rows[route.code])
+    stop_first = [0]
+    for r in stop_routes:
+        stop_first.append(stop_first[-1] + len(r))
+
+    sections = dict(
+        route_code=strings.column(r.code for r in routes),
+        route_description=strings.column(r.description for r in routes),
+        route_source=strings.column(r.source for r in routes),
+        route_dest=strings.column(r.dest for r in routes),
+        route_circular=[int(boolean(r.circular)) for r in routes],
+        route_first=route_first,
+        route_order=sorted(
+            range(len(routes)), key=lambda i: text(routes[i].code)),
+        stop_code=strings.column(s.code for s in stops),
+        stop_description=strings.column(s.description for s in stops),
+        stop_address=strings.column(s.address for s in stops),
+        stop_lat=[float(s.lat) for s in stops],
+        stop_long=[float(s.long) for s in stops],
+        stop_first=stop_first,
+        stop_order=sorted(
+            range(len(stops)), key=lambda i: convert(stops[i].code)),
+        links=route_links,
+        stop_routes=[i for r in stop_routes for i in r],
+    )
+    sections.update(strings.sections())
+
+    return pack(Snapshot, sections, flags, (
+        len(strings), len(routes), len(stops), len(route_links)))
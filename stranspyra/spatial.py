@@ -0,0 +1,284 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Spatial index for points like stops and buses.
+
+The points are projected to a plane (equirectangular projection
+around the points centroid, good enough at city scale) and
+indexed by a KD-tree. The candidates found at the tree are
+ranked again with `geopy.distance.distance`, so the results
+are the same of computing the distance to every point.
+
+>>> index = SpatialIndex(Stop.all())
+>>> index.nearest(-5.056221603326806, -42.79030821362158)
+(<Stop 911 Campos Universitario - CCS>, Distance(0.0621590283922))
+"""
+
+import heapq
+import math
+
+# Earth's mean radius, in kilometers.
+EARTH_RADIUS = 6371.0088
+
+# Extra candidates ranked by the exact distance, covering the
+# projection error for the ties.
+MARGIN = 3
+
+# Seconds before checking if the indexed stops have changed
+# (see `Stop.index`).
+EXPIRES = 3600
+
+# Relative error allowed for the projected distances at
+# radius queries, before the exact distance.
+TOLERANCE = 0.01
+
+
+def distance(*args, **kwargs):
+    """
+    Same as `geopy.distance.distance`, importing geopy on the
+    first call instead of with the package.
+
+    @return: A `geopy.distance.Distance`.
+    """
+
+    from geopy.distance import distance as geodesic
+    return geodesic(*args, **kwargs)
+
+
+def location(obj):
+    """
+    Default `key` of `SpatialIndex`, returns the `lat` and `long`
+    attributes of `obj`.
+    """
+
+    return obj.lat, obj.long
+
+
+def signature(objs, key=location):
+    """
+    Returns a hash of the codes and locations of `objs`, used
+    to know if a index must be rebuilt.
+
+    @param objs: A list of objects with the `code` attribute.
+    @param key: A callable returning the location of an object.
+
+    @return: A `int`.
+    """
+
+    return hash(tuple((obj.code,) + tuple(key(obj)) for obj in objs))
+
+
+class SpatialIndex(object):
+    """
+    KD-tree over the location of a list of objects.
+
+    @attribute signature: The `signature` of the indexed objects.
+    """
+
+    def __init__(self, objs, key=location):
+        """
+        @constructor
+
+        @param objs: A list of objects (e.g.: `Stop` instances).
+        @param key: A callable returning the latitude and longitude
+            of an object, default are its `lat` and `long`.
+        """
+
+        self.objs = list(objs)
+        self.key = key
+        self.signature = signature(self.objs, key)
+
+        self.coords = [tuple(map(float, key(obj))) for obj in self.objs]
+        if self.coords:
+            lat0 = sum(c[0] for c in self.coords) / len(self.coords)
+        else:
+            lat0 = 0.0
+        self.__cos__ = math.cos(math.radians(lat0))
+
+        self.points = [self.project(lat, long) for lat, long in self.coords]
+        self.__tree__ = self.__build__(list(range(len(self.points))), 0)
+
+    def __len__(self):
+        return len(self.objs)
+
+    def project(self, lat, long):
+        """
+        Projects `lat` and `long` to the index plane.
+
+        @return: A tuple `(x, y)`, in kilometers.
+        """
+
+        return (
+            math.radians(float(long)) * self.__cos__ * EARTH_RADIUS,
+            math.radians(float(lat)) * EARTH_RADIUS
+        )
+
+    def __build__(self, idx, depth):
+        if not idx:
+            return None
+
+        axis = depth % 2
+        idx.sort(key=lambda i: self.points[i][axis])
+        mid = len(idx) // 2
+
+        return (
+            idx[mid],
+            axis,
+            self.__build__(idx[:mid], depth + 1),
+            self.__build__(idx[mid + 1:], depth + 1)
+        )
+
+    def __knn__(self, point, k):
+        # Max-heap of the best `k`, as (-squared distance, index).
+        best = []
+        stack = [self.__tree__]
+
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            i, axis, left, right = node
+            p = self.points[i]
+            d = (p[0] - point[0]) ** 2 + (p[1] - point[1]) ** 2
+
+            if len(best) < k:
+                heapq.heappush(best, (-d, i))
+            elif d < -best[0][0]:
+                heapq.heapreplace(best, (-d, i))
+
+            diff = point[axis] - p[axis]
+            near, far = (left, right) if diff < 0 else (right, left)
+
+            if len(best) < k or diff ** 2 < -best[0][0]:
+                stack.append(far)
+            stack.append(near)
+
+        return [i for _, i in best]
+
+    def __range__(self, point, radius):
+        found = []
+        stack = [self.__tree__]
+        r2 = radius ** 2
+
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+
+            i, axis, left, right = node
+            p = self.points[i]
+            if (p[0] - point[0]) ** 2 + (p[1] - point[1]) ** 2 <= r2:
+                found.append(i)
+
+            diff = point[axis] - p[axis]
+            if diff - radius <= 0:
+                stack.append(left)
+            if diff + radius >= 0:
+                stack.append(right)
+
+        return found
+
+    def __rank__(self, idx, lat, long):
+        return sorted(
+            ((distance(self.coords[i], (lat, long)), i) for i in idx),
+            key=lambda x: (x[0], x[1])
+        )
+
+    def k_nearest(self, lat, long, k):
+        """
+        Searches the `k` nearest objects from `lat` and `long`.
+
+        @param lat: A float coercible value of latitude.
+        @param long: A float coercible value of longitude.
+        @param k: The number of objects.
+
+        @return: A list of tuples with an object and a `Distance`
+            (see geopy.distance), from the nearest.
+        """
+
+        lat, long = float(lat), float(long)
+        idx = self.__knn__(self.project(lat, long), k + MARGIN)
+
+        return [
+            (self.objs[i], d) for d, i in self.__rank__(idx, lat, long)[:k]
+        ]
+
+    def nearest(self, lat, long):
+        """
+        Searches the nearest object from `lat` and `long`.
+
+        @param lat: A float coercible value of latitude.
+        @param long: A float coercible value of longitude.
+
+        @return: A tuple with an object and a `Distance`
+            (see geopy.distance).
+        """
+
+        return self.k_nearest(lat, long, 1)[0]
+
+    def within(self, lat, long, radius):
+        """
+        Searches the objects at most `radius` kilometers from
+        `lat` and `long`.
+
+        @param lat: A float coercible value of latitude.
+        @param long: A float coercible value of longitude.
+        @param radius: The distance in kilometers.
+
+        @return: A list of tuples with an object and a `Distance`
+            (see geopy.distance), from the nearest.
+        """
+
+        lat, long = float(lat), float(long)
+        idx = self.__range__(
+            self.project(lat, long), radius * (1 + TOLERANCE))
+
+        return [
+            (self.objs[i], d) for d, i in self.__rank__(idx, lat, long)
+            if d.km <= radius
+        ]
+
+    def around(self, lat, long, radius):
+        """
+        Searches the objects at most `radius` kilometers from
+        `lat` and `long`, as `within`, but measuring the distance
+        at the index plane. It's faster, for when an approximated
+        distance is enough.
+
+        @param lat: A float coercible value of latitude.
+        @param long: A float coercible value of longitude.
+        @param radius: The distance in kilometers.
+
+        @return: A list of tuples with an object position at
+            `objs` and its distance in kilometers, from the nearest.
+        """
+
+        point = self.project(lat, long)
+
+        found = [
+            (i, math.hypot(self.points[i][0] - point[0],
+                           self.points[i][1] - point[1]))
+            for i in self.__range__(point, radius)
+        ]
+
+        return sorted(found, key=lambda x: x[1])
@@ -0,0 +1,483 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Columnar tables of stops and buses.
+
+The tables keep each attribute in a contiguous array, with
+the coordinates already as floats, instead of a object for
+each stop or bus. They use much less memory, and the arrays
+are used directly by the distance code (see `batch.Engine`).
+
+The rows are read through lightweight views:
+
+>>> table = StopTable.from_response(api.get('/paradas'))
+>>> table[0]
+<StopRow 2244 PC1 UFPI>
+>>> table[0].lat
+-5.056221
+>>> table.find(2244).to_model()
+<Stop 2244 PC1 UFPI>
+"""
+
+import datetime
+from array import array
+
+from . import api
+
+
+def seconds(hour):
+    """
+    Converts a hour like '12:05' (or '12:05:30'), or a
+    `datetime.time` (see `compact.hour`), to seconds since
+    midnight, -1 if it's not a valid hour.
+    """
+
+    if isinstance(hour, datetime.time):
+        return hour.hour * 3600 + hour.minute * 60 + hour.second
+
+    try:
+        parts = [int(p) for p in hour.split(':')]
+    except (AttributeError, ValueError):
+        return -1
+
+    return sum(p * m for p, m in zip(parts, (3600, 60, 1)))
+
+
+def coordinate(value):
+    """
+    Formats a coordinate as the API does (e.g.: '-5.04693500').
+    """
+
+    return '{0:.8f}'.format(value)
+
+
+def formatted(text, value):
+    """
+    If `text` is the coordinate `value` as formatted by the
+    API (see `coordinate`), or not a text at all.
+    """
+
+    return isinstance(text, (int, float)) or text == coordinate(value)
+
+
+def clock(seconds):
+    """
+    Converts seconds since midnight back to a hour like '12:05'
+    (or '12:05:30'), `None` if it's -1.
+    """
+
+    if seconds < 0:
+        return None
+
+    hour = '{0:02d}:{1:02d}'.format(seconds // 3600, seconds // 60 % 60)
+    if seconds % 60:
+        hour += ':{0:02d}'.format(seconds % 60)
+    return hour
+
+
+class Table(object):
+    """
+    The table base: a `codes` list, with the `lats` and `longs`
+    arrays of floats.
+
+    @attribute codes: The code of each row.
+    @attribute lats: A `array.array` of latitudes.
+    @attribute longs: A `array.array` of longitudes.
+    @attribute frozen: If the table can't be appended anymore
+        (see `freeze`).
+    """
+
+    row = None
+
+    def __init__(self):
+        self.codes = []
+        self.lats = array('d')
+        self.longs = array('d')
+        self.frozen = False
+        self.__rows__ = None
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        return self.row(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(self, i)
+
+    def position(self, code):
+        """
+        Returns the row of `code`, or `None`.
+        """
+
+        if self.__rows__ is None:
+            self.__rows__ = dict((c, i) for i, c in enumerate(self.codes))
+        return self.__rows__.get(code)
+
+    def find(self, code):
+        """
+        Returns the row view of `code`, or `None`.
+        """
+
+        i = self.position(code)
+        return None if i is None else self.row(self, i)
+
+    def freeze(self):
+        """
+        Makes the table read-only, so its arrays can be shared
+        (see `coordinates`). The tables built at once (e.g.: by
+        `from_response`) are frozen.
+
+        @return: The table.
+        """
+
+        self.frozen = True
+        return self
+
+    def check(self):
+        """
+        Raises `TypeError` if the table is frozen.
+        """
+
+        if self.frozen:
+            raise TypeError('The table is read-only')
+
+    def coordinates(self):
+        """
+        Returns the latitudes and longitudes as NumPy arrays,
+        sharing the memory of the table (no copy) if it's frozen.
+        Otherwise they're copied, an array exported can't grow.
+
+        Requires `numpy`.
+
+        @return: A tuple of two `numpy.ndarray`.
+        """
+
+        import numpy
+
+        if not self.frozen:
+            return (
+                numpy.array(self.lats, dtype=numpy.float64),
+                numpy.array(self.longs, dtype=numpy.float64)
+            )
+
+        return (
+            numpy.frombuffer(self.lats, dtype=numpy.float64),
+            numpy.frombuffer(self.longs, dtype=numpy.float64)
+        )
+
+
+class Row(object):
+    """
+    The row view base, pointing to a row of a table.
+    """
+
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table, row):
+        self.table = table
+        self.row = row
+
+    @property
+    def code(self):
+        return self.table.codes[self.row]
+
+    @property
+    def lat(self):
+        """
+        The latitude, as a `float`.
+        """
+        return self.table.lats[self.row]
+
+    @property
+    def long(self):
+        """
+        The longitude, as a `float`.
+        """
+        return self.table.longs[self.row]
+
+    def __eq__(self, other):
+        return self.code == other.code
+
+    def __hash__(self):
+        return hash(self.code)
+
+
+class StopRow(Row):
+    """
+    A view of a stop at a `StopTable`. Has the attributes
+    of `Stop`, with `lat` and `long` as floats.
+    """
+
+    __slots__ = ()
+
+    @property
+    def description(self):
+        return self.table.descriptions[self.row]
+
+    @property
+    def address(self):
+        return self.table.addresses[self.row]
+
+    def to_model(self):
+        """
+        Returns the `Stop` instance of this row.
+        """
+
+        from .models import Stop
+
+        return Stop.get(self.code)
+
+    def __repr__(self):
+        return u'<StopRow {0} {1}>'.format(self.code, self.description)
+
+
+class StopTable(Table):
+    """
+    A table of stops.
+
+    @attribute descriptions: The description of each row.
+    @attribute addresses: The address of each row.
+    """
+
+    row = StopRow
+
+    def __init__(self):
+        super(StopTable, self).__init__()
+        self.descriptions = []
+        self.addresses = []
+
+    def append(self, code, description, address, lat, long):
+        """
+        Adds a stop at the end of the table.
+        """
+
+        self.check()
+        self.codes.append(code)
+        self.descriptions.append(description)
+        self.addresses.append(address)
+        self.lats.append(float(lat))
+        self.longs.append(float(long))
+        self.__rows__ = None
+
+    @classmethod
+    def from_response(cls, info):
+        """
+        Builds the table from the list returned by `paradas`
+        (or the `Paradas` of `paradasLinha`), without creating
+        `Stop` instances.
+        """
+
+        table = cls()
+        for i in info:
+            table.append(i['CodigoParada'], i['Denomicao'], i['Endereco'],
+                         i['Lat'], i['Long'])
+        return table.freeze()
+
+    @classmethod
+    def fetch(cls):
+        """
+        Fetches all the stops from `paradas` as a table.
+        """
+
+        return cls.from_response(api.get('/paradas'))
+
+    @classmethod
+    def from_models(cls, stops):
+        """
+        Builds the table from a list of `Stop` instances.
+        """
+
+        table = cls()
+        for stop in stops:
+            table.append(stop.code, stop.description, stop.address,
+                         stop.lat, stop.long)
+        return table.freeze()
+
+
+class BusRow(Row):
+    """
+    A view of a bus at a `FleetTable`, with `lat` and `long`
+    as floats and `hour` as seconds since midnight.
+    """
+
+    __slots__ = ()
+
+    @property
+    def route_code(self):
+        """
+        The code of the route of the bus.
+        """
+        return self.table.routes[self.table.route_rows[self.row]]
+
+    @property
+    def hour(self):
+        """
+        The last location update, in seconds since midnight
+        (-1 if unknown).
+        """
+        return self.table.hours[self.row]
+
+    def state(self):
+        """
+        Returns the state of the bus: a tuple with its latitude,
+        longitude, route code and last update hour (as '12:05').
+        """
+
+        return self.lat, self.long, self.route_code, clock(self.hour)
+
+    def raw(self):
+        """
+        Returns the bus as returned by `veiculos`.
+
+        @return: A `dict`.
+        """
+
+        lat, long = self.table.texts.get(self.row) or (
+            coordinate(self.lat), coordinate(self.long))
+
+        return {
+            'CodigoVeiculo': self.code,
+            'Lat': lat,
+            'Long': long,
+            'Hora': clock(self.hour),
+        }
+
+    def to_model(self, model=None):
+        """
+        Returns the instance of this row (the one alive, updated,
+        if there's one, see `Model.__new__`).
+
+        @param model: The model, default is `Bus`.
+        """
+
+        if model is None:
+            from .models import Bus as model
+
+        bus = model(self.raw())
+        bus.__move__(self.route_code)
+        return bus
+
+    def __repr__(self):
+        return u'<BusRow {0} - {1}>'.format(self.code, self.route_code)
+
+
+class FleetTable(Table):
+    """
+    A table of buses.
+
+    @attribute routes: The route codes, each one once.
+    @attribute route_rows: A `array.array` with the position of
+        the route of each bus at `routes`.
+    @attribute hours: A `array.array` with the last location
+        update of each bus, in seconds since midnight.
+    @attribute texts: The latitude and longitude of the rows as
+        returned by the API, by row, only of the ones that are not
+        formatted as usual (see `coordinate`).
+    """
+
+    row = BusRow
+
+    def __init__(self):
+        super(FleetTable, self).__init__()
+        self.routes = []
+        self.route_rows = array('i')
+        self.hours = array('i')
+        self.texts = dict()
+        self.__route_rows__ = dict()
+
+    def append(self, code, route_code, lat, long, hour):
+        """
+        Adds a bus at the end of the table.
+        """
+
+        self.check()
+        r = self.__route_rows__.get(route_code)
+        if r is None:
+            r = self.__route_rows__[route_code] = len(self.routes)
+            self.routes.append(route_code)
+
+        i = len(self.codes)
+        self.codes.append(code)
+        self.route_rows.append(r)
+        self.lats.append(float(lat))
+        self.longs.append(float(long))
+        self.hours.append(seconds(hour))
+        if not (formatted(lat, self.lats[i]) and
+                formatted(long, self.longs[i])):
+            self.texts[i] = lat, long
+        self.__rows__ = None
+
+    def by_route(self, route_code):
+        """
+        Returns the rows of the buses of a route.
+
+        @return: A list of `BusRow`.
+        """
+
+        r = self.__route_rows__.get(route_code)
+        return [
+            self.row(self, i) for i, x in enumerate(self.route_rows) if x == r
+        ]
+
+    @classmethod
+    def from_response(cls, info):
+        """
+        Builds the table from the list returned by `veiculos`,
+        without creating `Bus` instances.
+        """
+
+        table = cls()
+        for route in info:
+            code = route['Linha']['CodigoLinha']
+            for car in route['Linha']['Veiculos']:
+                table.append(car['CodigoVeiculo'], code,
+                             car['Lat'], car['Long'], car['Hora'])
+        return table.freeze()
+
+    @classmethod
+    def fetch(cls):
+        """
+        Fetches the whole fleet from `veiculos` as a table.
+
+        It doesn't update `fleet.default`, see `fleet.Snapshot.table`
+        for the table of the current snapshot.
+        """
+
+        return cls.from_response(api.get('/veiculos'))
+
+    @classmethod
+    def from_models(cls, buses):
+        """
+        Builds the table from a list of `Bus` instances.
+        """
+
+        table = cls()
+        for bus in buses:
+            table.append(bus.code, bus.__route_code__,
+                         bus.__lat__, bus.__long__, bus.hour)
+        return table.freeze()
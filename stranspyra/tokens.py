@@ -0,0 +1,282 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Access token of the Inthegra API.
+
+`/signin` returns a token valid for `minutos` minutes. The
+`TokenManager` keeps it with its expiration, logging in again
+before it expires (in background, while the current one is still
+valid) and when the API says it has expired. Concurrent threads
+wait for the login in flight instead of each one logging in.
+
+With `settings.TOKEN_FILE`, the token is kept at that file, shared
+by all the processes using it (e.g.: the workers of a server):
+only one of them logs in, holding a lock of the file, and the
+others read the token logged.
+
+>>> from stranspyra import api
+>>> api.tokens.get()
+'a1b2c3...'
+"""
+
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+from . import metrics
+from .conf import settings
+
+# Seconds before the expiration the token is refreshed.
+MARGIN = 60
+
+
+class TokenManager(object):
+    """
+    Keeps the access token, logging in when needed.
+
+    @attribute token: The current token, or `None`.
+    @attribute expires: The expiration timestamp of `token`, or
+        `None` if the API didn't inform it.
+    """
+
+    def __init__(self, login, margin=MARGIN):
+        """
+        @constructor
+
+        @param login: A callable logging in, returning the json
+            decoded response of `/signin`.
+        @param margin: Seconds before the expiration the token
+            is refreshed.
+        """
+
+        self.login = login
+        self.margin = margin
+        self.token = None
+        self.expires = None
+        self.__lock__ = threading.Lock()
+        self.__refreshing__ = False
+
+    def path(self):
+        """
+        Returns the file shared by the processes, from
+        `settings.TOKEN_FILE`.
+
+        @return: A path, or `None` if the token isn't shared.
+        """
+
+        path = getattr(settings, 'TOKEN_FILE', None)
+        return os.path.expanduser(path) if path else None
+
+    def owner(self):
+        """
+        Returns who the token belongs to, so a shared file of
+        other user or server is not used.
+        """
+
+        return '{0} {1}'.format(settings.URL, settings.EMAIL)
+
+    def valid(self, margin=0):
+        """
+        If there's a token and it's not expired, or about to
+        expire in `margin` seconds.
+
+        @return: Boolean.
+        """
+
+        if not self.token:
+            return False
+        return self.expires is None or time.time() + margin < self.expires
+
+    def set(self, res):
+        """
+        Keeps the token of a `/signin` response.
+
+        @param res: The json decoded response, with the keys
+            `token` and `minutos`.
+
+        @return: If the response has a token.
+        """
+
+        try:
+            token = res['token']
+        except Exception:
+            return False
+
+        minutes = res.get('minutos')
+        self.token = token
+        self.expires = time.time() + float(minutes) * 60 \
+            if minutes else None
+        return True
+
+    def state(self):
+        """
+        Returns the token as the `/signin` response.
+
+        @return: A `dict` with the keys `token` and `minutos`.
+        """
+
+        minutes = None
+        if self.expires is not None:
+            minutes = max(self.expires - time.time(), 0) / 60.
+        return {'token': self.token, 'minutos': minutes}
+
+    def get(self):
+        """
+        Returns a valid token, logging in if there's none. If
+        it's about to expire, it's refreshed in background.
+
+        @return: The token.
+        """
+
+        if not self.valid():
+            self.refresh(self.token)
+        elif not self.valid(self.margin):
+            self.refresh_async()
+
+        return self.token
+
+    def refresh(self, stale=None):
+        """
+        Logs in again, if the token is still `stale`. If other
+        thread (or process, see `settings.TOKEN_FILE`) has already
+        refreshed it, the new token is used.
+
+        @param stale: The token to be replaced.
+
+        @return: The token as the `/signin` response (see `state`),
+            or the response if the login failed.
+        """
+
+        with self.__lock__:
+            if self.token != stale and self.valid():
+                return self.state()
+
+            path = self.path()
+            if path is None:
+                return self.__login__()
+
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+            with os.fdopen(fd, 'r+') as f:
+                if fcntl is not None:
+                    fcntl.flock(f, fcntl.LOCK_EX)
+                try:
+                    shared = self.read(f)
+                    if shared and shared['token'] != stale and \
+                       shared['owner'] == self.owner() and \
+                       (shared['expires'] is None or
+                            time.time() + self.margin < shared['expires']):
+                        self.token = shared['token']
+                        self.expires = shared['expires']
+                        return self.state()
+
+                    res = self.__login__()
+                    if self.valid():
+                        self.write(f)
+                    return res
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __login__(self):
+        if metrics.enabled:
+            metrics.auth('refresh' if self.token else 'login')
+
+        res = self.login()
+        self.set(res)
+        return res
+
+    def refresh_async(self):
+        """
+        Refreshes the token at a background thread, if it's not
+        being refreshed yet.
+        """
+
+        # Not waiting for the lock: if it's held, the token is
+        # being refreshed (see `refresh`) or cleared.
+        if not self.__lock__.acquire(False):
+            return
+        try:
+            if self.__refreshing__:
+                return
+            self.__refreshing__ = True
+            stale = self.token
+        finally:
+            self.__lock__.release()
+
+        def _refresh():
+            try:
+                self.refresh(stale)
+            except Exception:
+                # The token will be refreshed again on the next use.
+                pass
+            finally:
+                with self.__lock__:
+                    self.__refreshing__ = False
+
+        thread = threading.Thread(target=_refresh)
+        thread.daemon = True
+        thread.start()
+
+    def read(self, f):
+        """
+        Reads the token shared at the file `f`.
+
+        @return: A `dict` with the keys `token`, `expires` and
+            `owner`, or `None` if there's no token.
+        """
+
+        f.seek(0)
+        try:
+            shared = json.loads(f.read())
+            shared['token'], shared['expires'], shared['owner']
+        except (ValueError, TypeError, KeyError):
+            return None
+        return shared
+
+    def write(self, f):
+        """
+        Writes the current token at the file `f`.
+        """
+
+        f.seek(0)
+        f.truncate()
+        f.write(json.dumps({
+            'token': self.token,
+            'expires': self.expires,
+            'owner': self.owner(),
+        }))
+        f.flush()
+
+    def clear(self):
+        """
+        Discards the token, the next use logs in again.
+        """
+
+        with self.__lock__:
+            self.token = None
+            self.expires = None
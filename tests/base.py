@@ -0,0 +1,94 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+The base of the tests made against the `MockServer`.
+"""
+
+import unittest
+
+from benchmarks.fixtures import generate
+from benchmarks.server import MockServer
+
+from stranspyra import api, cache, fleet, network
+from stranspyra.conf import configure, settings
+
+# The size of the network served, smaller than the Teresina one.
+SIZE = {'routes': 20, 'stops': 200, 'buses': 60}
+
+
+class APITestCase(unittest.TestCase):
+    """
+    Serves a network of `SIZE` for each test class, configured
+    before each test with the caches cleared.
+
+    @attribute data: The `benchmarks.fixtures.Fixtures` served.
+    @attribute server: The `benchmarks.server.MockServer`.
+    @attribute settings: The settings of the tests of the class,
+        besides the ones of the server.
+    """
+
+    size = SIZE
+    settings = {}
+
+    @classmethod
+    def setUpClass(cls):
+        cls.data = generate(size=cls.size)
+        cls.server = MockServer(cls.data).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        api.close()
+        cls.server.stop()
+
+    def setUp(self):
+        settings.reset()
+        options = dict(
+            URL=self.server.url, API_KEY='test', EMAIL='test',
+            PASSWORD='test', USE_CACHE=True, CACHE_BACKEND='memory',
+            TOKEN_FILE=None)
+        options.update(self.settings)
+        configure(**options)
+
+        cache.clear()
+        network.default.clear()
+        fleet.default.__snapshot__ = None
+        self.server.counts.clear()
+
+    def tearDown(self):
+        settings.reset()
+
+    def requests(self, endpoint=None):
+        """
+        Returns the requests made to `endpoint`, or to all the
+        endpoints, since the test started.
+        """
+
+        if endpoint is None:
+            return self.server.requests()
+        return self.server.counts.get(endpoint, 0)
+
+    def route(self, i=0):
+        """
+        Returns the API object of the `i`th route served.
+        """
+
+        return self.data.routes[i]
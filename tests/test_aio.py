@@ -0,0 +1,152 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the asyncio interface.
+"""
+
+import asyncio
+import gc
+import time
+import unittest
+import warnings
+
+from stranspyra import aio, api
+from stranspyra.models import Bus, Route, Stop
+
+from .base import APITestCase
+
+
+@unittest.skipIf(aio.aiohttp is None, 'requires aiohttp')
+class AsyncTest(APITestCase):
+
+    def run_async(self, aw):
+        async def main():
+            try:
+                return await aw
+            finally:
+                await aio.close()
+
+        return asyncio.run(main())
+
+    def test_all(self):
+        routes = self.run_async(aio.all(Route))
+
+        self.assertEqual([r.code for r in routes],
+                         [r['CodigoLinha'] for r in self.data.routes])
+        self.assertIs(routes[0], Route.get(routes[0].code))
+
+    def test_search(self):
+        pattern = self.route()['Origem']
+        stops = self.run_async(aio.search(Stop, pattern))
+
+        self.assertTrue(stops)
+        for stop in stops:
+            self.assertIn(pattern, stop.description + stop.address)
+
+    def test_search_buses(self):
+        with self.assertRaises(NotImplementedError):
+            self.run_async(aio.search(Bus, 'x'))
+
+    def test_many(self):
+        routes = Route.all()[:5]
+
+        async def many():
+            return await asyncio.gather(
+                aio.get_stops_many(routes, limit=2),
+                aio.get_buses_many(routes, limit=2))
+
+        stops, buses = self.run_async(many())
+
+        for route, route_stops, route_buses in zip(routes, stops, buses):
+            expected = self.data.route_stops[route.code]
+            self.assertEqual([s.code for s in route_stops],
+                             [s['CodigoParada'] for s in expected])
+
+            expected = self.data.buses[route.code]
+            self.assertEqual(sorted(b.code for b in route_buses),
+                             sorted(b['CodigoVeiculo'] for b in expected))
+            for bus in route_buses:
+                self.assertIs(bus.route, route)
+
+    def test_token_expired(self):
+        self.run_async(aio.get('/linhas'))
+        self.server.__tokens__.clear()
+        self.run_async(aio.get('/linhas'))
+
+        self.assertEqual(self.requests('/signin'), 2)
+        self.assertEqual(self.requests('/linhas'), 3)
+
+    def test_loops(self):
+        # A session for each loop, closed when the loop shuts down.
+        sessions = []
+
+        async def main():
+            sessions.append(aio.session())
+            return await aio.all(Route)
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ResourceWarning)
+            first = asyncio.run(main())
+            second = asyncio.run(main())
+            gc.collect()
+
+        self.assertEqual(first, second)
+        self.assertIsNot(sessions[0], sessions[1])
+        self.assertTrue(all(s.closed for s in sessions))
+        self.assertEqual(len(aio.__sessions__), 0)
+        self.assertEqual([w for w in caught
+                          if issubclass(w.category, ResourceWarning)], [])
+
+    def test_close(self):
+        async def main():
+            s = aio.session()
+            self.assertIs(aio.session(), s)
+            await aio.close()
+            self.assertTrue(s.closed)
+            self.assertIsNot(aio.session(), s)
+
+        asyncio.run(main())
+        self.assertEqual(len(aio.__sessions__), 0)
+
+
+@unittest.skipIf(aio.aiohttp is None, 'requires aiohttp')
+class AsyncSchedulerTest(APITestCase):
+
+    settings = {'RATE_LIMIT': 40, 'RATE_BURST': 1, 'MAX_IN_FLIGHT': 2}
+
+    def test_rate_limit(self):
+        routes = Route.all()[:6]
+        scheduler = api.scheduler()
+        scheduler.bucket.tokens = 0
+
+        async def main():
+            return await aio.get_stops_many(routes, limit=10)
+
+        start = time.time()
+        asyncio.run(main())
+
+        # 6 requests at 40 per second, the semaphore doesn't limit.
+        self.assertGreaterEqual(time.time() - start, 0.14)
+        stats = scheduler.stats()
+        self.assertEqual(stats['requests']['bulk'], 6)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertGreater(stats['max_wait']['bulk'], 0)
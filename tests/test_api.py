@@ -0,0 +1,70 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the pooled session of `api`.
+"""
+
+from stranspyra import api
+from stranspyra.conf import configure
+
+from .base import APITestCase
+
+
+class SessionTest(APITestCase):
+
+    def test_shared(self):
+        session = api.session()
+        api.get('/linhas')
+        api.get('/paradas')
+
+        self.assertIs(api.session(), session)
+        self.assertEqual(self.requests('/signin'), 1)
+
+    def test_configure_replaces(self):
+        session = api.session()
+        configure(REQUEST_OPTIONS={'timeout': 5})
+
+        self.assertIsNot(api.session(), session)
+
+    def test_gzip(self):
+        self.assertIn('gzip', api.session().headers['Accept-Encoding'])
+
+    def test_request_options(self):
+        configure(REQUEST_OPTIONS={'timeout': 5, 'pool_maxsize': 4})
+        pool, options = api.request_options()
+
+        self.assertEqual(options, {'timeout': 5})
+        self.assertEqual(pool['pool_maxsize'], 4)
+        self.assertEqual(pool['pool_connections'],
+                         api.POOL_OPTIONS['pool_connections'])
+
+    def test_get(self):
+        routes = api.get('/linhas')
+
+        self.assertEqual(routes, self.data.routes)
+        self.assertEqual(self.requests('/linhas'), 1)
+
+    def test_auth(self):
+        res = api.auth()
+
+        self.assertEqual(res['token'], api.tokens.token)
+        self.assertTrue(self.server.valid(res['token']))
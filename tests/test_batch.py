@@ -0,0 +1,99 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the vectorized distances.
+"""
+
+import random
+import unittest
+
+from stranspyra import batch
+from stranspyra.models import Bus, Stop
+from stranspyra.tables import StopTable
+
+from .base import APITestCase
+
+
+@unittest.skipUnless(batch.available(), 'requires numpy')
+class EngineTest(APITestCase):
+
+    def setUp(self):
+        super(EngineTest, self).setUp()
+        self.stops = Stop.all()
+        rand = random.Random(0)
+        self.points = [
+            (float(s.lat) + rand.uniform(-0.01, 0.01),
+             float(s.long) + rand.uniform(-0.01, 0.01))
+            for s in rand.sample(self.stops, 30)
+        ]
+
+    def test_haversine(self):
+        # A degree of longitude at the equator.
+        d = batch.haversine(0., 0., 0., 1.)
+        self.assertAlmostEqual(float(d), 111.195, places=3)
+
+    def test_nearest(self):
+        found = batch.Engine(self.stops).nearest(self.points)
+
+        for point, (stop, d) in zip(self.points, found):
+            expected, dist = Stop.nearest(*point)
+            self.assertEqual(stop.code, expected.code)
+            self.assertAlmostEqual(d.km, dist.km)
+
+    def test_approximated(self):
+        exact = batch.Engine(self.stops).nearest(self.points)
+        found = batch.Engine(self.stops).nearest(self.points, exact=False)
+
+        for (_, d), (_, e) in zip(found, exact):
+            self.assertAlmostEqual(d.km, e.km, delta=e.km * 0.01 + 1e-6)
+
+    def test_chunks(self):
+        expected = batch.Engine(self.stops).nearest(self.points)
+        chunk, batch.CHUNK = batch.CHUNK, 7
+        try:
+            found = batch.Engine(self.stops).nearest(self.points)
+        finally:
+            batch.CHUNK = chunk
+
+        self.assertEqual(found, expected)
+
+    def test_table(self):
+        table = StopTable.from_models(self.stops)
+        found = batch.Engine(table).nearest(self.points)
+        expected = batch.Engine(self.stops).nearest(self.points)
+
+        self.assertEqual([(r.code, d.km) for r, d in found],
+                         [(s.code, d.km) for s, d in expected])
+
+    def test_empty(self):
+        with self.assertRaises(ValueError):
+            batch.Engine([]).nearest(self.points)
+
+    def test_nearest_batch(self):
+        found = Stop.nearest_batch(self.points)
+        self.assertEqual(found, [Stop.nearest(*p) for p in self.points])
+
+        buses = Bus.all()
+        found = Bus.nearest_batch(self.points[:5], buses=buses)
+        self.assertEqual(
+            [b.code for b, _ in found],
+            [Bus.nearest(*p, buses=buses)[0].code for p in self.points[:5]])
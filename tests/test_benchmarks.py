@@ -0,0 +1,105 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the benchmark harness.
+"""
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks import run
+
+from stranspyra import api, cache, fleet, network
+from stranspyra.conf import settings
+
+OPERATIONS = ['Route.all', 'Stop.nearest', 'Route.load']
+
+
+class PercentileTest(unittest.TestCase):
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+
+        self.assertEqual(run.percentile(values, 50), 50)
+        self.assertEqual(run.percentile(values, 90), 90)
+        self.assertEqual(run.percentile(values, 100), 100)
+        self.assertEqual(run.percentile([7], 99), 7)
+        self.assertEqual(run.percentile([], 50), 0.)
+
+    def test_regressions(self):
+        results = [{'operation': 'a', 'p50': 1.3},
+                   {'operation': 'b', 'p50': 1.1},
+                   {'operation': 'c', 'p50': 9.}]
+        baseline = {'a': {'p50': 1.}, 'b': {'p50': 1.}}
+
+        self.assertEqual(run.regressions(results, baseline, 0.2), ['a'])
+
+
+class RunTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        settings.reset()
+        api.close()
+        cache.clear()
+        network.default.clear()
+        fleet.default.__snapshot__ = None
+
+    def test_run(self):
+        results = run.run(scale=0.05, repeat=4, operations=OPERATIONS)
+
+        self.assertEqual([r['operation'] for r in results], OPERATIONS)
+        for r in results:
+            self.assertGreaterEqual(r['calls'], 2)
+            self.assertLessEqual(r['p50'], r['p90'])
+            self.assertLessEqual(r['p99'], r['max'])
+        # Route.all is cached after the first call.
+        self.assertGreater(results[0]['requests'], 0)
+        self.assertEqual(results[2]['requests'], 0)
+
+        out = io.StringIO()
+        run.report(results, out=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), len(OPERATIONS) + 1)
+        self.assertTrue(lines[1].startswith('Route.all'))
+
+    def test_baseline(self):
+        path = os.path.join(self.dir, 'results.json')
+        argv = ['--scale', '0.05', '--repeat', '2', '--ops', 'Route.load']
+
+        self.assertEqual(run.main(argv + ['--json', path]), 0)
+        with open(path) as f:
+            results = json.load(f)
+        self.assertEqual(results[0]['operation'], 'Route.load')
+
+        # Anything is slower than a baseline taking no time.
+        results[0]['p50'] = 1e-9
+        with open(path, 'w') as f:
+            json.dump(results, f)
+        self.assertEqual(run.main(argv + ['--baseline', path]), 1)
@@ -0,0 +1,362 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the cache backends and decorators.
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+from stranspyra import cache
+from stranspyra.cache import MemoryBackend, SQLiteBackend
+from stranspyra.conf import configure
+from stranspyra.models import Route, Stop
+
+from .base import APITestCase
+
+
+class MemoryBackendTest(unittest.TestCase):
+
+    def test_lru(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+
+        self.assertEqual(sorted(backend.keys()), ['a', 'c'])
+        self.assertEqual(backend.evictions, 1)
+
+    def test_expired_first(self):
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2, time.time() - 1)
+        backend.set('c', 3)
+
+        self.assertEqual(sorted(backend.keys()), ['a', 'c'])
+        self.assertEqual(backend.evictions, 0)
+
+    def test_max_size(self):
+        backend = MemoryBackend(max_size=100)
+        backend.set('a', 'x' * 60)
+        backend.set('b', 'y' * 60)
+
+        self.assertEqual(backend.keys(), ['b'])
+        self.assertLessEqual(backend.size, 100)
+
+    def test_expires(self):
+        backend = MemoryBackend()
+        backend.set('a', 1, time.time() - 1)
+
+        self.assertEqual(backend.entry('a', stale=10)[0], 1)
+        with self.assertRaises(KeyError):
+            backend.get('a')
+
+    def test_stats(self):
+        backend = MemoryBackend()
+        backend.set('a', 1)
+        backend.get('a')
+        with self.assertRaises(KeyError):
+            backend.get('b')
+
+        stats = backend.stats()
+        self.assertEqual((stats['hits'], stats['misses'], stats['entries']),
+                         (1, 1, 1))
+
+
+class KeyTest(APITestCase):
+
+    def test_key(self):
+        route = Route.all()[0]
+
+        self.assertEqual(cache.key(Route, 'all'), ('Route', None, 'all', ()))
+        self.assertEqual(cache.key(route, 'get_stops', (1,), {'b': 2}),
+                         ('Route', route.code, 'get_stops', (1, ('b', 2))))
+
+    def test_by_object(self):
+        first, second = Route.all()[:2]
+        first.get_buses()
+        second.get_buses()
+        first.get_buses()
+
+        self.assertEqual(self.requests('/veiculosLinha'), 2)
+
+    def test_invalidate(self):
+        first, second = Route.all()[:2]
+        first.get_buses()
+        second.get_buses()
+
+        self.assertEqual(cache.invalidate(first, 'get_buses'), 1)
+        first.get_buses()
+        second.get_buses()
+        self.assertEqual(self.requests('/veiculosLinha'), 3)
+
+        self.assertEqual(cache.invalidate(Route), 1)
+        self.assertEqual(cache.invalidate(method='get_buses'), 2)
+        self.assertEqual(len(cache.backend()), 0)
+
+    def test_disabled(self):
+        configure(USE_CACHE=False)
+        Route.all()
+        Route.all()
+
+        self.assertEqual(self.requests('/linhas'), 2)
+
+
+class SQLiteBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_persistent(self):
+        backend = SQLiteBackend(self.path)
+        backend.set(('Route', None, 'all', ()), [1, 2, 3])
+        backend.set(('Route', None, 'search', ('x',)), [4], time.time() - 1)
+
+        backend = SQLiteBackend(self.path)
+        self.assertEqual(backend.get(('Route', None, 'all', ())), [1, 2, 3])
+        self.assertEqual(len(backend), 1)
+        with self.assertRaises(KeyError):
+            backend.get(('Route', None, 'search', ('x',)))
+
+    def test_read_back(self):
+        # Evicted from the memory, but kept at the file.
+        backend = SQLiteBackend(self.path, max_entries=1)
+        backend.set('a', 1)
+        backend.set('b', 2)
+
+        self.assertEqual(len(backend), 1)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertEqual(sorted(backend.keys()), ['a', 'b'])
+
+    def test_remove(self):
+        backend = SQLiteBackend(self.path)
+        backend.set('a', 1)
+        backend.remove('a')
+
+        self.assertEqual(SQLiteBackend(self.path).keys(), [])
+
+    def test_clear(self):
+        backend = SQLiteBackend(self.path)
+        backend.set('a', 1)
+        backend.clear()
+
+        self.assertEqual(SQLiteBackend(self.path).keys(), [])
+
+
+    def test_keys_without_values(self):
+        backend = SQLiteBackend(self.path, max_entries=1)
+        backend.set('a', Unpickled())
+        backend.set('b', 2)
+        Unpickled.count = 0
+
+        self.assertEqual(sorted(SQLiteBackend(self.path).keys()),
+                         ['a', 'b'])
+        self.assertEqual(Unpickled.count, 1)  # By `warm`, not `keys`.
+        self.assertEqual(sorted(backend.keys()), ['a', 'b'])
+        self.assertEqual(Unpickled.count, 1)
+
+    def test_older_layout(self):
+        db = sqlite3.connect(self.path)
+        db.execute('CREATE TABLE cache ('
+                   'key TEXT PRIMARY KEY, value BLOB, expires REAL)')
+        db.execute("INSERT INTO cache VALUES ('a', x'00', NULL)")
+        db.commit()
+        db.close()
+
+        backend = SQLiteBackend(self.path)
+        self.assertEqual(backend.keys(), [])
+        backend.set('a', 1)
+        self.assertEqual(SQLiteBackend(self.path).get('a'), 1)
+
+
+class Unpickled(object):
+    """
+    Counts the times it's unpickled.
+    """
+
+    count = 0
+
+    def __reduce__(self):
+        return Unpickled.create, ()
+
+    @staticmethod
+    def create():
+        Unpickled.count += 1
+        return Unpickled()
+
+
+class Interrupt(BaseException):
+    pass
+
+
+class Counter(object):
+    code = 1
+
+    def __init__(self):
+        self.calls = 0
+
+    @cache.timestampcache(60, stale=60)
+    def value(self):
+        self.calls += 1
+        return self.calls
+
+
+class SingleFlightTest(unittest.TestCase):
+
+    def concurrently(self, func, n=5):
+        results, errors = [], []
+
+        def run():
+            try:
+                results.append(func())
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(n)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, errors
+
+    def test_single_call(self):
+        calls = []
+
+        def slow():
+            calls.append(1)
+            time.sleep(0.1)
+            return len(calls)
+
+        results, _ = self.concurrently(
+            lambda: cache.single_flight('k', slow))
+
+        self.assertEqual(calls, [1])
+        self.assertEqual(results, [1] * 5)
+
+    def test_other_keys(self):
+        started = threading.Event()
+
+        def blocked():
+            started.set()
+            time.sleep(0.2)
+
+        thread = threading.Thread(
+            target=cache.single_flight, args=('a', blocked))
+        thread.start()
+        started.wait()
+
+        start = time.time()
+        self.assertEqual(cache.single_flight('b', lambda: 1), 1)
+        self.assertLess(time.time() - start, 0.1)
+        thread.join()
+
+    def test_errors(self):
+        for error in (ValueError, Interrupt):
+            def fail():
+                time.sleep(0.1)
+                raise error()
+
+            results, errors = self.concurrently(
+                lambda: cache.single_flight('k', fail))
+
+            self.assertEqual(results, [])
+            self.assertEqual(len(errors), 5)
+            for e in errors:
+                self.assertIsInstance(e, error)
+
+
+class ConcurrentMissTest(APITestCase):
+
+    def tearDown(self):
+        self.server.latency = 0
+        super(ConcurrentMissTest, self).tearDown()
+
+    def test_single_request(self):
+        self.server.latency = 0.1
+        threads = [threading.Thread(target=Route.all) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(self.requests('/linhas'), 1)
+
+    def test_stale(self):
+        counter = Counter()
+        self.assertEqual(counter.value(), 1)
+
+        k = cache.key(counter, 'value')
+        cache.backend().set(k, 1, time.time() - 1)
+
+        # The stale value is returned, while updated in background.
+        self.assertEqual(counter.value(), 1)
+        for _ in range(50):
+            if counter.value() == 2:
+                break
+            time.sleep(0.01)
+        self.assertEqual(counter.value(), 2)
+
+
+class PersistentCatalogTest(APITestCase):
+
+    def setUp(self):
+        super(PersistentCatalogTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'cache.db')
+        self.backend = cache.__backend__
+
+    def tearDown(self):
+        cache.__backend__ = self.backend
+        shutil.rmtree(self.dir)
+        super(PersistentCatalogTest, self).tearDown()
+
+    def test_warm_start(self):
+        cache.__backend__ = SQLiteBackend(self.path)
+        routes = [r.code for r in Route.all()]
+
+        # As a new process, reading the same file.
+        cache.__backend__ = SQLiteBackend(self.path)
+        self.assertEqual([r.code for r in Route.all()], routes)
+        self.assertEqual(self.requests('/linhas'), 1)
+
+    def test_live_instances(self):
+        # The cached rows don't replace the instances alive.
+        cache.__backend__ = SQLiteBackend(self.path)
+        stop = Stop.all()[0]
+        stop.description = 'FRESH'
+
+        cache.invalidate(Route, 'get_buses')
+        self.assertEqual(stop.description, 'FRESH')
+
+        cache.__backend__ = SQLiteBackend(self.path)
+        self.assertIs(Stop.all()[0], stop)
+        self.assertEqual(stop.description, 'FRESH')
@@ -0,0 +1,133 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the compact models.
+"""
+
+import datetime
+import pickle
+import unittest
+
+from stranspyra import fleet, network
+from stranspyra.compact import (
+    CompactBus, CompactRoute, CompactStop, boolean, hour)
+from stranspyra.models import Bus, Stop
+from stranspyra.tables import FleetTable, seconds
+
+from .base import APITestCase
+
+
+class CastTest(unittest.TestCase):
+
+    def test_boolean(self):
+        for value in (True, 1, 'true', 'S', ' sim '):
+            self.assertIs(boolean(value), True)
+        for value in (False, 0, 'false', 'N', None):
+            self.assertIs(boolean(value), False)
+
+    def test_hour(self):
+        self.assertEqual(hour('12:05'), datetime.time(12, 5))
+        self.assertEqual(hour('12:05:30'), datetime.time(12, 5, 30))
+        self.assertEqual(hour('noon'), 'noon')
+
+    def test_seconds(self):
+        self.assertEqual(seconds(datetime.time(12, 5, 30)), 43530)
+
+
+class CompactTest(APITestCase):
+
+    def setUp(self):
+        super(CompactTest, self).setUp()
+        CompactRoute.network.clear()
+        CompactBus.fleet.__snapshot__ = None
+
+    def test_slots(self):
+        stop = CompactStop.all()[0]
+
+        self.assertFalse(hasattr(stop, '__dict__'))
+        self.assertIsNone(stop.obj)
+        self.assertIsInstance(stop.lat, float)
+        self.assertEqual(stop.raw()['CodigoParada'], stop.code)
+        self.assertNotIsInstance(stop, Stop)
+
+    def test_build(self):
+        # The same attributes as created one by one.
+        objs = self.data.stops[:10]
+        built = CompactStop.build(objs)
+        for stop, obj in zip(built, objs):
+            CompactStop.registry().pop(stop.code)
+            one = CompactStop(obj)
+            self.assertIsNot(one, stop)
+            for name in CompactStop.__slots__:
+                self.assertEqual(getattr(one, name), getattr(stop, name))
+
+    def test_identity(self):
+        stops = CompactStop.build(self.data.stops[:10])
+        stop = CompactStop.build([dict(self.data.stops[0], Lat='1.5')])[0]
+
+        self.assertIs(stop, stops[0])
+        self.assertEqual(stop.lat, 1.5)
+        self.assertIs(CompactStop(self.data.stops[1]), stops[1])
+
+    def test_linked(self):
+        code = next(c for c, b in sorted(self.data.buses.items()) if b)
+        route = CompactRoute.get_route(code)
+        stops = route.get_stops()
+        buses = route.get_buses()
+
+        self.assertIsInstance(stops[0], CompactStop)
+        self.assertIsInstance(buses[0], CompactBus)
+        self.assertIsInstance(buses[0].hour, datetime.time)
+        self.assertIs(buses[0].route, route)
+        self.assertIn(route, stops[0].get_routes())
+        self.assertIsNot(CompactRoute.network, network.default)
+        self.assertEqual(len(network.default), 0)
+
+    def test_fleet(self):
+        buses = CompactBus.all()
+
+        self.assertIsNot(CompactBus.fleet, fleet.default)
+        self.assertIsNone(fleet.default.__snapshot__)
+        self.assertIsInstance(CompactBus.get(buses[0].code), CompactBus)
+        self.assertIsInstance(Bus.get(buses[0].code), Bus)
+
+        bus = buses[0]
+        lat = bus.__lat__
+        self.data.move()
+        CompactBus.fleet.snapshot(refresh=True)
+        self.assertNotEqual(bus.lat, lat)
+        self.assertIsInstance(bus.lat, float)
+
+    def test_table(self):
+        buses = CompactBus.all()
+        table = FleetTable.from_models(buses)
+
+        self.assertEqual(list(table.hours),
+                         [seconds(b.hour) for b in buses])
+        self.assertNotIn(-1, table.hours)
+
+    def test_pickle(self):
+        bus = CompactBus.all()[0]
+        bus.route
+
+        self.assertIs(pickle.loads(pickle.dumps(bus)), bus)
+        self.assertIsNotNone(bus.__route__)
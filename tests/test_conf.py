@@ -0,0 +1,94 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the lazy import and settings.
+"""
+
+import os
+import subprocess
+import sys
+import unittest
+
+from stranspyra import api
+from stranspyra.conf import DEFAULTS, Settings, configure
+
+from .base import APITestCase
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class ImportTest(unittest.TestCase):
+
+    def test_offline(self):
+        # A new interpreter, with no `settings` nor network.
+        code = (
+            'import sys, socket\n'
+            'def offline(*args, **kwargs):\n'
+            '    raise AssertionError("network used on import")\n'
+            'socket.socket.connect = offline\n'
+            'import stranspyra\n'
+            'heavy = {"requests", "geopy", "numpy"} & set(sys.modules)\n'
+            'assert not heavy, heavy\n'
+            'assert stranspyra.api.tokens.token is None\n'
+        )
+        subprocess.check_call([sys.executable, '-c', code], cwd=ROOT)
+
+
+class SettingsTest(unittest.TestCase):
+
+    def test_defaults(self):
+        settings = Settings()
+        settings.__settings__ = None
+
+        self.assertEqual(settings.URL, DEFAULTS['URL'])
+        self.assertRaises(AttributeError, getattr, settings, 'API_KEY')
+
+    def test_configure(self):
+        settings = Settings()
+        settings.__settings__ = type('settings', (), {
+            'URL': 'http://module', 'EMAIL': 'module'})
+        settings.configure(URL='http://configured')
+
+        self.assertEqual(settings.URL, 'http://configured')
+        self.assertEqual(settings.EMAIL, 'module')
+
+        settings.reset()
+        self.assertEqual(settings.URL, 'http://module')
+
+
+class DeferredAuthTest(APITestCase):
+
+    def test_deferred(self):
+        self.assertIsNone(api.tokens.token)
+        self.assertEqual(self.requests(), 0)
+
+        api.get('/linhas')
+        self.assertEqual(self.requests('/signin'), 1)
+        self.assertIsNotNone(api.tokens.token)
+
+    def test_configure_logs_in_again(self):
+        api.get('/linhas')
+        configure(EMAIL='other')
+
+        self.assertIsNone(api.tokens.token)
+        api.get('/linhas')
+        self.assertEqual(self.requests('/signin'), 2)
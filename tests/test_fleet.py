@@ -0,0 +1,104 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the shared fleet snapshot.
+"""
+
+import threading
+
+from stranspyra import fleet
+from stranspyra.models import Bus, Route
+from stranspyra.tables import FleetTable
+
+from .base import APITestCase
+
+
+class FleetTest(APITestCase):
+
+    def test_location(self):
+        code = next(c for c, b in sorted(self.data.buses.items()) if b)
+        buses = Route.get_route(code).get_buses()
+        self.assertTrue(buses)
+        requests = self.requests('/veiculos')
+        for bus in buses:
+            bus.lat, bus.long
+
+        # A single snapshot for all the buses.
+        self.assertEqual(self.requests('/veiculos'), requests + 1)
+
+    def test_moved(self):
+        bus = Bus.all()[0]
+        lat = bus.__lat__
+        self.data.move()
+        fleet.default.snapshot(refresh=True)
+
+        self.assertNotEqual(bus.lat, lat)
+
+    def test_interval(self):
+        first = fleet.default.snapshot()
+        self.assertIs(fleet.default.snapshot(), first)
+
+        first.timestamp -= fleet.INTERVAL
+        self.assertIsNot(fleet.default.snapshot(), first)
+        self.assertEqual(self.requests('/veiculos'), 2)
+
+    def test_concurrent(self):
+        self.server.latency = 0.1
+        try:
+            threads = [threading.Thread(target=fleet.default.snapshot)
+                       for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            self.server.latency = 0
+
+        self.assertEqual(self.requests('/veiculos'), 1)
+
+    def test_get(self):
+        route, buses = next(
+            (r, b) for r, b in sorted(self.data.buses.items()) if b)
+        code = buses[0]['CodigoVeiculo']
+        bus = Bus.get(code)
+
+        self.assertEqual(bus.code, code)
+        self.assertEqual(bus.route.code, route)
+        self.assertIs(Bus.get(code), bus)
+        self.assertIsNone(fleet.default.get('missing'))
+
+    def test_listeners(self):
+        calls = []
+        index = fleet.Fleet()
+        index.listeners.append(lambda *args: calls.append(args))
+        first = index.snapshot()
+        second = index.snapshot(refresh=True)
+
+        self.assertEqual(calls, [(None, first), (first, second)])
+
+    def test_source(self):
+        index = fleet.Fleet()
+        table = FleetTable.fetch()
+        index.source = lambda: index.update(table)
+
+        self.assertIs(index.snapshot().table(), table)
+        self.assertEqual(self.requests('/veiculos'), 1)
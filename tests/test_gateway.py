@@ -0,0 +1,193 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the caching gateway, in front of the `MockServer`.
+"""
+
+import gzip
+import json
+from unittest import mock
+
+try:
+    from urllib.error import HTTPError
+    from urllib.request import Request, urlopen
+except ImportError:
+    from urllib2 import HTTPError, Request, urlopen
+
+from stranspyra import api, gateway
+from stranspyra.exceptions import APIServerError
+from stranspyra.gateway import STALE, Entry, Gateway
+
+from .base import APITestCase
+
+KEY = 'client'
+
+
+class GatewayTest(APITestCase):
+
+    def setUp(self):
+        super(GatewayTest, self).setUp()
+        self.gateway = Gateway(port=0, keys=[KEY]).start()
+
+    def tearDown(self):
+        self.gateway.stop()
+        super(GatewayTest, self).tearDown()
+
+    def request(self, endpoint, key=KEY, data=None, **headers):
+        """
+        Requests `endpoint` to the gateway.
+
+        @return: A tuple with the status, the headers and the body.
+        """
+
+        if key is not None:
+            headers['x-api-key'] = key
+        req = Request(self.gateway.url + endpoint, data=data,
+                      headers=headers)
+        try:
+            res = urlopen(req, timeout=10)
+        except HTTPError as e:
+            res = e
+        with res:
+            return res.getcode(), res.headers, res.read()
+
+    def test_get(self):
+        status, headers, body = self.request('/linhas')
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8')), self.data.routes)
+        self.assertTrue(headers['ETag'])
+        self.assertIn('max-age=', headers['Cache-Control'])
+        self.assertIsNone(headers['Content-Encoding'])
+
+        # Polled at start, the clients don't reach the API.
+        for _ in range(3):
+            self.request('/linhas')
+        self.assertEqual(self.requests('/linhas'), 1)
+        self.assertEqual(self.gateway.stats()['responses'], 4)
+
+    def test_not_modified(self):
+        _, headers, body = self.request('/paradas')
+        etag = headers['ETag']
+
+        status, headers, body = self.request('/paradas',
+                                             **{'If-None-Match': etag})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(headers['ETag'], etag)
+
+        status, _, _ = self.request(
+            '/paradas', **{'If-None-Match': '"other", W/' + etag})
+        self.assertEqual(status, 304)
+
+        status, _, _ = self.request('/paradas',
+                                    **{'If-None-Match': '"other"'})
+        self.assertEqual(status, 200)
+        self.assertEqual(self.gateway.stats()['not_modified'], 2)
+
+    def test_gzip(self):
+        _, _, plain = self.request('/paradas')
+        status, headers, body = self.request(
+            '/paradas', **{'Accept-Encoding': 'gzip, deflate'})
+
+        self.assertEqual(status, 200)
+        self.assertEqual(headers['Content-Encoding'], 'gzip')
+        self.assertEqual(headers['Vary'], 'Accept-Encoding')
+        self.assertEqual(int(headers['Content-Length']), len(body))
+        self.assertLess(len(body), len(plain))
+        self.assertEqual(gzip.decompress(body), plain)
+
+    def test_route_buses(self):
+        code = next(c for c, b in sorted(self.data.buses.items()) if b)
+        status, _, body = self.request('/veiculosLinha?busca=' + code)
+
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body.decode('utf-8')),
+                         self.server.route_buses(code))
+        # Taken from the fleet.
+        self.assertEqual(self.requests('/veiculosLinha'), 0)
+
+    def test_unknown_route(self):
+        status, _, body = self.request('/veiculosLinha?busca=XXXX')
+
+        self.assertEqual(status, 404)
+        self.assertEqual(json.loads(body.decode('utf-8')),
+                         {'message': 'api.error.notfound'})
+        self.assertEqual(self.gateway.stats()['entries'], 3)
+
+    def test_keys(self):
+        status, _, body = self.request('/linhas', key=None)
+        self.assertEqual(status, 401)
+        status, _, _ = self.request('/linhas', key='other')
+        self.assertEqual(status, 401)
+
+        status, _, body = self.request('/signin', data=b'{}')
+        self.assertEqual(status, 200)
+        self.assertIn('token', json.loads(body.decode('utf-8')))
+
+    def test_unknown_endpoint(self):
+        status, _, _ = self.request('/other')
+        self.assertEqual(status, 404)
+
+
+class EntriesTest(APITestCase):
+
+    def setUp(self):
+        super(EntriesTest, self).setUp()
+        self.gateway = Gateway(port=0, max_entries=2)
+
+    def tearDown(self):
+        self.gateway.stop()
+        super(EntriesTest, self).tearDown()
+
+    def codes(self, n):
+        return [r['CodigoLinha'] for r in self.data.routes[:n]]
+
+    def test_max_entries(self):
+        self.gateway.refresh()
+        for code in self.codes(3):
+            self.gateway.get('/paradasLinha', code)
+        stats = self.gateway.stats()
+
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual(stats['entries'], len(gateway.POLLED) + 2)
+        self.assertIsNone(self.gateway.entry('/paradasLinha',
+                                             self.codes(1)[0]))
+
+    def test_refresh_purges(self):
+        self.gateway.keep('/paradasLinha', 'old', Entry([], -STALE - 1))
+        self.gateway.keep('/paradasLinha', 'stale', Entry([], -1))
+        self.gateway.refresh()
+
+        self.assertIsNone(self.gateway.entry('/paradasLinha', 'old'))
+        self.assertIsNotNone(self.gateway.entry('/paradasLinha', 'stale'))
+
+    def test_serves_stale(self):
+        stale = Entry([], -1)
+        self.gateway.keep('/paradasLinha', 'stale', stale)
+
+        with mock.patch.object(api, 'get',
+                               side_effect=APIServerError('api.error')):
+            self.assertIs(self.gateway.get('/paradasLinha', 'stale'), stale)
+            self.assertRaises(APIServerError, self.gateway.get,
+                              '/paradasLinha', 'missing')
+        self.assertEqual(self.gateway.stats()['errors'], 1)
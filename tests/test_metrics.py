@@ -0,0 +1,171 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the instrumentation.
+"""
+
+import asyncio
+import unittest
+
+from stranspyra import aio, api, metrics
+from stranspyra.metrics import Histogram, Registry
+from stranspyra.models import Route, Stop
+
+from .base import APITestCase
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_cumulative(self):
+        h = Histogram(buckets=(1, 2))
+        for value in (0.5, 1, 1.5, 3):
+            h.observe(value)
+
+        self.assertEqual(h.cumulative(), [(1, 2), (2, 3), (float('inf'), 4)])
+        self.assertEqual(h.count, 4)
+        self.assertEqual(h.sum, 6)
+
+
+class ExportTest(unittest.TestCase):
+
+    def test_export(self):
+        registry = Registry()
+        registry.inc('stranspyra_auth_total', reason='login')
+        registry.inc('stranspyra_auth_total', reason='login')
+        registry.observe('stranspyra_request_seconds', 0.02,
+                         endpoint='/linhas')
+        lines = registry.export().splitlines()
+
+        self.assertIn('# TYPE stranspyra_auth_total counter', lines)
+        self.assertIn('stranspyra_auth_total{reason="login"} 2', lines)
+        self.assertIn('# TYPE stranspyra_request_seconds histogram', lines)
+        self.assertIn('stranspyra_request_seconds_bucket'
+                      '{endpoint="/linhas",le="0.025"} 1', lines)
+        self.assertIn('stranspyra_request_seconds_bucket'
+                      '{endpoint="/linhas",le="0.01"} 0', lines)
+        self.assertIn('stranspyra_request_seconds_bucket'
+                      '{endpoint="/linhas",le="+Inf"} 1', lines)
+        self.assertIn('stranspyra_request_seconds_count'
+                      '{endpoint="/linhas"} 1', lines)
+
+    def test_escape(self):
+        self.assertEqual(metrics.format_labels((('a', 'x"y\\z\n'),)),
+                         '{a="x\\"y\\\\z\\n"}')
+
+
+class MetricsTest(APITestCase):
+
+    def setUp(self):
+        super(MetricsTest, self).setUp()
+        self.events = []
+        self.hooks = [lambda event, data: self.events.append((event, data))]
+        metrics.subscribe(self.hooks[0])
+        metrics.reset()
+        metrics.enable()
+
+    def tearDown(self):
+        super(MetricsTest, self).tearDown()
+        metrics.disable()
+        metrics.reset()
+        for hook in self.hooks:
+            metrics.unsubscribe(hook)
+
+    def counter(self, name, **labels):
+        k = (name, tuple(sorted(labels.items())))
+        return metrics.snapshot()['counters'].get(k, 0)
+
+    def histogram(self, name, **labels):
+        k = (name, tuple(sorted(labels.items())))
+        return metrics.snapshot()['histograms'].get(k, {'count': 0})
+
+    def test_disabled(self):
+        metrics.disable()
+        api.get('/linhas')
+
+        self.assertEqual(self.events, [])
+        self.assertEqual(metrics.snapshot()['counters'], {})
+
+    def test_request(self):
+        api.get('/linhas')
+
+        self.assertEqual(self.counter('stranspyra_auth_total',
+                                      reason='login'), 1)
+        self.assertEqual(self.histogram('stranspyra_request_seconds',
+                                        endpoint='/linhas')['count'], 1)
+        self.assertEqual(self.histogram('stranspyra_decode_seconds',
+                                        endpoint='/linhas')['count'], 1)
+        self.assertGreater(self.counter('stranspyra_response_bytes_total',
+                                        endpoint='/linhas'), 0)
+        self.assertEqual([e for e, _ in self.events],
+                         ['auth', 'request', 'request', 'decode'])
+
+    def test_token_expired(self):
+        api.get('/linhas')
+        self.server.__tokens__.clear()
+        api.get('/linhas')
+
+        self.assertEqual(self.counter('stranspyra_token_expired_total'), 1)
+        self.assertEqual(self.counter('stranspyra_auth_total',
+                                      reason='refresh'), 1)
+
+    def test_models(self):
+        Route.all()
+        Route.all()
+        Stop.nearest(-5.05, -42.79)
+
+        self.assertEqual(self.counter('stranspyra_cache_misses_total',
+                                      method='Route.all'), 1)
+        self.assertEqual(self.counter('stranspyra_cache_hits_total',
+                                      method='Route.all'), 1)
+        self.assertEqual(self.histogram('stranspyra_parse_seconds',
+                                        method='Route.load')['count'], 1)
+        self.assertEqual(self.histogram('stranspyra_nearest_seconds',
+                                        method='Stop.nearest')['count'], 1)
+
+    def test_failing_hook(self):
+        def failing(event, data):
+            raise RuntimeError(event)
+        self.hooks.insert(0, failing)
+        metrics.unsubscribe(self.hooks[1])
+        metrics.subscribe(failing)
+        metrics.subscribe(self.hooks[1])
+
+        with self.assertLogs('stranspyra.metrics') as logs:
+            self.assertEqual(api.get('/linhas'), self.data.routes)
+
+        self.assertIn('RuntimeError', logs.output[0])
+        self.assertIn('decode', [e for e, _ in self.events])
+
+    @unittest.skipIf(aio.aiohttp is None, 'requires aiohttp')
+    def test_aio(self):
+        async def main():
+            try:
+                return await aio.get('/linhas')
+            finally:
+                await aio.close()
+
+        asyncio.run(main())
+
+        self.assertEqual(self.histogram('stranspyra_request_seconds',
+                                        endpoint='/linhas')['count'], 1)
+        self.assertEqual(self.histogram('stranspyra_decode_seconds',
+                                        endpoint='/linhas')['count'], 1)
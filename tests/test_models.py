@@ -0,0 +1,165 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the models identity map and code lookup.
+"""
+
+import pickle
+
+from stranspyra import cache, fleet
+from stranspyra.conf import configure
+from stranspyra.exceptions import NotFoundError, RouteNotFoundError
+from stranspyra.models import Bus, Route, Stop
+
+from .base import APITestCase
+
+
+class IdentityTest(APITestCase):
+
+    def test_single_instance(self):
+        routes = Route.all()
+        cache.invalidate(Route, 'all')
+
+        self.assertEqual([id(r) for r in Route.all()],
+                         [id(r) for r in routes])
+
+    def test_updated_in_place(self):
+        stop = Stop.all()[0]
+        obj = dict(stop.raw(), Denomicao='RENAMED')
+
+        self.assertIs(Stop(obj), stop)
+        self.assertEqual(stop.description, 'RENAMED')
+
+    def rename(self, obj, description):
+        self.addCleanup(obj.__setitem__, 'Denomicao', obj['Denomicao'])
+        obj['Denomicao'] = description
+
+    def test_update(self):
+        route = Route.get_route(self.route()['CodigoLinha'])
+        self.rename(self.route(), 'RENAMED')
+        cache.invalidate(Route, 'all')
+        requests = self.requests('/linhas')
+
+        route.update()
+        self.assertEqual(route.description, 'RENAMED')
+        self.assertEqual(self.requests('/linhas'), requests + 1)
+
+    def test_update_uncached(self):
+        stop = Stop.all()[0]
+        stop.description = 'EDITED'
+        configure(USE_CACHE=False)
+        obj = next(s for s in self.data.stops
+                   if s['CodigoParada'] == stop.code)
+        self.rename(obj, 'RENAMED')
+
+        stop.update()
+        self.assertEqual(stop.description, 'RENAMED')
+        self.assertEqual(self.requests('/paradas'), 2)
+
+    def test_pickle(self):
+        route = Route.all()[0]
+        self.assertIs(pickle.loads(pickle.dumps(route)), route)
+
+    def test_unpickle_alive(self):
+        route = Route.all()[0]
+        data = pickle.dumps(route)
+        route.description = 'FRESH'
+
+        self.assertIs(pickle.loads(data), route)
+        self.assertEqual(route.description, 'FRESH')
+
+    def test_unpickle_gone(self):
+        route = Route.all()[0]
+        code, description = route.code, route.description
+        data = pickle.dumps(route)
+        Route.registry().clear()
+
+        restored = pickle.loads(data)
+        self.assertIsNot(restored, route)
+        self.assertEqual((restored.code, restored.description),
+                         (code, description))
+        self.assertIs(Route.registry()[code], restored)
+
+    def test_get(self):
+        routes = Route.all()
+        requests = self.requests()
+
+        for route in routes:
+            self.assertIs(Route.get(route.code), route)
+        self.assertEqual(self.requests(), requests)
+
+    def test_get_route(self):
+        code = self.route(4)['CodigoLinha']
+
+        self.assertEqual(Route.get_route(int(code)).code, code)
+        with self.assertRaises(RouteNotFoundError):
+            Route.get_route('9999')
+
+    def test_not_found(self):
+        with self.assertRaises(NotFoundError):
+            Stop.get(-1)
+
+    def test_registry_missed(self):
+        # The registry keeps weak references: without the
+        # instance, it's looked up at the catalog.
+        route = Route.all()[0]
+        Route.registry().clear()
+
+        self.assertIs(Route.get(route.code), route)
+        self.assertEqual(self.requests('/linhas'), 1)
+
+
+class BusRouteTest(APITestCase):
+
+    def moved(self):
+        """
+        Returns a bus with its route memoized, after moving it to
+        another route at the data served.
+
+        @return: The bus, and the codes of both routes.
+        """
+
+        codes = sorted(c for c, b in self.data.buses.items() if b)
+        source, dest = codes[0], codes[1]
+        bus = Route.get_route(source).get_buses()[0]
+
+        buses = self.data.buses
+        self.addCleanup(buses.__setitem__, source, buses[source])
+        self.addCleanup(buses.__setitem__, dest, buses[dest])
+        buses[dest] = buses[dest] + buses[source][:1]
+        buses[source] = buses[source][1:]
+
+        self.assertEqual(bus.route.code, source)
+        return bus, source, dest
+
+    def test_load(self):
+        bus, source, dest = self.moved()
+
+        self.assertIn(bus, Bus.all())
+        self.assertEqual(bus.route.code, dest)
+
+    def test_row(self):
+        bus, source, dest = self.moved()
+
+        self.assertIs(fleet.default.snapshot(refresh=True).get(bus.code),
+                      bus)
+        self.assertEqual(bus.route.code, dest)
@@ -0,0 +1,100 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the route and stop links index.
+"""
+
+from stranspyra import cache, network
+from stranspyra.models import Route, Stop
+
+from .base import APITestCase
+
+
+class NetworkTest(APITestCase):
+
+    def expected(self, stop):
+        return sorted(
+            code for code, stops in self.data.route_stops.items()
+            if any(s['CodigoParada'] == stop.code for s in stops))
+
+    def test_get_routes(self):
+        stops = Stop.all()
+        for stop in stops[:20]:
+            self.assertEqual(sorted(r.code for r in stop.get_routes()),
+                             self.expected(stop))
+
+        # The stops of each route are fetched once.
+        self.assertEqual(self.requests('/paradasLinha'),
+                         len(self.data.routes))
+
+    def test_lookup(self):
+        stop = Stop.all()[0]
+        stop.get_routes()
+        requests = self.requests()
+        Stop.all()[1].get_routes()
+
+        self.assertEqual(self.requests(), requests)
+
+    def test_stops(self):
+        route = Route.all()[0]
+        stops = network.default.stops(route)
+
+        self.assertEqual(
+            [s.code for s in stops],
+            [s['CodigoParada'] for s in self.data.route_stops[route.code]])
+        self.assertIn(route, network.default)
+        self.assertFalse(network.default.loaded)
+
+    def test_load(self):
+        index = network.Network()
+        routes = Route.all()[:3]
+        index.load(routes)
+        index.load(routes)
+        self.assertEqual(self.requests('/paradasLinha'), 3)
+
+        index.load(routes, refresh=True)
+        self.assertEqual(self.requests('/paradasLinha'), 6)
+        self.assertEqual(len(index), 3)
+
+    def test_remove(self):
+        index = network.Network()
+        route = Route.all()[0]
+        stops = index.stops(route)
+        index.extend({route: stops}, complete=True)
+        index.remove(route)
+
+        self.assertNotIn(route, index)
+        self.assertEqual(index.routes(stops[0]), [])
+
+    def test_removed_from_catalog(self):
+        index = network.Network()
+        index.load()
+        gone = self.data.routes.pop()
+        try:
+            cache.invalidate(Route, 'all')
+            index.load()
+        finally:
+            self.data.routes.append(gone)
+
+        self.assertEqual(len(index), len(self.data.routes) - 1)
+        self.assertNotIn(gone['CodigoLinha'],
+                         [r.code for r in index.all()])
@@ -0,0 +1,142 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the trip planner.
+"""
+
+import itertools
+from unittest import mock
+
+from stranspyra import network, planner
+from stranspyra.models import Route
+from stranspyra.planner import Planner, chunks
+
+from .base import APITestCase
+
+
+class PlannerTest(APITestCase):
+
+    def setUp(self):
+        super(PlannerTest, self).setUp()
+        self.planner = Planner(network.default)
+        code, stops = max(self.data.route_stops.items(),
+                          key=lambda x: len(x[1]))
+        self.code = code
+        self.source = float(stops[0]['Lat']), float(stops[0]['Long'])
+        self.dest = float(stops[-1]['Lat']), float(stops[-1]['Long'])
+
+    def test_direct(self):
+        trips = self.planner.plan(self.source, self.dest, transfers=0)
+
+        self.assertTrue(trips)
+        self.assertIn(self.code, [t.routes[0].code for t in trips])
+        for trip in trips:
+            self.assertEqual(trip.transfers, 0)
+            self.assertIsNone(trip.legs[0].route)
+            self.assertIsNone(trip.legs[-1].route)
+            self.assertIn(trip.source, trip.routes[0].get_stops())
+            self.assertIn(trip.dest, trip.routes[0].get_stops())
+
+    def test_transfers(self):
+        direct = self.planner.plan(self.source, self.dest, transfers=0)
+        trips = self.planner.plan(self.source, self.dest, transfers=2,
+                                  limit=5)
+
+        self.assertLessEqual(len(trips), 5)
+        self.assertLessEqual(trips[0].minutes, direct[0].minutes)
+        self.assertEqual(trips, sorted(trips, key=lambda t: t.minutes))
+        for trip in trips:
+            self.assertLessEqual(trip.transfers, 2)
+
+    def test_unreachable(self):
+        far = self.source[0] + 1, self.source[1]
+        self.assertEqual(self.planner.plan(self.source, far), [])
+
+    def test_traceroute(self):
+        (start, _), (end, _), route = Route.traceroute(self.source, self.dest)
+        stops = route.get_stops()
+
+        self.assertIn(start, stops)
+        self.assertIn(end, stops)
+
+    def test_traceroute_fallback(self):
+        # Stops without a common route, with no direct trip.
+        routes = dict()
+        for code, stops in self.data.route_stops.items():
+            for stop in stops:
+                routes.setdefault(stop['CodigoParada'], set()).add(code)
+        a, b = next(
+            (a, b) for a, b in itertools.combinations(self.data.stops, 2)
+            if not routes[a['CodigoParada']] & routes[b['CodigoParada']])
+        source = float(a['Lat']), float(a['Long'])
+        dest = float(b['Lat']), float(b['Long'])
+
+        with mock.patch.object(planner.default, 'plan', return_value=[]):
+            (start, _), (end, _), route = Route.traceroute(source, dest)
+
+        self.assertIn(route.code, routes[a['CodigoParada']] |
+                      routes[b['CodigoParada']])
+        self.assertIn(start, route.get_stops())
+        self.assertIn(end, route.get_stops())
+
+
+class PlanManyTest(APITestCase):
+
+    def setUp(self):
+        super(PlanManyTest, self).setUp()
+        self.planner = Planner(network.default)
+        points = [(float(s['Lat']), float(s['Long']))
+                  for s in self.data.stops[::10]]
+        self.pairs = list(zip(points, reversed(points)))
+
+    def expected(self):
+        return [self.planner.plan(source, dest)
+                for source, dest in self.pairs]
+
+    def test_chunks(self):
+        self.assertEqual(list(chunks(range(5), 2)), [[0, 1], [2, 3], [4]])
+        self.assertEqual(list(chunks([], 2)), [])
+
+    def test_processes(self):
+        expected = self.expected()
+        found = dict(self.planner.plan_many(
+            self.pairs, processes=2, chunksize=3))
+
+        self.assertEqual(sorted(found), list(range(len(self.pairs))))
+        for i, trips in found.items():
+            self.assertEqual([(t.minutes, [r.code for r in t.routes])
+                              for t in trips],
+                             [(t.minutes, [r.code for r in t.routes])
+                              for t in expected[i]])
+
+    def test_single_process(self):
+        found = list(self.planner.plan_many(self.pairs, processes=1))
+
+        self.assertEqual([i for i, _ in found],
+                         list(range(len(self.pairs))))
+
+    def test_closed(self):
+        # Leaving the generator early shuts the workers down.
+        results = self.planner.plan_many(
+            self.pairs, processes=2, chunksize=1)
+        next(results)
+        results.close()
@@ -0,0 +1,170 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the fleet poller and its events.
+"""
+
+import threading
+import time
+import unittest
+
+from stranspyra import fleet, poller
+from stranspyra.poller import (
+    APPEARED, DISAPPEARED, MOVED, ROUTE_CHANGED, Poller, diff)
+from stranspyra.tables import FleetTable
+
+from .base import APITestCase
+
+
+def snapshot(*buses):
+    table = FleetTable()
+    for bus in buses:
+        table.append(*bus)
+    return fleet.Snapshot(table)
+
+
+class DiffTest(unittest.TestCase):
+
+    def test_diff(self):
+        previous = snapshot(('1', 'A', -5.0, -42.0, '10:00'),
+                            ('2', 'A', -5.0, -42.0, '10:00'),
+                            ('3', 'B', -5.0, -42.0, '10:00'))
+        current = snapshot(('1', 'A', -5.1, -42.0, '10:01'),
+                           ('2', 'B', -5.0, -42.0, '10:00'),
+                           ('4', 'B', -5.0, -42.0, '10:00'))
+
+        events = sorted((e.kind, e.code) for e in diff(previous, current))
+        self.assertEqual(events, [
+            (APPEARED, '4'), (DISAPPEARED, '3'),
+            (MOVED, '1'), (ROUTE_CHANGED, '2')])
+
+    def test_first(self):
+        current = snapshot(('1', 'A', -5.0, -42.0, '10:00'))
+        event, = diff(None, current)
+
+        self.assertEqual(event.kind, APPEARED)
+        self.assertIsNone(event.previous)
+        self.assertEqual(event.bus.code, '1')
+
+
+class EventsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.poller = Poller(fleet=fleet.Fleet())
+        self.previous = snapshot(('1', 'A', -5.0, -42.0, '10:00'))
+        self.current = snapshot(('1', 'A', -5.1, -42.0, '10:00'),
+                                ('2', 'A', -5.0, -42.0, '10:00'))
+
+    def publish_later(self):
+        def publish():
+            time.sleep(0.05)
+            self.poller.publish(self.previous, self.current)
+
+        thread = threading.Thread(target=publish)
+        thread.start()
+        return thread
+
+    def test_closed(self):
+        events = self.poller.events()
+        thread = self.publish_later()
+        next(events)
+        self.assertEqual(len(self.poller.__subscribers__), 1)
+
+        events.close()
+        thread.join()
+        self.assertEqual(self.poller.__subscribers__, [])
+
+    def test_timeout(self):
+        self.assertEqual(list(self.poller.events(timeout=0.01)), [])
+        self.assertEqual(self.poller.__subscribers__, [])
+
+    def test_kinds(self):
+        events = self.poller.events(kinds=[MOVED], timeout=0.2)
+        thread = self.publish_later()
+        found = [(e.kind, e.code) for e in events]
+        thread.join()
+
+        self.assertEqual(found, [(MOVED, '1')])
+
+    def test_failing_subscriber(self):
+        found = []
+
+        def fail(event):
+            raise ValueError()
+
+        self.poller.subscribe(fail)
+        self.poller.subscribe(found.append)
+        self.poller.publish(self.previous, self.current)
+
+        self.assertEqual(len(found), 2)
+
+    def test_unsubscribe(self):
+        found = []
+        self.poller.subscribe(found.append)
+        self.poller.unsubscribe(found.append)
+        self.poller.publish(self.previous, self.current)
+
+        self.assertEqual(found, [])
+
+
+class PollerTest(APITestCase):
+
+    def test_poll(self):
+        index = fleet.Fleet()
+        p = Poller(interval=0.05, fleet=index)
+        moved = []
+        p.subscribe(moved.append, kinds=[poller.MOVED])
+        p.start()
+        try:
+            for _ in range(100):
+                if moved:
+                    break
+                time.sleep(0.01)
+        finally:
+            p.stop()
+
+        self.assertTrue(moved)
+        self.assertGreaterEqual(p.polls, 2)
+        self.assertFalse(p.running)
+        self.assertNotIn(p.publish, index.listeners)
+
+    def test_read_fleet(self):
+        # Subscribers are called out of the fleet lock, refreshing
+        # the fleet from them doesn't block.
+        index = fleet.Fleet()
+        p = Poller(fleet=index)
+        found = []
+
+        def refresh(event):
+            if not found:
+                found.append(index.snapshot(refresh=True))
+
+        p.subscribe(refresh, kinds=[poller.APPEARED])
+        index.listeners.append(p.publish)
+
+        thread = threading.Thread(target=index.snapshot)
+        thread.daemon = True
+        thread.start()
+        thread.join(5)
+
+        self.assertFalse(thread.is_alive())
+        self.assertEqual(found, [index.snapshot()])
@@ -0,0 +1,114 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the bulk prefetch of the routes.
+"""
+
+from stranspyra.compact import CompactBus, CompactRoute, CompactStop
+from stranspyra.models import Route
+
+from .base import APITestCase
+
+
+class PrefetchStopsTest(APITestCase):
+
+    def codes(self, stops):
+        return [stop.code for stop in stops]
+
+    def test_all(self):
+        result = Route.prefetch_stops()
+
+        self.assertEqual(len(result), len(self.data.routes))
+        self.assertEqual(self.requests('/paradasLinha'),
+                         len(self.data.routes))
+        for route, stops in result.items():
+            self.assertEqual(
+                self.codes(stops),
+                [s['CodigoParada'] for s in self.data.route_stops[route.code]])
+
+        # Cached as `get_stops`, and not fetched again.
+        requests = self.requests()
+        route = Route.all()[0]
+        self.assertEqual(route.get_stops(), result[route])
+        Route.prefetch_stops()
+        self.assertEqual(self.requests(), requests)
+
+    def test_subset(self):
+        routes = Route.all()[:3]
+        result = Route.prefetch_stops(routes, workers=2)
+
+        self.assertEqual(set(result), set(routes))
+        self.assertEqual(self.requests('/paradasLinha'), 3)
+
+        Route.prefetch_stops(routes, refresh=True)
+        self.assertEqual(self.requests('/paradasLinha'), 6)
+
+    def test_compact(self):
+        result = CompactRoute.prefetch_stops(CompactRoute.all()[:2])
+
+        for route, stops in result.items():
+            self.assertIsInstance(route, CompactRoute)
+            self.assertIsInstance(stops[0], CompactStop)
+        CompactRoute.network.clear()
+
+
+class PrefetchBusesTest(APITestCase):
+
+    def expected(self, route):
+        return sorted(b['CodigoVeiculo'] for b in self.data.buses[route.code])
+
+    def test_all(self):
+        result = Route.prefetch_buses()
+
+        # A single request for all the routes.
+        self.assertEqual(self.requests('/veiculos'), 1)
+        self.assertEqual(self.requests('/veiculosLinha'), 0)
+        self.assertEqual(len(result), len(self.data.routes))
+        for route, buses in result.items():
+            self.assertEqual(sorted(b.code for b in buses),
+                             self.expected(route))
+            for bus in buses:
+                self.assertIs(bus.route, route)
+
+        requests = self.requests()
+        route = next(r for r in result if result[r])
+        self.assertEqual(route.get_buses(), result[route])
+        self.assertEqual(self.requests(), requests)
+
+    def test_subset(self):
+        routes = Route.all()[:4]
+        result = Route.prefetch_buses(routes, workers=2)
+
+        self.assertEqual(self.requests('/veiculosLinha'), 4)
+        self.assertEqual(self.requests('/veiculos'), 0)
+        for route in routes:
+            self.assertEqual(sorted(b.code for b in result[route]),
+                             self.expected(route))
+
+    def test_compact(self):
+        result = CompactRoute.prefetch_buses()
+
+        buses = [b for r in result.values() for b in r]
+        self.assertTrue(buses)
+        for bus in buses:
+            self.assertIsInstance(bus, CompactBus)
+        CompactBus.fleet.__snapshot__ = None
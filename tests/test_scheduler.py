@@ -0,0 +1,154 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the request scheduler.
+"""
+
+import threading
+import time
+import unittest
+
+from stranspyra import api, scheduler
+from stranspyra.scheduler import (
+    BULK, DEFAULT, REALTIME, Scheduler, TokenBucket)
+
+from .base import APITestCase
+
+
+class PriorityTest(unittest.TestCase):
+
+    def test_endpoint(self):
+        self.assertEqual(scheduler.current('/veiculos'), REALTIME)
+        self.assertEqual(scheduler.current('/paradas'), BULK)
+        self.assertEqual(scheduler.current('/other'), DEFAULT)
+
+    def test_thread(self):
+        with scheduler.priority(BULK):
+            self.assertEqual(scheduler.current('/veiculos'), BULK)
+            with scheduler.priority(REALTIME):
+                self.assertEqual(scheduler.current('/paradas'), REALTIME)
+            self.assertEqual(scheduler.current('/veiculos'), BULK)
+        self.assertEqual(scheduler.current('/veiculos'), REALTIME)
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_burst(self):
+        bucket = TokenBucket(10, burst=3)
+
+        self.assertEqual([bucket.take() for _ in range(3)], [0, 0, 0])
+        wait = bucket.take()
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.1)
+
+
+class SchedulerTest(unittest.TestCase):
+
+    def wait_queued(self, s, count):
+        deadline = time.time() + 5
+        while sum(s.stats()['queued'].values()) < count:
+            self.assertLess(time.time(), deadline)
+            time.sleep(0.005)
+
+    def test_unlimited(self):
+        s = Scheduler()
+        with s.slot():
+            self.assertEqual(s.stats()['in_flight'], 1)
+        self.assertEqual(s.stats()['in_flight'], 0)
+        self.assertEqual(s.stats()['requests']['default'], 1)
+
+    def test_rate(self):
+        s = Scheduler(rate=50, burst=1)
+        start = time.time()
+        for _ in range(6):
+            with s.slot():
+                pass
+
+        # The first one at once, then one each 20ms.
+        self.assertGreaterEqual(time.time() - start, 0.09)
+        self.assertGreater(s.stats()['max_wait']['default'], 0)
+
+    def test_max_in_flight(self):
+        s = Scheduler(max_in_flight=2)
+        s.acquire()
+        s.acquire()
+        done = threading.Event()
+
+        def third():
+            with s.slot():
+                done.set()
+
+        threading.Thread(target=third).start()
+        self.wait_queued(s, 1)
+        self.assertFalse(done.is_set())
+
+        s.release()
+        self.assertTrue(done.wait(5))
+        s.release()
+        self.assertEqual(s.stats()['in_flight'], 0)
+
+    def test_priority(self):
+        s = Scheduler(max_in_flight=1)
+        s.acquire()
+        order = []
+
+        def request(level):
+            with s.slot(level):
+                order.append(level)
+
+        threads = []
+        for i, level in enumerate((BULK, DEFAULT, REALTIME, BULK)):
+            t = threading.Thread(target=request, args=(level,))
+            t.start()
+            threads.append(t)
+            self.wait_queued(s, i + 1)
+
+        self.assertEqual(s.stats()['queued'],
+                         {'realtime': 1, 'default': 1, 'bulk': 2})
+        s.release()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(order, [REALTIME, DEFAULT, BULK, BULK])
+
+    def test_custom_level(self):
+        s = Scheduler(max_in_flight=1)
+        with s.slot(5):
+            pass
+        stats = s.stats()
+
+        self.assertEqual(stats['requests'][5], 1)
+        self.assertEqual(stats['wait'][5], stats['max_wait'][5])
+
+
+class APISchedulerTest(APITestCase):
+
+    settings = {'MAX_IN_FLIGHT': 2, 'RATE_LIMIT': 1000}
+
+    def test_requests(self):
+        s = api.scheduler()
+        api.get('/linhas')
+        api.get('/veiculos')
+
+        self.assertEqual(s.max_in_flight, 2)
+        self.assertEqual(s.stats()['requests'],
+                         {'realtime': 2, 'default': 1, 'bulk': 0})
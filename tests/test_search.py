@@ -0,0 +1,107 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the local full-text search.
+"""
+
+import unittest
+
+from stranspyra.models import Route, Stop
+from stranspyra.search import SearchIndex, codes, normalize, tokenize
+
+from .base import APITestCase
+
+
+class Obj(object):
+
+    def __init__(self, code, description):
+        self.code = code
+        self.description = description
+
+    def __repr__(self):
+        return self.code
+
+
+class SearchIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.objs = [
+            Obj('0401', u'UNIVERSIDADE'),
+            Obj('0365', u'UNIVERSIDADE CIRCULAR 2 VIA SHOPPING'),
+            Obj('0730', u'UNIVERSIDADE - CENTRO DUQUE DE CAXIAS'),
+            Obj('0100', u'SÃO JOAQUIM'),
+        ]
+        self.index = SearchIndex(self.objs, ('code', 'description'))
+
+    def test_normalize(self):
+        self.assertEqual(normalize(u'São Joaquim'), u'sao joaquim')
+        self.assertEqual(tokenize(u'Av. Frei-Serafim'),
+                         [u'av', u'frei', u'serafim'])
+
+    def test_codes(self):
+        self.assertEqual(codes('0401'), set([u'0401', u'401']))
+        self.assertIn(u'401', codes('T0401'))
+
+    def test_words(self):
+        self.assertEqual(self.index.search('universidade circular'),
+                         [self.objs[1]])
+        self.assertEqual(self.index.search(u'sao'), [self.objs[3]])
+        self.assertEqual(self.index.search('nowhere'), [])
+        self.assertEqual(self.index.search(''), [])
+
+    def test_ranking(self):
+        # The exact word first, then the prefixes.
+        index = SearchIndex([Obj('1', 'CENTROS'), Obj('2', 'CENTRO')],
+                            ('description',))
+        self.assertEqual([o.code for o in index.search('centro')],
+                         ['2', '1'])
+
+    def test_code(self):
+        self.assertEqual(self.index.search(401), [self.objs[0]])
+        self.assertEqual(self.index.search('univ', limit=2),
+                         self.objs[:2])
+
+
+class ModelSearchTest(APITestCase):
+
+    def test_remote(self):
+        Route.__search__ = None
+        pattern = self.route()['Origem']
+        routes = Route.search(pattern)
+
+        self.assertTrue(routes)
+        self.assertEqual(self.requests('/linhas'), 1)
+
+    def test_local(self):
+        routes = Route.all()
+        route = self.route(3)
+        found = Route.search(route['Denomicao'])
+
+        self.assertIn(Route.get(route['CodigoLinha']), found)
+        self.assertEqual(Route.search(route['CodigoLinha'])[0].code,
+                         route['CodigoLinha'])
+        self.assertEqual(self.requests('/linhas'), 1)
+        self.assertEqual(Route.search_index().objs, routes)
+
+    def test_stops(self):
+        stop = Stop.all()[7]
+        self.assertIn(stop, Stop.search(stop.address))
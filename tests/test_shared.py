@@ -0,0 +1,190 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the cache shared by processes.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from stranspyra import fleet, shared
+from stranspyra.conf import settings
+from stranspyra.models import Route
+from stranspyra.tables import FleetTable
+
+from .base import APITestCase
+
+
+class SharedTest(APITestCase):
+
+    def setUp(self):
+        super(SharedTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'shared')
+        self.instances = []
+
+    def tearDown(self):
+        for instance in self.instances:
+            instance.stop()
+        super(SharedTest, self).tearDown()
+        shutil.rmtree(self.dir)
+
+    def instance(self):
+        instance = shared.Shared(self.path, fleet=fleet.Fleet())
+        self.instances.append(instance)
+        return instance
+
+    def test_create_directory(self):
+        errors = []
+
+        def create():
+            try:
+                shared.Shared(self.path)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=create) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(errors, [])
+        self.assertTrue(os.path.isdir(self.path))
+
+    @unittest.skipIf(shared.fcntl is None, 'requires fcntl')
+    def test_elect(self):
+        first, second = self.instance(), self.instance()
+
+        self.assertTrue(first.elect())
+        self.assertFalse(second.elect())
+
+        first.resign()
+        self.assertTrue(second.elect())
+        self.assertFalse(first.elect())
+
+    def test_dump_fleet(self):
+        table = FleetTable.fetch()
+        path = os.path.join(self.dir, shared.FLEET_FILE)
+        shared.dump_fleet(path, table)
+
+        with shared.FleetFile(path) as mapped:
+            rows = [row.state() for row in mapped.table()]
+            self.assertEqual(rows, [row.state() for row in table])
+            self.assertEqual([row.raw() for row in mapped.table()],
+                             [row.raw() for row in table])
+            code = table.codes[0]
+            self.assertEqual(
+                [r.code for r in mapped.table().by_route(
+                    table.find(code).route_code)],
+                [r.code for r in table.by_route(
+                    table.find(code).route_code)])
+
+    def test_dump_fleet_texts(self):
+        table = FleetTable()
+        table.append('1', 'A', '-5.1', '-42.10000000', '10:00')
+        table.append('2', 'A', '-5.20000000', '-42.20000000', '10:00')
+        path = os.path.join(self.dir, shared.FLEET_FILE)
+        shared.dump_fleet(path, table.freeze())
+
+        with shared.FleetFile(path) as mapped:
+            self.assertEqual(mapped.table().texts,
+                             {0: ('-5.1', '-42.10000000')})
+            self.assertEqual(mapped.table()[1].raw()['Lat'], '-5.20000000')
+
+    def test_refresh_and_load(self):
+        refresher, reader = self.instance(), self.instance()
+        refresher.refresher = True
+        refresher.refresh(force=True)
+
+        self.assertTrue(os.path.exists(refresher.file(shared.FLEET_FILE)))
+        self.assertTrue(os.path.exists(refresher.file(shared.NETWORK_FILE)))
+        self.assertFalse(reader.refresher)
+
+        requests = self.requests()
+        reader.load()
+
+        # The reader makes no request, for the buses nor the stops.
+        buses = reader.target.snapshot().buses()
+        self.assertEqual(
+            sorted(b.code for b in buses),
+            sorted(b['CodigoVeiculo']
+                   for r in self.data.buses.values() for b in r))
+        route = Route.get_route(self.route()['CodigoLinha'])
+        self.assertEqual(
+            [s.code for s in route.get_stops()],
+            [s['CodigoParada']
+             for s in self.data.route_stops[route.code]])
+        self.assertEqual(self.requests(), requests)
+
+        self.assertFalse(reader.changed(shared.FLEET_FILE))
+        refresher.refresh(force=True)
+        self.assertTrue(reader.changed(shared.FLEET_FILE))
+
+    def test_refresh_due(self):
+        refresher = self.instance()
+        refresher.refresher = True
+        refresher.refresh(force=True)
+        requests = self.requests('/veiculos')
+
+        refresher.refresh()
+        self.assertEqual(self.requests('/veiculos'), requests)
+
+    def test_source(self):
+        refresher = self.instance()
+        refresher.refresher = True
+        refresher.target.source = refresher.source
+
+        # Fetched and written by the refresher, then loaded.
+        snapshot = refresher.target.snapshot()
+        self.assertEqual(snapshot.timestamp, refresher.fleet.created)
+        self.assertEqual(len(snapshot), len(refresher.fleet.table()))
+        self.assertEqual(self.requests('/veiculos'), 1)
+
+    def test_source_unwritten(self):
+        reader = self.instance()
+        reader.target.source = reader.source
+
+        # Requested until the refresher writes the file.
+        self.assertGreater(len(reader.target.snapshot()), 0)
+        self.assertIsNone(reader.fleet)
+        self.assertEqual(self.requests('/veiculos'), 1)
+
+    def test_attach(self):
+        instance = shared.attach(self.path)
+        self.instances.append(instance)
+
+        self.assertIs(shared.default, instance)
+        self.assertEqual(settings.TOKEN_FILE,
+                         instance.file(shared.TOKEN_FILE))
+        self.assertEqual(fleet.default.source, instance.source)
+        if shared.fcntl is not None:
+            self.assertTrue(instance.refresher)
+            self.assertTrue(os.path.exists(
+                instance.file(shared.NETWORK_FILE)))
+
+        shared.detach()
+        self.assertIsNone(fleet.default.source)
+        self.assertFalse(instance.refresher)
@@ -0,0 +1,110 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the binary snapshot of the network.
+"""
+
+import os
+import shutil
+import tempfile
+from array import array
+from unittest import mock
+
+from stranspyra import cache, network, snapshot
+from stranspyra.exceptions import SnapshotError
+from stranspyra.models import Route, Stop
+
+from .base import APITestCase
+
+
+class SnapshotTest(APITestCase):
+
+    def setUp(self):
+        super(SnapshotTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'network.snap')
+
+    def tearDown(self):
+        super(SnapshotTest, self).tearDown()
+        shutil.rmtree(self.dir)
+
+    def check(self, net):
+        self.assertEqual(len(net.routes), len(self.data.routes))
+        for obj in self.data.routes:
+            code = obj['CodigoLinha']
+            route = net.route(code)
+            self.assertEqual(route.description, obj['Denomicao'])
+            self.assertEqual(
+                [s.code for s in route.stops()],
+                [s['CodigoParada'] for s in self.data.route_stops[code]])
+
+        obj = self.data.stops[0]
+        stop = net.stop(obj['CodigoParada'])
+        self.assertAlmostEqual(stop.lat, float(obj['Lat']))
+        self.assertAlmostEqual(stop.long, float(obj['Long']))
+        self.assertIsNone(net.stop(-1))
+        for route in stop.routes():
+            self.assertIn(stop.code, [s.code for s in route.stops()])
+
+    def test_round_trip(self):
+        snapshot.dump(self.path)
+
+        self.assertEqual(os.listdir(self.dir), ['network.snap'])
+        with snapshot.open(self.path) as net:
+            self.check(net)
+            self.assertIsInstance(net.column('stop_lat'), memoryview)
+
+    def test_byteswapped(self):
+        # The big-endian path: swapped when written and read.
+        with mock.patch.object(snapshot, 'LITTLE_ENDIAN', False):
+            snapshot.dump(self.path)
+            with snapshot.open(self.path) as net:
+                self.check(net)
+                self.assertIsInstance(net.column('stop_lat'), array)
+
+    def test_install(self):
+        snapshot.dump(self.path)
+        cache.clear()
+        network.default.clear()
+        requests = self.requests()
+
+        with snapshot.open(self.path) as net:
+            links = net.install()
+            count = len(net.stops)
+
+        route = Route.get_route(self.route()['CodigoLinha'])
+        self.assertEqual(route.get_stops(), links[route])
+        self.assertEqual(len(Stop.all()), count)
+        self.assertIn(route, links[route][0].get_routes())
+        self.assertEqual(self.requests(), requests)
+
+    def test_invalid(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'\0' * 1024)
+        self.assertRaises(SnapshotError, snapshot.open, self.path)
+
+        snapshot.dump(self.path)
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        with open(self.path, 'wb') as f:
+            f.write(data[:len(data) // 2])
+        self.assertRaises(SnapshotError, snapshot.open, self.path)
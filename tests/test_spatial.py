@@ -0,0 +1,100 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the spatial index, against the distances to every stop.
+"""
+
+import random
+
+from stranspyra import spatial
+from stranspyra.models import Stop
+from stranspyra.spatial import SpatialIndex, distance
+
+from .base import APITestCase
+
+
+class SpatialIndexTest(APITestCase):
+
+    def setUp(self):
+        super(SpatialIndexTest, self).setUp()
+        self.stops = Stop.all()
+        self.random = random.Random(0)
+
+    def point(self):
+        stop = self.random.choice(self.stops)
+        return (float(stop.lat) + self.random.uniform(-0.01, 0.01),
+                float(stop.long) + self.random.uniform(-0.01, 0.01))
+
+    def ranked(self, lat, long):
+        return sorted(
+            ((distance((s.lat, s.long), (lat, long)).km, s.code)
+             for s in self.stops))
+
+    def test_nearest(self):
+        index = SpatialIndex(self.stops)
+        for _ in range(20):
+            lat, long = self.point()
+            stop, d = index.nearest(lat, long)
+
+            self.assertEqual((d.km, stop.code), self.ranked(lat, long)[0])
+
+    def test_k_nearest(self):
+        index = SpatialIndex(self.stops)
+        lat, long = self.point()
+        found = index.k_nearest(lat, long, 5)
+
+        self.assertEqual([(d.km, s.code) for s, d in found],
+                         self.ranked(lat, long)[:5])
+
+    def test_within(self):
+        index = SpatialIndex(self.stops)
+        lat, long = self.point()
+        found = index.within(lat, long, 1)
+
+        self.assertTrue(found)
+        self.assertEqual(
+            [(d.km, s.code) for s, d in found],
+            [x for x in self.ranked(lat, long) if x[0] <= 1])
+
+    def test_around(self):
+        index = SpatialIndex(self.stops)
+        lat, long = self.point()
+        found = set(i for i, _ in index.around(lat, long, 1))
+        exact = set(self.stops.index(s) for s, _ in
+                    index.within(lat, long, 1 - spatial.TOLERANCE))
+
+        self.assertTrue(exact)
+        self.assertTrue(exact <= found)
+
+    def test_stop_nearest(self):
+        lat, long = self.point()
+        stop, d = Stop.nearest(lat, long)
+
+        self.assertEqual((d.km, stop.code), self.ranked(lat, long)[0])
+        self.assertEqual(Stop.k_nearest(lat, long, 3),
+                         Stop.index().k_nearest(lat, long, 3))
+
+    def test_index_kept(self):
+        index = Stop.index()
+        self.assertIs(Stop.index(), index)
+        # Fetched again, but not rebuilt, as the stops are the same.
+        self.assertIs(Stop.index(refresh=True), index)
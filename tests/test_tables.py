@@ -0,0 +1,156 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the columnar tables.
+"""
+
+import unittest
+
+from stranspyra import batch, fleet
+from stranspyra.models import Bus, Stop
+from stranspyra.tables import FleetTable, StopTable, clock, seconds
+
+from .base import APITestCase
+
+
+class HourTest(unittest.TestCase):
+
+    def test_seconds(self):
+        self.assertEqual(seconds('12:05'), 43500)
+        self.assertEqual(seconds('12:05:30'), 43530)
+        self.assertEqual(seconds(None), -1)
+        self.assertEqual(seconds('noon'), -1)
+
+    def test_clock(self):
+        self.assertEqual(clock(43500), '12:05')
+        self.assertEqual(clock(43530), '12:05:30')
+        self.assertIsNone(clock(-1))
+
+
+class TableTest(unittest.TestCase):
+
+    def setUp(self):
+        self.table = FleetTable()
+        self.table.append('1', 'A', -5.0, -42.0, '10:00')
+        self.table.append('2', 'B', '-5.1', '-42.1', '10:01')
+        self.table.append('3', 'A', -5.2, -42.2, None)
+
+    def test_rows(self):
+        row = self.table.find('2')
+
+        self.assertEqual((row.code, row.lat, row.long, row.route_code),
+                         ('2', -5.1, -42.1, 'B'))
+        self.assertEqual(row.state(), (-5.1, -42.1, 'B', '10:01'))
+        self.assertEqual(self.table[-1].hour, -1)
+        self.assertIsNone(self.table.find('4'))
+        self.assertEqual([r.code for r in self.table.by_route('A')],
+                         ['1', '3'])
+
+    def test_raw(self):
+        bus = Bus(self.table[0].raw())
+
+        self.assertEqual(bus.__lat__, '-5.00000000')
+        self.assertEqual(bus.hour, '10:00')
+
+    def test_raw_texts(self):
+        # Only the ones out of the API format are kept.
+        self.table.append('4', 'A', '-5.30000000', '-42.30000000', None)
+
+        self.assertEqual(self.table.texts, {1: ('-5.1', '-42.1')})
+        self.assertEqual(self.table.find('2').raw()['Lat'], '-5.1')
+        self.assertEqual(self.table.find('4').raw()['Long'], '-42.30000000')
+
+    def test_freeze(self):
+        self.assertIs(self.table.freeze(), self.table)
+        with self.assertRaises(TypeError):
+            self.table.append('4', 'A', -5.0, -42.0, '10:00')
+
+    @unittest.skipUnless(batch.available(), 'requires numpy')
+    def test_coordinates(self):
+        lats, _ = self.table.coordinates()
+        lats[0] = 0.
+        # Copied while it can grow.
+        self.assertEqual(self.table.lats[0], -5.0)
+
+        self.table.freeze()
+        lats, _ = self.table.coordinates()
+        self.assertEqual(list(lats), [-5.0, -5.1, -5.2])
+        self.assertFalse(lats.flags.owndata)
+
+
+class ResponseTableTest(APITestCase):
+
+    def test_stops(self):
+        table = StopTable.fetch()
+
+        self.assertTrue(table.frozen)
+        self.assertEqual(table.codes,
+                         [s['CodigoParada'] for s in self.data.stops])
+        self.assertEqual(list(table.lats),
+                         [float(s['Lat']) for s in self.data.stops])
+        self.assertIs(table[0].to_model(), Stop.get(table[0].code))
+        self.assertEqual(StopTable.from_models(Stop.all()).codes,
+                         table.codes)
+
+    def test_fleet(self):
+        table = FleetTable.fetch()
+        buses = dict(
+            (b['CodigoVeiculo'], code)
+            for code, route in self.data.buses.items() for b in route)
+
+        self.assertEqual(sorted(table.codes), sorted(buses))
+        for row in table:
+            self.assertEqual(row.route_code, buses[row.code])
+
+    def test_fleet_raw(self):
+        cars = dict((b['CodigoVeiculo'], b)
+                    for route in self.data.buses.values() for b in route)
+
+        self.assertEqual(FleetTable.fetch().texts, {})
+        for bus in Bus.all():
+            self.assertEqual(bus.lat, cars[bus.code]['Lat'])
+            self.assertEqual(bus.long, cars[bus.code]['Long'])
+
+    def test_snapshot(self):
+        snapshot = fleet.default.snapshot()
+        table = snapshot.table()
+        row = table[0]
+
+        self.assertTrue(table.frozen)
+        self.assertEqual(len(snapshot), len(table))
+        self.assertIn(row.code, snapshot)
+
+        bus = snapshot.get(row.code)
+        self.assertIsInstance(bus, Bus)
+        self.assertEqual(bus.__route_code__, row.route_code)
+        self.assertEqual(
+            sorted(b.code for b in snapshot.buses(row.route_code)),
+            sorted(r.code for r in table.by_route(row.route_code)))
+
+    def test_snapshot_of_models(self):
+        buses = Bus.all()
+        snapshot = fleet.Snapshot(buses)
+
+        self.assertEqual(sorted(r.code for r in snapshot),
+                         sorted(b.code for b in buses))
+        self.assertEqual(snapshot.row(buses[0].code).route_code,
+                         buses[0].__route_code__)
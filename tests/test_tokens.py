@@ -0,0 +1,176 @@
+# Copyright (c) 2016 Renato Alencar <renatoalencar.73@gmail.com>
+#
+# Permission is hereby granted, free of charge, to any person
+# obtaining a copy of this software and associated documentation
+# files (the "Software"), to deal in the Software without restriction,
+# including without limitation the rights to use, copy, modify,
+# merge, publish, distribute, sublicense, and/or sell copies of
+# the Software, and to permit persons to whom the Software is furnished
+# to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be
+# included in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY
+# CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE
+# SOFTWARE OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Tests of the token manager.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from stranspyra import api
+from stranspyra.conf import configure
+from stranspyra.tokens import TokenManager
+
+from .base import APITestCase
+
+
+class Login(object):
+    """
+    A fake `/signin`, counting the logins.
+    """
+
+    def __init__(self, minutes=30, delay=0):
+        self.minutes = minutes
+        self.delay = delay
+        self.count = 0
+        self.__lock__ = threading.Lock()
+
+    def __call__(self):
+        time.sleep(self.delay)
+        with self.__lock__:
+            self.count += 1
+            count = self.count
+        return {'token': 'token-{0}'.format(count), 'minutos': self.minutes}
+
+
+class TokenManagerTest(unittest.TestCase):
+
+    def test_expiration(self):
+        tokens = TokenManager(Login(minutes=2))
+
+        self.assertFalse(tokens.valid())
+        self.assertEqual(tokens.get(), 'token-1')
+        self.assertAlmostEqual(tokens.expires, time.time() + 120, delta=5)
+        self.assertTrue(tokens.valid())
+        self.assertFalse(tokens.valid(margin=180))
+
+    def test_without_minutes(self):
+        tokens = TokenManager(lambda: {'token': 'token'})
+        tokens.get()
+
+        self.assertIsNone(tokens.expires)
+        self.assertTrue(tokens.valid(margin=10 ** 6))
+
+    def test_failed_login(self):
+        tokens = TokenManager(lambda: {'message': 'api.error.login'})
+
+        self.assertEqual(tokens.refresh(), {'message': 'api.error.login'})
+        self.assertIsNone(tokens.token)
+
+    def test_single_login(self):
+        login = Login(delay=0.05)
+        tokens = TokenManager(login)
+        got = []
+
+        threads = [threading.Thread(target=lambda: got.append(tokens.get()))
+                   for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(login.count, 1)
+        self.assertEqual(got, ['token-1'] * 8)
+
+    def test_refresh_stale(self):
+        login = Login()
+        tokens = TokenManager(login)
+        stale = tokens.get()
+        tokens.refresh(stale)
+        tokens.refresh(stale)
+
+        self.assertEqual(login.count, 2)
+        self.assertEqual(tokens.token, 'token-2')
+
+    def test_refresh_ahead(self):
+        login = Login(delay=0.1)
+        tokens = TokenManager(login, margin=60)
+        tokens.get()
+        tokens.expires = time.time() + 30
+
+        # Still valid: returned at once, refreshed in background once.
+        for _ in range(5):
+            self.assertEqual(tokens.get(), 'token-1')
+
+        deadline = time.time() + 5
+        while tokens.token == 'token-1' and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.05)
+
+        self.assertEqual(tokens.token, 'token-2')
+        self.assertEqual(login.count, 2)
+        self.assertFalse(tokens.__refreshing__)
+
+
+class SharedTokenTest(APITestCase):
+
+    def setUp(self):
+        super(SharedTokenTest, self).setUp()
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'token.json')
+        configure(TOKEN_FILE=self.path)
+
+    def tearDown(self):
+        super(SharedTokenTest, self).tearDown()
+        shutil.rmtree(self.dir)
+
+    def test_shared(self):
+        first, second = TokenManager(Login()), TokenManager(Login())
+
+        self.assertEqual(first.get(), 'token-1')
+        self.assertTrue(os.path.exists(self.path))
+        self.assertEqual(second.get(), 'token-1')
+        self.assertEqual(second.login.count, 0)
+
+    def test_stale_shared(self):
+        first, second = TokenManager(Login()), TokenManager(Login())
+        stale = first.get()
+        second.get()
+
+        # The first one refreshes it, the second one takes the new one.
+        first.refresh(stale)
+        second.refresh(stale)
+        self.assertEqual(second.token, first.token)
+        self.assertEqual(second.login.count, 0)
+
+    def test_other_owner(self):
+        first, second = TokenManager(Login()), TokenManager(Login())
+        first.get()
+        configure(EMAIL='other')
+
+        second.get()
+        self.assertEqual(second.login.count, 1)
+
+
+class ExpiredTokenTest(APITestCase):
+
+    def test_retry(self):
+        api.get('/linhas')
+        self.server.__tokens__.clear()
+
+        self.assertEqual(api.get('/linhas'), self.data.routes)
+        self.assertEqual(self.requests('/signin'), 2)
+        self.assertEqual(self.requests('/linhas'), 3)